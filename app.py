@@ -1,9 +1,32 @@
 import os
 import logging
 import json
-import re
-from flask import Flask, jsonify, request, render_template
-from ical_parser import fetch_and_parse_ical, validate_url
+import hmac
+import hashlib
+import time
+import tempfile
+from flask import Flask, jsonify, request, render_template, g, send_file
+from ical_parser import fetch_and_parse_ical, validate_url, parse_window, inflight_fetches
+from feed_cache import feed_cache
+from glide_sync import sync_tables
+from glide_snapshots import table_snapshots
+from glide_rows import glide_table_url, build_glide_rows, sync_summary
+from batch_convert import convert_many, BATCH_MAX_FEEDS
+from http_session import pool_stats
+from json_stream import iter_json, iter_ndjson
+from serializers import (FastJSONProvider, dumps, encode_msgpack, encode_result,
+                         msgpack_available)
+from compression import (COMPRESS_MIN_SIZE, negotiate_encoding, compress_body,
+                         compress_stream)
+from models import db, Feed, SyncJob
+from feed_scheduler import (FEED_MIN_REFRESH_INTERVAL, FEED_REGISTRY_MAX_FEEDS,
+                            FEED_REGISTRY_SECRET, feed_scheduler, fresh_snapshot,
+                            snapshot_lookups)
+from sync_jobs import TABLE_ID_PATTERN, glide_token
+from event_changes import CursorError, CursorExpired, TooManyFeeds, feed_changes
+from sqlalchemy.exc import OperationalError
+import metrics
+import profiling
 import urllib.parse
 import requests
 
@@ -12,16 +35,99 @@ logging.basicConfig(level=logging.DEBUG)
 
 # Create Flask app
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get("SESSION_SECRET", "fallback-dev-secret")
 
+# Feed registry database, shared by all workers
+app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get(
+    "DATABASE_URL",
+    "sqlite:///" + os.path.join(tempfile.gettempdir(), "ical_feed_registry.sqlite3"))
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_recycle": 300,
+    "pool_pre_ping": True,
+}
+db.init_app(app)
+with app.app_context():
+    try:
+        db.create_all()
+    except OperationalError:
+        # Another worker created the tables between the check and the create
+        db.create_all()
+
+# Refresh registered feeds in the background
+feed_scheduler.start(app)
+
 # Glide API constants
 GLIDE_TRIPS_TABLE_ID = "1fbe5ef8-ceb8-4272-98fa-5c36a79a8eb3"
-GLIDE_TRIPS_API_URL = f"https://api.glideapps.com/tables/{GLIDE_TRIPS_TABLE_ID}"
+GLIDE_TRIPS_API_URL = glide_table_url(GLIDE_TRIPS_TABLE_ID)
 GLIDE_EVENTS_TABLE_ID = "95fd8fa7-c02b-4cf3-97cd-ca3311f0054e"
-GLIDE_EVENTS_API_URL = f"https://api.glideapps.com/tables/{GLIDE_EVENTS_TABLE_ID}"
+GLIDE_EVENTS_API_URL = glide_table_url(GLIDE_EVENTS_TABLE_ID)
+
+
+@app.before_request
+def begin_request_metrics():
+    """
+    Start timing the request, and collecting its stages for Server-Timing
+    if enabled
+    """
+    g.request_started = time.perf_counter()
+    g.request_timings = metrics.start_request_timing() if metrics.SERVER_TIMING else None
+
+
+@app.after_request
+def record_request_metrics(response):
+    """
+    Record the request duration per endpoint and add the Server-Timing header
+    """
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or 'unknown')
+    timings = g.get('request_timings')
+    if timings is not None:
+        response.headers['Server-Timing'] = metrics.server_timing_header(timings, elapsed)
+        metrics.stop_request_timing()
+    return response
+
+
+# Endpoints an operator can profile a request of
+PROFILED_ENDPOINTS = ('convert_ical_to_json', 'sync_ical_to_glide')
+
+
+@app.before_request
+def begin_request_profile():
+    """
+    Profile the request if it carries the profiling secret, in the
+    X-Profile header or the profile query parameter
+    """
+    if not profiling.PROFILE_SECRET or request.endpoint not in PROFILED_ENDPOINTS:
+        return None
+    if not profiling.authorized(request.headers.get('X-Profile')
+                                or request.args.get('profile')):
+        return None
+
+    mode = request.headers.get('X-Profile-Mode') or request.args.get('profile_mode',
+                                                                       'pstats')
+    if mode not in profiling.PROFILE_MODES:
+        return jsonify({
+            "error": f"Profile mode must be one of: {', '.join(profiling.PROFILE_MODES)}"
+        }), 400
+    profiling.start(mode)
+    return None
 
-# Pattern to extract type from description [Type]
-TYPE_PATTERN = re.compile(r'\[(.*?)\]')
+
+@app.after_request
+def end_request_profile(response):
+    """
+    Store the profile of a profiled request and return its ID in the
+    X-Profile-Id header
+    """
+    profile_id = profiling.stop(request.endpoint)
+    if profile_id:
+        logging.info(f"Stored profile {profile_id} of {request.path}")
+        response.headers['X-Profile-Id'] = profile_id
+    return response
 
 
 @app.route('/')
@@ -44,11 +150,282 @@ def convert_ical_to_json():
     Query parameters:
     - url: The URL of the iCal feed to convert
     - timeout (optional): Timeout in seconds for the request (default: 10)
+    - start (optional): Only return events ending after this ISO 8601 date/datetime
+    - end (optional): Only return events starting before this ISO 8601 date/datetime
+    - expand (optional): 'true' to return each occurrence of recurring events
+      between start and end as an event of its own
+    - format (optional): 'json' (default), 'json-stream' to stream the same
+      document event by event, 'ndjson' for one JSON line per event, or
+      'msgpack' for a MessagePack encoded document
+
+    Responses carry a strong ETag, answer a matching If-None-Match with 304
+    and are compressed with brotli or gzip when the client accepts it.
+    """
+    params, error_response = convert_request_params()
+    if error_response:
+        return error_response
+
+    # Serve registered feeds from their background-refreshed snapshot, unless
+    # the request is profiled; JSON is served from the stored body as is
+    result = None
+    if not params['window'] and not params['expand'] and not profiling.active():
+        result = fresh_snapshot(params['url'], decode=params['format'] != 'json')
+
+    # Fetch and parse iCal
+    if result is None:
+        result = fetch_and_parse_ical(params['url'], params['timeout'],
+                                      params['window'], params['expand'])
+
+    # Return appropriate response based on result
+    if result['success']:
+        return conversion_response(result, params['format'])
+    else:
+        status_code = result.get('status_code', 500)
+        return jsonify({"error": result['message']}), status_code
+
+
+def convert_request_params():
+    """
+    Validate the query parameters of a conversion request
+    
+    Returns:
+        tuple: (params, None) with the 'url', 'timeout', 'format', 'window'
+            and 'expand' to convert with, or (None, error response)
     """
     # Get URL parameter
     url = request.args.get('url')
 
     # Get optional timeout parameter, default to 10 seconds
+    try:
+        timeout = int(request.args.get('timeout', 10))
+        if timeout <= 0 or timeout > 60:
+            return None, (jsonify(
+                {"error": "Timeout must be between 1 and 60 seconds"}), 400)
+    except ValueError:
+        return None, (jsonify({"error": "Timeout must be a valid integer"}), 400)
+
+    # Validate URL
+    if not url:
+        return None, (jsonify({"error": "Missing required parameter: url"}), 400)
+
+    url_validation_result = validate_url(url)
+    if not url_validation_result['valid']:
+        return None, (jsonify({"error": url_validation_result['message']}), 400)
+
+    # Get optional response format
+    response_format = request.args.get('format', 'json')
+    if response_format not in ('json', 'json-stream', 'ndjson', 'msgpack'):
+        return None, (jsonify({
+            "error": "Format must be one of: json, json-stream, ndjson, msgpack"
+        }), 400)
+    if response_format == 'msgpack' and not msgpack_available():
+        return None, (jsonify({"error": "The msgpack format is not available"}), 400)
+
+    # Get optional time window
+    window_result = parse_window(request.args.get('start'),
+                                 request.args.get('end'))
+    if not window_result['valid']:
+        return None, (jsonify({"error": window_result['message']}), 400)
+
+    # Get optional recurrence expansion, which needs a bounded window
+    expand = str(request.args.get('expand', '')).lower() in ('1', 'true')
+    if expand and (not window_result['window']
+                   or None in window_result['window']):
+        return None, (jsonify({"error": "expand requires both start and end"}), 400)
+
+    return {
+        "url": url,
+        "timeout": timeout,
+        "format": response_format,
+        "window": window_result['window'],
+        "expand": expand
+    }, None
+
+
+@app.route('/api/convert/batch', methods=['POST'])
+def convert_ical_batch():
+    """
+    API endpoint to convert many iCal feeds concurrently
+    
+    Request parameters (in request body):
+    - feeds: List of feed URLs, or of objects with a 'url' and an optional
+      'timeout' for that feed
+    - timeout (optional): Default timeout in seconds per feed (default: 10)
+    - start, end, expand (optional): As for /api/convert, for every feed
+    
+    The response is NDJSON with one line per feed, written as soon as the
+    feed is converted: 'index' and 'url' of the feed, its 'status_code' and
+    either the converted 'data' or an 'error'.
+    """
+    data = request.json
+    if not data:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+
+    feeds = data.get('feeds')
+    if not isinstance(feeds, list) or not feeds:
+        return jsonify({"error": "feeds must be a non-empty list"}), 400
+    if len(feeds) > BATCH_MAX_FEEDS:
+        return jsonify({
+            "error": f"At most {BATCH_MAX_FEEDS} feeds can be converted per batch"
+        }), 400
+
+    # Get optional default timeout
+    try:
+        default_timeout = int(data.get('timeout', 10))
+        if default_timeout <= 0 or default_timeout > 60:
+            return jsonify(
+                {"error": "Timeout must be between 1 and 60 seconds"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Timeout must be a valid integer"}), 400
+
+    # Get optional time window and recurrence expansion
+    window_result = parse_window(data.get('start'), data.get('end'))
+    if not window_result['valid']:
+        return jsonify({"error": window_result['message']}), 400
+    expand = str(data.get('expand', '')).lower() in ('1', 'true')
+    if expand and (not window_result['window']
+                   or None in window_result['window']):
+        return jsonify({"error": "expand requires both start and end"}), 400
+
+    # Validate every feed; invalid ones are reported without being fetched
+    valid_feeds = []
+    rejected = []
+    for index, feed in enumerate(feeds):
+        url = feed.get('url') if isinstance(feed, dict) else feed
+        timeout = feed.get('timeout', default_timeout) if isinstance(
+            feed, dict) else default_timeout
+
+        if not url or not isinstance(url, str):
+            rejected.append((index, url, "Missing required parameter: url"))
+            continue
+        url_validation_result = validate_url(url)
+        if not url_validation_result['valid']:
+            rejected.append((index, url, url_validation_result['message']))
+            continue
+        try:
+            timeout = int(timeout)
+        except (ValueError, TypeError):
+            rejected.append((index, url, "Timeout must be a valid integer"))
+            continue
+        if timeout <= 0 or timeout > 60:
+            rejected.append(
+                (index, url, "Timeout must be between 1 and 60 seconds"))
+            continue
+        valid_feeds.append((index, url, timeout))
+
+    window = window_result['window']
+
+    def generate():
+        for index, url, message in rejected:
+            yield dumps({
+                "index": index,
+                "url": url,
+                "status_code": 400,
+                "error": message
+            }) + b'\n'
+        for index, url, result in convert_many(valid_feeds, window, expand):
+            if result['success']:
+                line = {
+                    "index": index,
+                    "url": url,
+                    "status_code": 200,
+                    "data": result['data']
+                }
+            else:
+                line = {
+                    "index": index,
+                    "url": url,
+                    "status_code": result.get('status_code', 500),
+                    "error": result['message']
+                }
+            yield dumps(line) + b'\n'
+
+    return app.response_class(generate(), mimetype='application/x-ndjson')
+
+
+def conversion_response(result, response_format):
+    """
+    Build the response for a successful conversion
+    
+    Args:
+        result (dict): Successful fetch_and_parse_ical result
+        response_format (str): 'json', 'json-stream', 'ndjson' or 'msgpack'
+        
+    Returns:
+        Response: Body in the requested format, compressed if the client
+            accepts it, or an empty 304 if the client has it already
+    """
+    body = None
+    chunks = None
+    etag = result.get('etag')
+    if response_format == 'ndjson':
+        # Stream the organized events instead of serializing them all at once
+        chunks = iter_ndjson(result['data'])
+        mimetype = 'application/x-ndjson'
+    elif response_format == 'json-stream':
+        chunks = iter_json(result['data'])
+        mimetype = app.json.mimetype
+    elif response_format == 'msgpack':
+        body = encode_msgpack(result['data'])
+        mimetype = 'application/msgpack'
+        # msgpack keeps key order, which differs between fresh and cached
+        # results, so the ETag has to come from the body itself
+        etag = hashlib.sha256(body).hexdigest()[:32]
+    else:
+        # Serve the pre-serialized body instead of encoding it again
+        body = result.get('json')
+        if body is None:
+            body = encode_result(result['data'])
+        mimetype = app.json.mimetype
+
+    if etag and response_format not in ('json', 'msgpack'):
+        etag = f"{etag}-{response_format}"
+
+    encoding = None
+    if chunks is not None or len(body) >= COMPRESS_MIN_SIZE:
+        encoding = negotiate_encoding(request.accept_encodings)
+    if etag and encoding:
+        # Each encoding is a different representation with its own ETag
+        etag = f"{etag}-{encoding}"
+
+    if etag and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        if encoding and chunks is not None:
+            chunks = compress_stream(chunks, encoding)
+        elif encoding:
+            body = compress_body(body, encoding, cache_key=etag)
+        response = app.response_class(chunks if chunks is not None else body,
+                                      mimetype=mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.vary.add('Accept-Encoding')
+    if etag:
+        response.set_etag(etag)
+    if result.get('age') is not None:
+        # Served from a feed snapshot refreshed this many seconds ago
+        response.headers['Age'] = str(int(result['age']))
+    return response
+
+
+@app.route('/api/convert/changes', methods=['GET'])
+def convert_ical_changes():
+    """
+    API endpoint listing the events of an iCal feed that changed since a cursor
+    
+    Query parameters:
+    - url: The URL of the iCal feed
+    - since (optional): Cursor returned by an earlier call; without it every
+      event is listed as added
+    - timeout (optional): Timeout in seconds for the request (default: 10)
+    
+    The response has the 'added' and 'modified' events, the UIDs of the
+    'removed' events and the 'cursor' to pass as since on the next call.
+    """
+    url = request.args.get('url')
+    since = request.args.get('since')
+
     try:
         timeout = int(request.args.get('timeout', 10))
         if timeout <= 0 or timeout > 60:
@@ -57,7 +434,6 @@ def convert_ical_to_json():
     except ValueError:
         return jsonify({"error": "Timeout must be a valid integer"}), 400
 
-    # Validate URL
     if not url:
         return jsonify({"error": "Missing required parameter: url"}), 400
 
@@ -65,180 +441,297 @@ def convert_ical_to_json():
     if not url_validation_result['valid']:
         return jsonify({"error": url_validation_result['message']}), 400
 
-    # Fetch and parse iCal
-    result = fetch_and_parse_ical(url, timeout)
-
-    # Return appropriate response based on result
-    if result['success']:
-        return jsonify(result['data'])
-    else:
+    result = fresh_snapshot(url)
+    if result is None:
+        result = fetch_and_parse_ical(url, timeout)
+    if not result['success']:
         status_code = result.get('status_code', 500)
         return jsonify({"error": result['message']}), status_code
 
+    body = result.get('json')
+    if body is None:
+        body = encode_result(result['data'])
+
+    try:
+        changes = feed_changes(url, result['data']['events'],
+                               hashlib.sha256(body).hexdigest(), since)
+    except CursorError as e:
+        return jsonify({"error": str(e)}), 400
+    except CursorExpired as e:
+        return jsonify({
+            "error": f"{str(e)}. Request the changes without since to start over"
+        }), 410
+    except TooManyFeeds as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify(changes)
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """
+    API endpoint exposing the feed cache, feed snapshot lookup, fetch
+    coalescing, Glide table snapshot and connection pool counters of this
+    worker
+    """
+    return jsonify({
+        "feed_cache": feed_cache.stats(),
+        "feed_snapshots": snapshot_lookups.stats(),
+        "glide_snapshots": table_snapshots.stats(),
+        "inflight_fetches": inflight_fetches.stats(),
+        "http_pools": pool_stats(),
+        "feed_scheduler": feed_scheduler.stats()
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Metrics of all workers in the Prometheus text format
+    """
+    return app.response_class(metrics.render(),
+                              mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/api/profiles/<profile_id>', methods=['GET'])
+def download_profile(profile_id):
+    """
+    API endpoint downloading a stored request profile, with the profiling
+    secret in the X-Profile header
+    """
+    if not profiling.authorized(request.headers.get('X-Profile')):
+        return jsonify({"error": "Not found"}), 404
+    path = profiling.profile_path(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(path, as_attachment=True,
+                     mimetype='application/octet-stream')
+
 
-def extract_type_from_description(description):
+@app.route('/api/feeds', methods=['GET'])
+def list_feeds():
     """
-    Extract type from description field using [Type] pattern
+    API endpoint listing the registered feeds with their refresh metrics
     
-    Args:
-        description (str): Event description
-        
-    Returns:
-        str: Extracted type or empty string if not found
+    The Authorization header must carry the feed registry secret.
     """
-    if not description:
-        return ""
+    error_response = _check_feed_registry_secret()
+    if error_response:
+        return error_response
+    feeds = db.session.execute(db.select(Feed).order_by(Feed.id)).scalars()
+    return jsonify({"feeds": [feed.to_dict() for feed in feeds]})
 
-    match = TYPE_PATTERN.search(description)
-    if match:
-        return match.group(1).strip()
-    return ""
 
+@app.route('/api/feeds', methods=['POST'])
+def register_feed():
+    """
+    API endpoint registering a feed for background refreshing
+    
+    Request parameters (in request body):
+    - url: The URL of the iCal feed
+    - refresh_interval (optional): Seconds between refreshes (default: 300)
+    - timeout (optional): Timeout in seconds for each fetch (default: 10)
+    
+    Registering a URL again updates its refresh interval and timeout.
+    /api/convert serves registered feeds from their latest snapshot while
+    it is fresh. The Authorization header must carry the feed registry
+    secret.
+    """
+    error_response = _check_feed_registry_secret()
+    if error_response:
+        return error_response
+    data = request.json
+    if not data:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+
+    url = data.get('url')
+    if not url or not isinstance(url, str):
+        return jsonify({"error": "Missing required parameter: url"}), 400
+    url_validation_result = validate_url(url)
+    if not url_validation_result['valid']:
+        return jsonify({"error": url_validation_result['message']}), 400
 
-def sync_table_with_etag_handling(api_url, headers, rows_to_update):
+    try:
+        refresh_interval = int(data.get('refresh_interval', 300))
+        if refresh_interval < FEED_MIN_REFRESH_INTERVAL:
+            return jsonify({
+                "error": f"refresh_interval must be at least {FEED_MIN_REFRESH_INTERVAL} seconds"
+            }), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "refresh_interval must be a valid integer"}), 400
+
+    try:
+        timeout = int(data.get('timeout', 10))
+        if timeout <= 0 or timeout > 60:
+            return jsonify(
+                {"error": "Timeout must be between 1 and 60 seconds"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Timeout must be a valid integer"}), 400
+
+    feed = db.session.execute(
+        db.select(Feed).where(Feed.url == url)).scalar_one_or_none()
+    if feed is not None:
+        feed.refresh_interval = refresh_interval
+        feed.timeout = timeout
+        db.session.commit()
+        snapshot_lookups.discard(url)
+        return jsonify(feed.to_dict())
+
+    feed_count = db.session.execute(
+        db.select(db.func.count()).select_from(Feed)).scalar()
+    if feed_count >= FEED_REGISTRY_MAX_FEEDS:
+        return jsonify({
+            "error": f"At most {FEED_REGISTRY_MAX_FEEDS} feeds can be registered"
+        }), 400
+
+    # Refresh the new feed on the next scheduler tick
+    feed = Feed(url=url, refresh_interval=refresh_interval, timeout=timeout,
+                next_refresh_at=time.time())
+    db.session.add(feed)
+    db.session.commit()
+    snapshot_lookups.discard(url)
+    return jsonify(feed.to_dict()), 201
+
+
+@app.route('/api/feeds/<int:feed_id>', methods=['GET'])
+def get_feed(feed_id):
     """
-    Sync data with Glide API table with ETag-based concurrency control
+    API endpoint describing a registered feed and its refresh metrics
     
-    Args:
-        api_url (str): Glide API table URL
-        headers (dict): Headers for API requests
-        rows_to_update (list): Rows to update or add
-        
-    Returns:
-        tuple: (success, message, row_count)
+    The Authorization header must carry the feed registry secret.
     """
-    max_retries = 3
-    retries = 0
+    error_response = _check_feed_registry_secret()
+    if error_response:
+        return error_response
+    feed = db.session.get(Feed, feed_id)
+    if feed is None:
+        return jsonify({"error": "Feed not found"}), 404
+    return jsonify(feed.to_dict())
 
-    while retries < max_retries:
-        try:
-            # Get current data with ETag
-            response = requests.get(f"{api_url}/rows", headers=headers)
-            response.raise_for_status()
-
-            etag = response.headers.get('ETag')
-            if not etag:
-                logging.warning("No ETag received from Glide API")
-
-            current_rows = response.json().get('data', [])
-            logging.debug(
-                f"Received {len(current_rows)} rows from Glide API table {api_url}"
-            )
-
-            # Create a copy of all existing rows to preserve them
-            final_rows_by_uid = {
-                row.get('uid'): row.copy()
-                for row in current_rows if 'uid' in row
-            }
-
-            # Update existing rows or add new rows
-            for row in rows_to_update:
-                uid = row.get('uid')
-                if uid in final_rows_by_uid:
-                    # Update existing row while preserving fields not in the update
-                    final_rows_by_uid[uid].update(row)
-                else:
-                    # This is a new row
-                    final_rows_by_uid[uid] = row
-
-            # Convert dictionary to list for the API
-            final_rows = list(final_rows_by_uid.values())
-
-            # Add If-Match header if we have an ETag
-            put_headers = headers.copy()
-            if etag:
-                # Strip any leading W/ from the ETag value
-                etag = etag.lstrip('W/')
-                put_headers['If-Match'] = etag
-
-            # Update table
-            update_payload = {"rows": final_rows}
-            put_response = requests.put(api_url,
-                                        headers=put_headers,
-                                        json=update_payload)
-
-            # If we get a 412 (Precondition Failed), retry the operation
-            if put_response.status_code == 412:
-                logging.warning(
-                    "Optimistic concurrency conflict detected, retrying...")
-                retries += 1
-                continue
-            elif put_response.status_code != 200:
-                response_body = put_response.json()
-                message = f"Unexpected response from Glide API: {response_body}"
-                logging.error(message)
-                return False, message, 0
-
-            # For other status codes, raise exception
-            put_response.raise_for_status()
-
-            return True, f"Successfully synced {len(final_rows)} rows", len(
-                final_rows)
-
-        except requests.RequestException as e:
-            # Only retry on optimistic concurrency conflicts
-            response = getattr(e, 'response', None)
-            status_code = None
-            if response is not None:
-                status_code = getattr(response, 'status_code', None)
-
-            if retries >= max_retries - 1 or status_code != 412:
-                logging.error(f"API request error: {str(e)}")
-                return False, f"Error communicating with Glide API: {str(e)}", 0
-
-            retries += 1
-
-    return False, "Maximum retries exceeded for optimistic concurrency control", 0
 
+@app.route('/api/feeds/<int:feed_id>', methods=['DELETE'])
+def unregister_feed(feed_id):
+    """
+    API endpoint removing a registered feed and its snapshot
+    
+    The Authorization header must carry the feed registry secret.
+    """
+    error_response = _check_feed_registry_secret()
+    if error_response:
+        return error_response
+    feed = db.session.get(Feed, feed_id)
+    if feed is None:
+        return jsonify({"error": "Feed not found"}), 404
+    url = feed.url
+    db.session.delete(feed)
+    db.session.commit()
+    snapshot_lookups.discard(url)
+    return "", 204
+
+
+def _check_feed_registry_secret():
+    """
+    Check that the request is authorized with the feed registry secret
+    
+    Returns:
+        tuple: Error response, or None if the request carries the secret
+    """
+    bearer_token = _bearer_token()
+    if bearer_token is None:
+        return jsonify({
+            "error":
+            "Missing or invalid Authorization header. Must be in format: 'Bearer FEED_REGISTRY_SECRET'"
+        }), 401
+    if not _token_matches(bearer_token, FEED_REGISTRY_SECRET):
+        return jsonify({"error": "Authorization does not match the feed registry secret"}), 403
+    return None
 
-@app.route('/api/sync', methods=['POST'])
-def sync_ical_to_glide():
+
+def sync_request_params():
     """
-    API endpoint to sync iCal events with Glide API
+    Validate the Authorization header and body of a sync request
     
-    Request parameters:
-    - url: The URL of the iCal feed to sync (in request body)
-    - Authorization: Bearer token in the header for Glide API authentication
-    - timeout (optional): Timeout in seconds for the request (default: 10)
+    Returns:
+        tuple: (params, None) with the 'token', 'url', 'timeout', 'window' and
+            'expand' to sync with, or (None, error response)
     """
     # Get Authorization header
     auth_header = request.headers.get('Authorization')
     if not auth_header or not auth_header.startswith('Bearer '):
-        return jsonify({
+        return None, (jsonify({
             "error":
             "Missing or invalid Authorization header. Must be in format: 'Bearer YOUR_TOKEN'"
-        }), 401
+        }), 401)
 
     bearer_token = auth_header.split(' ')[1]
 
     # Get request data
     data = request.json
     if not data:
-        return jsonify({"error": "Request body must be valid JSON"}), 400
+        return None, (jsonify({"error": "Request body must be valid JSON"}), 400)
 
     # Get required parameters
     url = data.get('url')
 
     # Validate required parameters
     if not url:
-        return jsonify({"error": "Missing required parameter: url"}), 400
+        return None, (jsonify({"error": "Missing required parameter: url"}), 400)
 
     # Get optional timeout parameter, default to 10 seconds
     try:
         timeout = int(data.get('timeout', 10))
         if timeout <= 0 or timeout > 60:
-            return jsonify(
-                {"error": "Timeout must be between 1 and 60 seconds"}), 400
+            return None, (jsonify(
+                {"error": "Timeout must be between 1 and 60 seconds"}), 400)
     except (ValueError, TypeError):
-        return jsonify({"error": "Timeout must be a valid integer"}), 400
+        return None, (jsonify({"error": "Timeout must be a valid integer"}), 400)
 
     # Validate URL
     url_validation_result = validate_url(url)
     if not url_validation_result['valid']:
-        return jsonify({"error": url_validation_result['message']}), 400
+        return None, (jsonify({"error": url_validation_result['message']}), 400)
+
+    # Get optional time window
+    window_result = parse_window(data.get('start'), data.get('end'))
+    if not window_result['valid']:
+        return None, (jsonify({"error": window_result['message']}), 400)
+
+    # Get optional recurrence expansion, which needs a bounded window
+    expand = str(data.get('expand', '')).lower() in ('1', 'true')
+    if expand and (not window_result['window']
+                   or None in window_result['window']):
+        return None, (jsonify({"error": "expand requires both start and end"}), 400)
+
+    return {
+        "token": bearer_token,
+        "url": url,
+        "timeout": timeout,
+        "window": window_result['window'],
+        "expand": expand
+    }, None
+
+
+@app.route('/api/sync', methods=['POST'])
+def sync_ical_to_glide():
+    """
+    API endpoint to sync iCal events with Glide API
+    
+    Request parameters:
+    - url: The URL of the iCal feed to sync (in request body)
+    - Authorization: Bearer token in the header for Glide API authentication
+    - timeout (optional): Timeout in seconds for the request (default: 10)
+    - start (optional): Only sync events ending after this ISO 8601 date/datetime
+    - end (optional): Only sync events starting before this ISO 8601 date/datetime
+    - expand (optional): true to sync each occurrence of recurring events
+      between start and end as an event of its own
+    """
+    params, error_response = sync_request_params()
+    if error_response:
+        return error_response
 
     # Fetch and parse iCal
-    ical_result = fetch_and_parse_ical(url, timeout)
+    ical_result = fetch_and_parse_ical(params['url'], params['timeout'],
+                                       params['window'], params['expand'])
 
     if not ical_result['success']:
         status_code = ical_result.get('status_code', 500)
@@ -248,122 +741,19 @@ def sync_ical_to_glide():
     try:
         # Setup headers for Glide API requests
         headers = {
-            "Authorization": f"Bearer {bearer_token}",
+            "Authorization": f"Bearer {params['token']}",
             "Content-Type": "application/json"
         }
 
-        # Process top-level events (trips)
-        trips_to_update = []
-        events_to_update = []
-
-        # Organize events by trip and subevents
-        events_data = ical_result['data']['events']
-        logging.debug(f"Processing {len(events_data)} events from iCal")
-
-        for event in events_data:
-            # Skip events without UIDs
-            if not event.get('uid'):
-                continue
-
-            # Process main trip event
-            event_uid = event.get('uid')
-            event_name = event.get('summary', '')
-            event_location = event.get('location', '')
-
-            # Get start and end times
-            start_date = None
-            end_date = None
-
-            if 'start' in event and 'datetime' in event['start']:
-                start_date = event['start']['datetime']
-
-            if 'end' in event and 'datetime' in event['end']:
-                end_date = event['end']['datetime']
-
-            # Create trip row
-            trip_row = {
-                "uid": event_uid,
-                "name": event_name,
-                "ZS0Be": event_location
-            }
-
-            if start_date:
-                trip_row["startDate"] = start_date
-            if end_date:
-                trip_row["endDate"] = end_date
-
-            trips_to_update.append(trip_row)
-
-            # Process subevents
-            if 'subevents' in event and event['subevents']:
-                for subevent in event['subevents']:
-                    if not subevent.get('uid'):
-                        continue
-
-                    subevent_uid = subevent.get('uid')
-                    subevent_summary = subevent.get('summary', '')
-                    subevent_description = subevent.get('description', '')
-                    subevent_location = subevent.get('location', '')
-
-                    # Extract event type from description [Type]
-                    event_type = extract_type_from_description(
-                        subevent_description)
-
-                    # Get start and end times
-                    subevent_start = None
-                    subevent_end = None
-
-                    if 'start' in subevent and 'datetime' in subevent['start']:
-                        subevent_start = subevent['start']['datetime']
-
-                    if 'end' in subevent and 'datetime' in subevent['end']:
-                        subevent_end = subevent['end']['datetime']
-
-                    # Create event row
-                    event_row = {
-                        "uid": subevent_uid,
-                        "tripUID": event_uid,
-                        "summary": subevent_summary
-                    }
-
-                    if event_type:
-                        event_row["type"] = event_type
-                    if subevent_location:
-                        event_row["location"] = subevent_location
-                    if subevent_start:
-                        event_row["startDate"] = subevent_start
-                    if subevent_end:
-                        event_row["endDate"] = subevent_end
-
-                    events_to_update.append(event_row)
-
-        # Sync trips table
-        trips_success, trips_message, trips_count = sync_table_with_etag_handling(
-            GLIDE_TRIPS_API_URL, headers, trips_to_update)
-
-        # Sync events table
-        events_success, events_message, events_count = sync_table_with_etag_handling(
-            GLIDE_EVENTS_API_URL, headers, events_to_update)
-
-        # Prepare response
-        response_data = {
-            "success": trips_success and events_success,
-            "trips": {
-                "success": trips_success,
-                "message": trips_message,
-                "synced_count": trips_count
-            },
-            "events": {
-                "success": events_success,
-                "message": events_message,
-                "synced_count": events_count
-            }
-        }
-
-        if not response_data["success"]:
-            return jsonify(response_data), 500
+        trips_to_update, events_to_update = build_glide_rows(
+            ical_result['data']['events'])
 
-        return jsonify(response_data)
+        # Sync trips and events tables concurrently
+        results = sync_tables(headers, {
+            GLIDE_TRIPS_API_URL: trips_to_update,
+            GLIDE_EVENTS_API_URL: events_to_update
+        })
+        return sync_response(results)
 
     except requests.RequestException as e:
         logging.error(f"Glide API request error: {str(e)}")
@@ -374,7 +764,226 @@ def sync_ical_to_glide():
         return jsonify({"error": f"Error during sync process: {str(e)}"}), 500
 
 
-# Error handlers
+def sync_response(results):
+    """
+    Build the response for the outcome of a sync
+    
+    Args:
+        results (dict): sync_tables result for the trips and events tables
+        
+    Returns:
+        Response: JSON summary per table, with status 500 if a table failed
+    """
+    response_data = sync_summary(results, GLIDE_TRIPS_API_URL,
+                                 GLIDE_EVENTS_API_URL)
+
+    if not response_data["success"]:
+        return jsonify(response_data), 500
+
+    return jsonify(response_data)
+
+
+@app.route('/api/sync/jobs', methods=['GET'])
+def list_sync_jobs():
+    """
+    API endpoint listing the scheduled sync jobs with their metrics
+    
+    Only the jobs whose Glide token is carried by the Authorization header
+    are listed, without their feed URL or error details.
+    """
+    bearer_token = _bearer_token()
+    if bearer_token is None:
+        return jsonify({
+            "error":
+            "Missing or invalid Authorization header. Must be in format: 'Bearer YOUR_TOKEN'"
+        }), 401
+    jobs = db.session.execute(db.select(SyncJob).order_by(SyncJob.id)).scalars()
+    return jsonify({
+        "jobs": [job.to_dict(summary=True) for job in jobs
+                 if _token_matches(bearer_token, glide_token(job.token_env))]
+    })
+
+
+@app.route('/api/sync/jobs', methods=['POST'])
+def register_sync_job():
+    """
+    API endpoint scheduling a feed to be synced to Glide tables
+    
+    Request parameters (in request body):
+    - url: The URL of the iCal feed to sync
+    - token_env: Name of the environment variable holding the Glide token
+    - trips_table_id (optional): Glide trips table (default: the built-in one)
+    - events_table_id (optional): Glide events table (default: the built-in one)
+    - sync_interval (optional): Seconds between runs (default: 300)
+    - timeout (optional): Timeout in seconds for fetching the feed (default: 10)
+    
+    The Authorization header must carry the token held by token_env. A job
+    only writes to Glide when the rows built from the feed changed since
+    its last successful sync. Registering the same URL and tables again
+    updates the job.
+    """
+    data = request.json
+    if not data:
+        return jsonify({"error": "Request body must be valid JSON"}), 400
+
+    url = data.get('url')
+    if not url or not isinstance(url, str):
+        return jsonify({"error": "Missing required parameter: url"}), 400
+    url_validation_result = validate_url(url)
+    if not url_validation_result['valid']:
+        return jsonify({"error": url_validation_result['message']}), 400
+
+    token_env = data.get('token_env')
+    if not token_env or not isinstance(token_env, str):
+        return jsonify({"error": "Missing required parameter: token_env"}), 400
+    token = glide_token(token_env)
+    if token is None:
+        return jsonify({
+            "error": f"token_env must name a Glide token variable that is set: {token_env}"
+        }), 400
+    error_response = _check_sync_job_token(token)
+    if error_response:
+        return error_response
+
+    trips_table_id = data.get('trips_table_id', GLIDE_TRIPS_TABLE_ID)
+    events_table_id = data.get('events_table_id', GLIDE_EVENTS_TABLE_ID)
+    for table_id in (trips_table_id, events_table_id):
+        if not isinstance(table_id, str) or not TABLE_ID_PATTERN.match(table_id):
+            return jsonify({"error": f"Invalid Glide table ID: {table_id}"}), 400
+
+    try:
+        sync_interval = int(data.get('sync_interval', 300))
+        if sync_interval < FEED_MIN_REFRESH_INTERVAL:
+            return jsonify({
+                "error": f"sync_interval must be at least {FEED_MIN_REFRESH_INTERVAL} seconds"
+            }), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "sync_interval must be a valid integer"}), 400
+
+    try:
+        timeout = int(data.get('timeout', 10))
+        if timeout <= 0 or timeout > 60:
+            return jsonify(
+                {"error": "Timeout must be between 1 and 60 seconds"}), 400
+    except (ValueError, TypeError):
+        return jsonify({"error": "Timeout must be a valid integer"}), 400
+
+    job = db.session.execute(
+        db.select(SyncJob).where(SyncJob.url == url,
+                                 SyncJob.trips_table_id == trips_table_id,
+                                 SyncJob.events_table_id == events_table_id)
+    ).scalar_one_or_none()
+    if job is not None:
+        if job.token_env != token_env:
+            # Another token may see different tables; sync in full next time
+            job.last_content_hash = None
+            job.last_rows_hash = None
+        job.token_env = token_env
+        job.sync_interval = sync_interval
+        job.timeout = timeout
+        db.session.commit()
+        return jsonify(job.to_dict())
+
+    job_count = db.session.execute(
+        db.select(db.func.count()).select_from(SyncJob)).scalar()
+    if job_count >= FEED_REGISTRY_MAX_FEEDS:
+        return jsonify({
+            "error": f"At most {FEED_REGISTRY_MAX_FEEDS} sync jobs can be registered"
+        }), 400
+
+    # Run the new job on the next scheduler tick
+    job = SyncJob(url=url, token_env=token_env, trips_table_id=trips_table_id,
+                  events_table_id=events_table_id, sync_interval=sync_interval,
+                  timeout=timeout, next_run_at=time.time())
+    db.session.add(job)
+    db.session.commit()
+    return jsonify(job.to_dict()), 201
+
+
+@app.route('/api/sync/jobs/<int:job_id>', methods=['GET'])
+def get_sync_job(job_id):
+    """
+    API endpoint describing a scheduled sync job and its metrics
+    
+    The Authorization header must carry the job's Glide token.
+    """
+    job = db.session.get(SyncJob, job_id)
+    if job is None:
+        return jsonify({"error": "Sync job not found"}), 404
+    error_response = _check_sync_job_token(glide_token(job.token_env))
+    if error_response:
+        return error_response
+    return jsonify(job.to_dict())
+
+
+@app.route('/api/sync/jobs/<int:job_id>', methods=['DELETE'])
+def unregister_sync_job(job_id):
+    """
+    API endpoint removing a scheduled sync job
+    
+    The Authorization header must carry the job's Glide token.
+    """
+    job = db.session.get(SyncJob, job_id)
+    if job is None:
+        return jsonify({"error": "Sync job not found"}), 404
+    error_response = _check_sync_job_token(glide_token(job.token_env))
+    if error_response:
+        return error_response
+    db.session.delete(job)
+    db.session.commit()
+    return "", 204
+
+
+def _check_sync_job_token(token):
+    """
+    Check that the request is authorized with a sync job's Glide token
+    
+    Args:
+        token (str): Glide token of the job, or None if it is not set
+        
+    Returns:
+        tuple: Error response, or None if the request carries the token
+    """
+    bearer_token = _bearer_token()
+    if bearer_token is None:
+        return jsonify({
+            "error":
+            "Missing or invalid Authorization header. Must be in format: 'Bearer YOUR_TOKEN'"
+        }), 401
+    if not _token_matches(bearer_token, token):
+        return jsonify({"error": "Authorization does not match the Glide token"}), 403
+    return None
+
+
+def _bearer_token():
+    """
+    Read the bearer token of the request
+    
+    Returns:
+        str: Token from the Authorization header, or None if it is missing
+    """
+    auth_header = request.headers.get('Authorization')
+    if not auth_header or not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ')[1]
+
+
+def _token_matches(bearer_token, token):
+    """
+    Compare a bearer token with a secret in constant time
+    
+    Args:
+        bearer_token (str): Token sent with the request
+        token (str): Expected token, or None or empty if none is accepted
+        
+    Returns:
+        bool: True if the tokens match
+    """
+    if not token:
+        return False
+    return hmac.compare_digest(bearer_token.encode(), token.encode())
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Not found"}), 404
@@ -0,0 +1,246 @@
+import io
+import asyncio
+import sys
+import logging
+import requests
+from asgiref.wsgi import WsgiToAsgi
+from flask import request_started
+import app as wsgi
+from ical_parser import async_fetch_and_parse_ical
+from glide_sync import async_sync_tables
+from feed_scheduler import fresh_snapshot
+import profiling
+from http_session import close_async_client, httpx
+
+# This file serves as the asyncio entry point, alongside application:app
+# Use: gunicorn -k uvicorn_worker.UvicornWorker asgi:app
+#
+# /api/convert and /api/sync run as coroutines, so a worker can wait on many
+# upstream feeds at once; Glide tables are synced on the table sync threads.
+# Every other route is served by the Flask app through asgiref's WSGI adapter.
+
+flask_app = wsgi.app
+wsgi_app = WsgiToAsgi(flask_app)
+
+
+async def convert_ical_to_json():
+    """Async counterpart of app.convert_ical_to_json"""
+    params, error_response = wsgi.convert_request_params()
+    if error_response:
+        return error_response
+
+    result = None
+    if not params['window'] and not params['expand'] and not profiling.active():
+        result = await asyncio.to_thread(fresh_snapshot, params['url'],
+                                         params['format'] != 'json')
+    if result is None:
+        result = await async_fetch_and_parse_ical(params['url'], params['timeout'],
+                                                  params['window'], params['expand'])
+
+    if result['success']:
+        # Serializing and compressing a large feed takes long enough to stall
+        # every other request of the event loop
+        return await asyncio.to_thread(wsgi.conversion_response, result,
+                                       params['format'])
+    status_code = result.get('status_code', 500)
+    return wsgi.jsonify({"error": result['message']}), status_code
+
+
+async def sync_ical_to_glide():
+    """Async counterpart of app.sync_ical_to_glide"""
+    params, error_response = wsgi.sync_request_params()
+    if error_response:
+        return error_response
+
+    ical_result = await async_fetch_and_parse_ical(params['url'],
+                                                   params['timeout'],
+                                                   params['window'],
+                                                   params['expand'])
+    if not ical_result['success']:
+        status_code = ical_result.get('status_code', 500)
+        return wsgi.jsonify({"error": ical_result['message']}), status_code
+
+    try:
+        headers = {
+            "Authorization": f"Bearer {params['token']}",
+            "Content-Type": "application/json"
+        }
+        trips_to_update, events_to_update = wsgi.build_glide_rows(
+            ical_result['data']['events'])
+
+        results = await async_sync_tables(headers, {
+            wsgi.GLIDE_TRIPS_API_URL: trips_to_update,
+            wsgi.GLIDE_EVENTS_API_URL: events_to_update
+        })
+        return wsgi.sync_response(results)
+
+    except (requests.RequestException, httpx.HTTPError) as e:
+        logging.error(f"Glide API request error: {str(e)}")
+        return wsgi.jsonify(
+            {"error": f"Error communicating with Glide API: {str(e)}"}), 500
+    except Exception as e:
+        logging.error(f"Sync error: {str(e)}")
+        return wsgi.jsonify({"error": f"Error during sync process: {str(e)}"}), 500
+
+
+ASYNC_ROUTES = {
+    ('GET', '/api/convert'): convert_ical_to_json,
+    ('POST', '/api/sync'): sync_ical_to_glide,
+}
+
+
+async def app(scope, receive, send):
+    """
+    ASGI application serving the async routes and delegating the rest to Flask
+    """
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    route = None
+    if scope['type'] == 'http':
+        route = ASYNC_ROUTES.get((scope['method'], scope['path']))
+    if route is None:
+        await wsgi_app(scope, receive, send)
+        return
+
+    body = await _read_body(receive)
+    with flask_app.request_context(_build_environ(scope, body)):
+        try:
+            response = await _full_dispatch_request(route)
+        except Exception as e:
+            response = flask_app.handle_exception(e)
+        await _send_response(response, send)
+
+
+async def _full_dispatch_request(route):
+    """
+    Flask's full_dispatch_request, awaiting an async route instead of
+    dispatching to the view
+
+    The app's request hooks run exactly as for WSGI dispatch, so both entry
+    points time, profile and finalize requests the same way.
+
+    Args:
+        route (callable): Coroutine function of the async route
+
+    Returns:
+        Response: Finalized response
+    """
+    try:
+        request_started.send(flask_app, _async_wrapper=flask_app.ensure_sync)
+        rv = flask_app.preprocess_request()
+        if rv is None:
+            rv = await route()
+    except Exception as e:
+        rv = flask_app.handle_user_exception(e)
+    return flask_app.finalize_request(rv)
+
+
+async def _lifespan(receive, send):
+    """Answer the ASGI lifespan protocol, closing HTTP clients on shutdown"""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _read_body(receive):
+    """
+    Read the complete request body
+
+    Args:
+        receive (callable): ASGI receive channel
+
+    Returns:
+        bytes: Request body
+    """
+    chunks = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(chunks)
+
+
+def _build_environ(scope, body):
+    """
+    Build a WSGI environ for an ASGI HTTP request, for the Flask request context
+
+    Args:
+        scope (dict): ASGI connection scope
+        body (bytes): Request body
+
+    Returns:
+        dict: WSGI environ
+    """
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        value = value.decode('latin1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _send_response(response, send):
+    """
+    Send a Flask response over ASGI, streaming its body chunk by chunk
+
+    Streamed bodies are serialized and compressed as they are iterated, so
+    their chunks are produced in a thread rather than on the event loop.
+
+    Args:
+        response: Flask response
+        send (callable): ASGI send channel
+    """
+    await send({
+        'type': 'http.response.start',
+        'status': response.status_code,
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                    for name, value in response.headers.items()],
+    })
+    try:
+        chunks = response.iter_encoded()
+        while True:
+            if response.is_streamed:
+                chunk = await asyncio.to_thread(next, chunks, None)
+            else:
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk,
+                            'more_body': True})
+    finally:
+        response.close()
+    await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ical_parser import fetch_and_parse_ical
+
+# Feeds fetched at the same time, shared by all batch requests of this worker
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', 16))
+
+# Most feeds accepted in one batch request
+BATCH_MAX_FEEDS = int(os.environ.get('BATCH_MAX_FEEDS', 1000))
+
+_fetch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY,
+                                     thread_name_prefix='convert-batch')
+
+
+def convert_many(feeds, window=None, expand=False):
+    """
+    Fetch and parse several feeds concurrently
+
+    Args:
+        feeds (list): (index, url, timeout) tuples of already validated feeds
+        window (tuple): Optional (start, end) datetimes from parse_window
+        expand (bool): Whether to expand recurring events within the window
+
+    Yields:
+        tuple: (index, url, fetch_and_parse_ical result) in completion order
+    """
+    futures = {
+        _fetch_executor.submit(fetch_and_parse_ical, url, timeout, window,
+                               expand): (index, url)
+        for index, url, timeout in feeds
+    }
+    try:
+        for future in as_completed(futures):
+            index, url = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {
+                    'success': False,
+                    'message': f'Error converting feed: {str(e)}',
+                    'status_code': 500
+                }
+            yield index, url, result
+    finally:
+        # Stop feeds that have not started when the client goes away
+        for future in futures:
+            future.cancel()
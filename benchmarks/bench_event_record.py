@@ -0,0 +1,96 @@
+"""
+Measure the cost of turning parsed VEVENTs into organized events
+
+Generates a synthetic feed, parses it into an icalendar tree once and then
+times the event extraction and organization passes on their own, reporting
+throughput and the peak memory they allocate (as traced by tracemalloc).
+
+Usage:
+    python benchmarks/bench_event_record.py --events 1000 20000 --repeat 5
+"""
+import os
+import sys
+import gc
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_parse_memory import generate_feed
+from icalendar import Calendar
+import ical_parser
+
+
+def organize(calendar, vevents):
+    """Run the extraction and organization passes of a tree-mode parse"""
+    events_by_uid = ical_parser._collect_events(vevents)
+    return ical_parser._organize_events(calendar, events_by_uid)
+
+
+def time_passes(calendar, vevents, repeat):
+    """
+    Time the extraction and organization passes
+
+    Args:
+        calendar: Parsed icalendar Calendar
+        vevents (list): VEVENT components of the calendar
+        repeat (int): Number of timed runs
+
+    Returns:
+        float: Median seconds per run
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        organize(calendar, vevents)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def traced_peak(calendar, vevents):
+    """
+    Measure the memory allocated by the passes
+
+    Returns:
+        tuple: (peak KiB allocated while running, KiB kept by the result)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        data = organize(calendar, vevents)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del data
+    return peak / 1024, current / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, nargs='+', default=[1000, 20000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    print(f"{'events':>8}{'median ms':>12}{'events/s':>12}"
+          f"{'peak KiB':>12}{'result KiB':>12}")
+    for event_count in args.events:
+        feed_path = os.path.join(workdir, f'feed-{event_count}.ics')
+        generate_feed(feed_path, event_count)
+        with open(feed_path, 'rb') as f:
+            calendar = Calendar.from_ical(f.read())
+        vevents = list(calendar.walk('VEVENT'))
+
+        seconds = time_passes(calendar, vevents, args.repeat)
+        peak, kept = traced_peak(calendar, vevents)
+        print(f"{event_count:>8}{seconds * 1000:>12.1f}{event_count / seconds:>12.0f}"
+              f"{peak:>12.0f}{kept:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
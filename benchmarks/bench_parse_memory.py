@@ -0,0 +1,126 @@
+"""
+Compare peak memory of the 'tree' and 'stream' iCal parse modes
+
+Generates a synthetic feed, serves it from a local HTTP server and runs
+fetch_and_parse_ical once per mode, each in a fresh process so that peak RSS
+is measured independently.
+
+Usage:
+    python benchmarks/bench_parse_memory.py --events 20000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def generate_feed(path, event_count):
+    """
+    Write a synthetic feed of trips with time-contained subevents
+
+    Args:
+        path (str): File to write
+        event_count (int): Number of VEVENTs
+    """
+    with open(path, 'w', newline='') as f:
+        f.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//EN\r\n'
+                'X-WR-CALNAME:Benchmark\r\n')
+        for i in range(event_count):
+            trip, offset = divmod(i, 10)
+            day = 1 + trip % 27
+            month = 1 + (trip // 27) % 12
+            if offset == 0:
+                start, end = 'T000000', 'T235900'
+            else:
+                start, end = f'T{offset:02d}0000', f'T{offset:02d}3000'
+            f.write('BEGIN:VEVENT\r\n'
+                    f'UID:event-{i}@bench\r\n'
+                    f'SUMMARY:Event {i}\r\n'
+                    f'DESCRIPTION:[Flight] A description long enough to be folded '
+                    f'by the generator\r\n for event {i}\r\n'
+                    f'LOCATION:Somewhere {i}\r\n'
+                    f'DTSTART;TZID=Europe/Berlin:2024{month:02d}{day:02d}{start}\r\n'
+                    f'DTEND;TZID=Europe/Berlin:2024{month:02d}{day:02d}{end}\r\n'
+                    'BEGIN:VALARM\r\nACTION:DISPLAY\r\nDESCRIPTION:Reminder\r\n'
+                    'TRIGGER:-PT15M\r\nEND:VALARM\r\n'
+                    'END:VEVENT\r\n')
+        f.write('END:VCALENDAR\r\n')
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def peak_rss_kib():
+    """Peak resident set size of this process in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def run_child(url):
+    """Fetch and parse the feed once in this process and print the measurements"""
+    sys.path.insert(0, ROOT)
+    import ical_parser
+
+    baseline = peak_rss_kib()
+    started = time.perf_counter()
+    result = ical_parser.fetch_and_parse_ical(url, timeout=60)
+    elapsed = time.perf_counter() - started
+    if not result['success']:
+        raise SystemExit(result['message'])
+
+    print(json.dumps({
+        'seconds': elapsed,
+        'baseline_kib': baseline,
+        'peak_kib': peak_rss_kib(),
+        'total_events': result['data']['total_events'],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, default=20000)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return
+
+    workdir = tempfile.mkdtemp()
+    feed_path = os.path.join(workdir, 'feed.ics')
+    generate_feed(feed_path, args.events)
+
+    handler = functools.partial(_QuietHandler, directory=workdir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/feed.ics'
+
+    print(f"Feed: {args.events} events, {os.path.getsize(feed_path) / 1024 / 1024:.1f} MiB")
+    print(f"{'mode':<8}{'seconds':>10}{'peak RSS MiB':>15}{'parse delta MiB':>18}")
+    for mode in ('tree', 'stream'):
+        env = dict(os.environ, ICAL_PARSE_MODE=mode, PARSE_CACHE_PATH='')
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', url],
+            env=env, check=True, capture_output=True, text=True).stdout
+        stats = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<8}{stats['seconds']:>10.2f}"
+              f"{stats['peak_kib'] / 1024:>15.1f}"
+              f"{(stats['peak_kib'] - stats['baseline_kib']) / 1024:>18.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
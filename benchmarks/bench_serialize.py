@@ -0,0 +1,82 @@
+"""
+Compare encode time and body size of the available serialization backends
+
+Generates synthetic feeds, parses each once and encodes the parsed result
+with every backend that is installed: stdlib json, orjson and msgpack.
+
+Usage:
+    python benchmarks/bench_serialize.py --events 1000 10000 --repeat 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_parse_memory import generate_feed
+import serializers
+from ical_parser import parse_ical_content
+
+
+def backends():
+    """
+    Get the encoders to compare
+
+    Returns:
+        dict: Encoder functions returning bytes, keyed by backend name
+    """
+    encoders = {name: dumps for name, (dumps, _) in serializers.JSON_BACKENDS.items()}
+    if serializers.msgpack_available():
+        encoders['msgpack'] = serializers.encode_msgpack
+    return encoders
+
+
+def time_encoder(encode, data, repeat):
+    """
+    Time an encoder on one parsed result
+
+    Args:
+        encode (callable): Encoder returning bytes
+        data (dict): Parsed calendar data
+        repeat (int): Number of timed runs
+
+    Returns:
+        tuple: (median milliseconds per encode, encoded size in bytes)
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = encode(data)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--events', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    encoders = backends()
+    print(f"{'events':>8}  {'backend':<10}{'median ms':>12}{'KiB':>12}")
+    for event_count in args.events:
+        feed_path = os.path.join(workdir, f'feed-{event_count}.ics')
+        generate_feed(feed_path, event_count)
+        with open(feed_path, 'rb') as f:
+            result = parse_ical_content(f.read())
+        if not result['success']:
+            raise SystemExit(result['message'])
+
+        for name, encode in encoders.items():
+            milliseconds, size = time_encoder(encode, result['data'], args.repeat)
+            print(f"{event_count:>8}  {name:<10}{milliseconds:>12.2f}{size / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
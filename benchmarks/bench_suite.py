@@ -0,0 +1,281 @@
+"""
+Benchmark parsing, /api/convert and /api/sync end to end on synthetic feeds
+
+Generates feeds of trips with RELATED-TO, X-PARENT-UID and time-contained
+subevents, all-day and TZID times, RRULEs and VALARMs (see feed_generator),
+serves them from a local HTTP server and runs each scenario in a fresh
+process, so that peak memory is measured independently:
+
+    parse    fetch_and_parse_ical
+    convert  GET /api/convert through the Flask app
+    sync     POST /api/sync against a local stand-in of the Glide tables
+             API (see mock_glide), with the feed edited between syncs
+
+The feed and parse caches are disabled unless --warm-caches is given, so
+every request fetches and parses the feed. Reports latency percentiles,
+throughput and peak RSS, and optionally writes the results as JSON to
+compare runs, e.g. before and after upgrading icalendar.
+
+Usage:
+    python benchmarks/bench_suite.py --trips 100 1000 --requests 20
+    python benchmarks/bench_suite.py --scenarios sync --glide-conflict-rate 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+import threading
+import functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from feed_generator import generate_feed
+from mock_glide import MockGlide
+
+SCENARIOS = ('parse', 'convert', 'sync')
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def peak_rss_kib(who=resource.RUSAGE_SELF):
+    """Peak resident set size in KiB, of this process or its waited-for children"""
+    peak = resource.getrusage(who).ru_maxrss
+    # macOS reports bytes, Linux reports KiB
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of sorted values"""
+    index = max(0, min(len(sorted_values) - 1,
+                       round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def scenario_request(scenario, config):
+    """
+    Build the function running one request of a scenario
+
+    Args:
+        scenario (str): Scenario name
+        config (dict): Feed URL, feed path and generator options
+
+    Returns:
+        callable: Runs one request, returning an error message if it failed
+    """
+    url = config['url']
+    if scenario == 'parse':
+        import ical_parser
+
+        def request():
+            result = ical_parser.fetch_and_parse_ical(url, timeout=60)
+            return None if result['success'] else result['message']
+        return request
+
+    import app
+    client = app.app.test_client()
+    if scenario == 'convert':
+        def request():
+            response = client.get('/api/convert', query_string={'url': url})
+            body = response.get_data()
+            return None if response.status_code == 200 else body[:200].decode()
+        return request
+
+    def request():
+        response = client.post('/api/sync', json={'url': url, 'timeout': 60},
+                               headers={'Authorization': 'Bearer benchmark'})
+        body = response.get_data()
+        return None if response.status_code == 200 else body[:200].decode()
+    return request
+
+
+def run_child(scenario, config):
+    """Run a scenario in this process and print its measurements as JSON"""
+    sys.path.insert(0, ROOT)
+    request = scenario_request(scenario, config)
+    baseline = peak_rss_kib()
+
+    revision = 0
+    latencies = []
+    errors = []
+    started = time.perf_counter()
+    for iteration in range(config['warmup'] + config['requests']):
+        if scenario == 'sync' and iteration:
+            # Edit the feed so every sync has rows to write
+            revision += 1
+            generate_feed(config['path'], revision=revision, **config['shape'])
+
+        request_started = time.perf_counter()
+        error = request()
+        if iteration >= config['warmup']:
+            latencies.append(time.perf_counter() - request_started)
+            if error:
+                errors.append(error)
+        else:
+            started = time.perf_counter()
+    elapsed = time.perf_counter() - started
+
+    # Parse pool processes only count towards the children's peak once
+    # they exited
+    import parse_pool
+    if parse_pool._pool is not None:
+        parse_pool._pool.shutdown(wait=True)
+
+    print(json.dumps({
+        'latencies': latencies,
+        'errors': errors,
+        'seconds': elapsed,
+        'baseline_kib': baseline,
+        'peak_kib': peak_rss_kib(),
+        'pool_peak_kib': peak_rss_kib(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def run_scenario(scenario, config, env):
+    """Run a scenario in a fresh process and return its measurements"""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', scenario,
+         json.dumps(config)],
+        env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise SystemExit(f"Scenario {scenario} failed:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+def summarize(scenario, event_count, stats):
+    """
+    Compute the reported figures of a scenario run
+
+    Returns:
+        dict: Latency percentiles in milliseconds, throughput and memory
+    """
+    latencies = sorted(stats['latencies'])
+    seconds = sum(latencies) or stats['seconds']
+    return {
+        'scenario': scenario,
+        'events': event_count,
+        'requests': len(latencies),
+        'errors': len(stats['errors']),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p90_ms': percentile(latencies, 0.9) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'requests_per_second': len(latencies) / seconds,
+        'events_per_second': event_count * len(latencies) / seconds,
+        'peak_rss_mib': stats['peak_kib'] / 1024,
+        'request_rss_mib': (stats['peak_kib'] - stats['baseline_kib']) / 1024,
+        'pool_peak_rss_mib': stats['pool_peak_kib'] / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trips', type=int, nargs='+', default=[100, 1000],
+                        help='feed sizes to run, in trips')
+    parser.add_argument('--events-per-trip', type=int, default=9)
+    parser.add_argument('--related-fraction', type=float, default=0.3)
+    parser.add_argument('--parent-uid-fraction', type=float, default=0.2)
+    parser.add_argument('--all-day-fraction', type=float, default=0.25)
+    parser.add_argument('--recurring-fraction', type=float, default=0.05)
+    parser.add_argument('--alarm-fraction', type=float, default=0.5)
+    parser.add_argument('--changed-fraction', type=float, default=0.05,
+                        help='events edited between syncs')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                        default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--glide-conflict-rate', type=float, default=0.01,
+                        help='Glide writes answered with 412')
+    parser.add_argument('--glide-latency', type=float, default=0.0,
+                        help='seconds added to every Glide request')
+    parser.add_argument('--glide-page-size', type=int, default=1000,
+                        help='most rows per page of Glide row reads')
+    parser.add_argument('--warm-caches', action='store_true',
+                        help='keep the feed and parse caches enabled')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], json.loads(args.child[1]))
+        return
+
+    workdir = tempfile.mkdtemp()
+    handler = functools.partial(_QuietHandler, directory=workdir)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    glide = MockGlide(conflict_rate=args.glide_conflict_rate,
+                      latency=args.glide_latency,
+                      page_size=args.glide_page_size).start()
+
+    env = dict(os.environ,
+               GLIDE_API_URL=glide.url,
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'registry.sqlite3'),
+               FEED_REFRESH_CONCURRENCY='0')
+    if not args.warm_caches:
+        env.update(FEED_CACHE_MAX_ENTRIES='0', PARSE_CACHE_PATH='')
+
+    results = []
+    print(f"{'scenario':<9}{'events':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'req/s':>8}{'events/s':>10}{'peak MiB':>10}{'pool MiB':>10}"
+          f"{'errors':>8}")
+    for trips in args.trips:
+        shape = {
+            'trips': trips,
+            'events_per_trip': args.events_per_trip,
+            'related_fraction': args.related_fraction,
+            'parent_uid_fraction': args.parent_uid_fraction,
+            'all_day_fraction': args.all_day_fraction,
+            'recurring_fraction': args.recurring_fraction,
+            'alarm_fraction': args.alarm_fraction,
+            'changed_fraction': args.changed_fraction,
+        }
+        for scenario in args.scenarios:
+            # Each scenario gets its own file, as sync edits its feed
+            name = f'{scenario}-{trips}.ics'
+            path = os.path.join(workdir, name)
+            event_count = generate_feed(path, **shape)
+            glide.reset()
+
+            config = {
+                'url': f'http://127.0.0.1:{server.server_port}/{name}',
+                'path': path,
+                'shape': shape,
+                'requests': args.requests,
+                'warmup': args.warmup,
+            }
+            summary = summarize(scenario, event_count,
+                                run_scenario(scenario, config, env))
+            if scenario == 'sync':
+                summary['glide_requests'] = glide.stats()
+                summary['glide_rows'] = glide.row_counts()
+            results.append(summary)
+
+            print(f"{scenario:<9}{event_count:>8}{summary['p50_ms']:>10.1f}"
+                  f"{summary['p90_ms']:>10.1f}{summary['p99_ms']:>10.1f}"
+                  f"{summary['max_ms']:>10.1f}{summary['requests_per_second']:>8.1f}"
+                  f"{summary['events_per_second']:>10.0f}{summary['peak_rss_mib']:>10.1f}"
+                  f"{summary['pool_peak_rss_mib']:>10.1f}{summary['errors']:>8}")
+            if scenario == 'sync':
+                requests_served = ', '.join(f'{key}: {value}' for key, value
+                                            in sorted(summary['glide_requests'].items()))
+                print(f"{'':<9}Glide requests: {requests_served}")
+
+    glide.stop()
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
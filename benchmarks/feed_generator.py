@@ -0,0 +1,132 @@
+"""
+Synthetic iCal feeds shaped like the trip calendars this service converts
+
+A feed is a list of trips. Each trip is an event spanning a few days with
+subevents attached to it in the ways the parser recognizes: RELATED-TO,
+X-PARENT-UID, or simply lying within the trip's time range. Trips are
+either all-day or timed in a TZID timezone; recurring events and alarms are
+mixed in. Generation is deterministic for a given seed, and a revision
+number changes the summaries of a fraction of the events, to simulate a
+feed being edited between syncs.
+"""
+import random
+from datetime import date, datetime, timedelta
+
+FIRST_DAY = date(2024, 1, 1)
+TIMEZONES = ('Europe/Berlin', 'America/New_York', 'Asia/Tokyo')
+EVENT_TYPES = ('Flight', 'Hotel', 'Train', 'Meeting', 'Dinner')
+
+
+def generate_feed(path, trips, events_per_trip=9, related_fraction=0.3,
+                  parent_uid_fraction=0.2, all_day_fraction=0.25,
+                  recurring_fraction=0.05, alarm_fraction=0.5,
+                  revision=0, changed_fraction=0.05, seed=1):
+    """
+    Write a synthetic feed
+
+    Subevents not linked by RELATED-TO or X-PARENT-UID are nested by time
+    containment. Trips are three days apart, so they never contain each
+    other's subevents.
+
+    Args:
+        path (str): File to write
+        trips (int): Number of trips
+        events_per_trip (int): Subevents per trip
+        related_fraction (float): Subevents linked to their trip by RELATED-TO
+        parent_uid_fraction (float): Subevents linked by X-PARENT-UID
+        all_day_fraction (float): Trips with DATE values instead of TZID times
+        recurring_fraction (float): Recurring events added per trip, with an
+            RRULE
+        alarm_fraction (float): Events with a VALARM
+        revision (int): Feed revision; each revision after 0 changes the
+            summary of a different selection of events
+        changed_fraction (float): Events changed by a revision
+        seed (int): Seed of the feed's shape
+
+    Returns:
+        int: Number of VEVENTs written
+    """
+    shape = random.Random(seed)
+    edits = random.Random(f'{seed}:{revision}')
+    count = 0
+
+    with open(path, 'w', newline='') as f:
+        f.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//bench//feed generator//EN\r\n'
+                'X-WR-CALNAME:Benchmark\r\nX-WR-TIMEZONE:UTC\r\n')
+
+        for trip in range(trips):
+            day = FIRST_DAY + timedelta(days=3 * trip)
+            trip_uid = f'trip-{trip}@bench'
+            tzid = TIMEZONES[trip % len(TIMEZONES)]
+            all_day = shape.random() < all_day_fraction
+
+            if all_day:
+                times = [f'DTSTART;VALUE=DATE:{day:%Y%m%d}',
+                         f'DTEND;VALUE=DATE:{day + timedelta(days=2):%Y%m%d}']
+            else:
+                start = datetime.combine(day, datetime.min.time())
+                times = [f'DTSTART;TZID={tzid}:{start:%Y%m%dT%H%M%S}',
+                         f'DTEND;TZID={tzid}:{start + timedelta(days=2):%Y%m%dT%H%M%S}']
+            _write_event(f, trip_uid, f'Trip {trip}', 'Trip', times,
+                         _summary_suffix(edits, revision, changed_fraction),
+                         alarm=shape.random() < alarm_fraction)
+            count += 1
+
+            for index in range(events_per_trip):
+                uid = f'trip-{trip}-event-{index}@bench'
+                # Subevents start an hour apart from 10:00 on the trip's first
+                # day, which is within the first UTC day of all-day trips too
+                start = datetime.combine(day, datetime.min.time()) + timedelta(
+                    hours=10 + index % 36, minutes=shape.choice((0, 15, 30)))
+                times = [f'DTSTART;TZID={tzid}:{start:%Y%m%dT%H%M%S}',
+                         f'DTEND;TZID={tzid}:{start + timedelta(minutes=45):%Y%m%dT%H%M%S}']
+
+                link = shape.random()
+                if link < related_fraction:
+                    times.append(f'RELATED-TO;RELTYPE=PARENT:{trip_uid}')
+                elif link < related_fraction + parent_uid_fraction:
+                    times.append(f'X-PARENT-UID:{trip_uid}')
+
+                event_type = EVENT_TYPES[index % len(EVENT_TYPES)]
+                _write_event(f, uid, f'{event_type} {trip}.{index}', event_type,
+                             times, _summary_suffix(edits, revision, changed_fraction),
+                             alarm=shape.random() < alarm_fraction)
+                count += 1
+
+            if shape.random() < recurring_fraction:
+                start = datetime.combine(day, datetime.min.time()) + timedelta(hours=7)
+                times = [f'DTSTART;TZID={tzid}:{start:%Y%m%dT%H%M%S}',
+                         f'DTEND;TZID={tzid}:{start + timedelta(minutes=30):%Y%m%dT%H%M%S}',
+                         'RRULE:FREQ=WEEKLY;COUNT=10;BYDAY=MO,WE']
+                _write_event(f, f'series-{trip}@bench', f'Standup {trip}', 'Meeting',
+                             times, _summary_suffix(edits, revision, changed_fraction),
+                             alarm=False)
+                count += 1
+
+        f.write('END:VCALENDAR\r\n')
+    return count
+
+
+def _summary_suffix(edits, revision, changed_fraction):
+    """Pick whether a revision changes an event, returning the summary suffix"""
+    if revision and edits.random() < changed_fraction:
+        return f' (revision {revision})'
+    return ''
+
+
+def _write_event(f, uid, summary, event_type, properties, suffix, alarm):
+    """Write one VEVENT with the given time and relationship properties"""
+    f.write('BEGIN:VEVENT\r\n'
+            f'UID:{uid}\r\n'
+            f'SUMMARY:{summary}{suffix}\r\n'
+            f'DESCRIPTION:[{event_type}] A description long enough to be folded '
+            f'by the generator\r\n for {uid}\r\n'
+            f'LOCATION:Somewhere near {uid}\r\n'
+            'STATUS:CONFIRMED\r\n'
+            'ORGANIZER;CN=Bench:mailto:bench@example.com\r\n')
+    for line in properties:
+        f.write(f'{line}\r\n')
+    if alarm:
+        f.write('BEGIN:VALARM\r\nACTION:DISPLAY\r\nDESCRIPTION:Reminder\r\n'
+                'TRIGGER:-PT15M\r\nEND:VALARM\r\n')
+    f.write('END:VEVENT\r\n')
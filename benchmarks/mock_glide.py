@@ -0,0 +1,275 @@
+"""
+Local stand-in for the Glide tables API, for benchmarks
+
+Serves the endpoints glide_sync uses, with the same optimistic concurrency:
+every table has a version, returned as the ETag of row reads and writes,
+and writes sent with an If-Match header for another version are rejected
+with 412 Precondition Failed. A fraction of writes can be made to conflict,
+as if the table had been edited concurrently, so the retry path is timed
+too, and requests can be failed with a given status to exercise retries.
+
+    GET    /tables/<table>/rows            -> {"data": [rows], "continuation": ...}
+    PUT    /tables/<table>                 {"rows": [rows]} or {"rows": {"$stashID": id}}
+    PUT    /stashes/<id>/<serial>          [rows]
+    POST   /tables/<table>/rows            [rows] -> {"data": {"rowIDs": [...]}}
+    PATCH  /tables/<table>/rows/<rowID>    {changed fields}
+"""
+import json
+import uuid
+import random
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MockGlide:
+    """
+    In-memory Glide tables served over HTTP on a local port
+    """
+
+    def __init__(self, conflict_rate=0.0, latency=0.0, seed=1, page_size=None):
+        """
+        Args:
+            conflict_rate (float): Fraction of writes answered with 412 after
+                bumping the table version
+            latency (float): Seconds each request is delayed by
+            seed (int): Seed of the conflict selection
+            page_size (int): Most rows returned per page of a row read, which
+                then carries a continuation token for the next page; None
+                returns every row at once unless the request has a limit
+        """
+        self.conflict_rate = conflict_rate
+        self.latency = latency
+        self.page_size = page_size
+        self.tables = {}
+        self.versions = {}
+        # Batches of rows uploaded to each stash, by serial
+        self.stashes = {}
+        self.requests = {}
+        # Statuses to answer the next requests of each method with
+        self.failures = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        """Base URL to use as GLIDE_API_URL"""
+        return f'http://127.0.0.1:{self._server.server_port}/tables'
+
+    def start(self):
+        """Start serving on a free local port"""
+        mock = self
+
+        class Handler(_GlideHandler):
+            glide = mock
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        """Empty every table and the request counters"""
+        with self._lock:
+            self.tables.clear()
+            self.versions.clear()
+            self.stashes.clear()
+            self.requests.clear()
+            self.failures.clear()
+
+    def row_counts(self):
+        """Number of rows in each table"""
+        with self._lock:
+            return {table: len(rows) for table, rows in self.tables.items()}
+
+    def stats(self):
+        """Requests served, by method and status code"""
+        with self._lock:
+            return dict(self.requests)
+
+    def fail_next(self, method, status, times=1):
+        """Answer the next requests of a method with a status, without serving them"""
+        with self._lock:
+            self.failures.setdefault(method, []).extend([status] * times)
+
+    def etag(self, table):
+        return f'"{self.versions.get(table, 0)}"'
+
+    def count(self, method, status):
+        key = f'{method} {status}'
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def conflicts(self, table, if_match):
+        """
+        Check a write's If-Match header against the table version
+
+        Returns:
+            bool: True if the write has to be rejected with 412
+        """
+        if if_match and if_match != self.etag(table):
+            return True
+        if self.conflict_rate and self._random.random() < self.conflict_rate:
+            # Someone else wrote to the table first
+            self.versions[table] = self.versions.get(table, 0) + 1
+            return True
+        return False
+
+
+class _GlideHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, as the Glide API does
+    protocol_version = 'HTTP/1.1'
+    glide = None
+
+    def log_message(self, *args):
+        pass
+
+    def _route(self):
+        """Split the path into (table, row ID or None, whether it is /rows)"""
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'tables':
+            return None, None, False
+        rows = len(parts) > 2 and parts[2] == 'rows'
+        row_id = parts[3] if rows and len(parts) > 3 else None
+        return parts[1], row_id, rows
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'null')
+
+    def _send(self, status, payload=None, etag=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        self.glide.count(self.command, status)
+
+    def _delay(self):
+        if self.glide.latency:
+            threading.Event().wait(self.glide.latency)
+
+    def _fail(self):
+        """Answer with an injected failure, if one is pending for this method"""
+        with self.glide._lock:
+            failures = self.glide.failures.get(self.command)
+            status = failures.pop(0) if failures else None
+            if status is not None:
+                self._send(status, {'error': 'Injected failure'})
+        return status is not None
+
+    def do_GET(self):
+        self._delay()
+        if self._fail():
+            return
+        table, _, rows = self._route()
+        if table is None or not rows:
+            self._send(404, {'error': 'Not found'})
+            return
+        query = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        limits = [int(value) for value in query.get('limit', [])]
+        if self.glide.page_size:
+            limits.append(self.glide.page_size)
+        # The continuation token is the offset of the next page
+        start = int(query.get('continuation', ['0'])[0])
+
+        glide = self.glide
+        with glide._lock:
+            data = list(glide.tables.get(table, {}).values())
+            payload = {'data': data[start:]}
+            if limits and len(data) - start > min(limits):
+                end = start + min(limits)
+                payload = {'data': data[start:end], 'continuation': str(end)}
+            # Row reads carry a weak ETag, as Glide's do
+            self._send(200, payload, f'W/{glide.etag(table)}')
+
+    def _put_stash(self, payload):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        if len(parts) != 3 or not parts[2].isdigit() or not isinstance(payload, list):
+            self._send(400, {'error': 'Expected [rows]'})
+            return
+        glide = self.glide
+        with glide._lock:
+            glide.stashes.setdefault(parts[1], {})[int(parts[2])] = payload
+            self._send(200, {})
+
+    def do_PUT(self):
+        self._delay()
+        payload = self._read_json()
+        if self._fail():
+            return
+        if self.path.startswith('/stashes/'):
+            self._put_stash(payload)
+            return
+        table, _, rows = self._route()
+        if table is None or rows or not isinstance(payload, dict):
+            self._send(400, {'error': 'Expected {"rows": [...]}'})
+            return
+        glide = self.glide
+        with glide._lock:
+            new_rows = payload.get('rows', [])
+            if isinstance(new_rows, dict):
+                stash = glide.stashes.pop(new_rows.get('$stashID'), None)
+                if stash is None:
+                    self._send(404, {'error': 'Stash not found'})
+                    return
+                new_rows = [row for serial in sorted(stash) for row in stash[serial]]
+            if glide.conflicts(table, self.headers.get('If-Match')):
+                self._send(412, {'error': 'Precondition Failed'})
+                return
+            stored = {}
+            for row in new_rows:
+                row = dict(row)
+                row.setdefault('$rowID', uuid.uuid4().hex)
+                stored[row['$rowID']] = row
+            glide.tables[table] = stored
+            glide.versions[table] = glide.versions.get(table, 0) + 1
+            self._send(200, {}, glide.etag(table))
+
+    def do_POST(self):
+        self._delay()
+        table, row_id, rows = self._route()
+        payload = self._read_json()
+        if self._fail():
+            return
+        if table is None or not rows or row_id or not isinstance(payload, list):
+            self._send(400, {'error': 'Expected [rows]'})
+            return
+        glide = self.glide
+        with glide._lock:
+            if glide.conflicts(table, self.headers.get('If-Match')):
+                self._send(412, {'error': 'Precondition Failed'})
+                return
+            stored = glide.tables.setdefault(table, {})
+            row_ids = []
+            for row in payload:
+                row = dict(row, **{'$rowID': uuid.uuid4().hex})
+                stored[row['$rowID']] = row
+                row_ids.append(row['$rowID'])
+            glide.versions[table] = glide.versions.get(table, 0) + 1
+            self._send(200, {'data': {'rowIDs': row_ids}}, glide.etag(table))
+
+    def do_PATCH(self):
+        self._delay()
+        table, row_id, _ = self._route()
+        payload = self._read_json()
+        if self._fail():
+            return
+        glide = self.glide
+        with glide._lock:
+            row = glide.tables.get(table, {}).get(row_id)
+            if row is None or not isinstance(payload, dict):
+                self._send(404, {'error': 'Row not found'})
+                return
+            if glide.conflicts(table, self.headers.get('If-Match')):
+                self._send(412, {'error': 'Precondition Failed'})
+                return
+            row.update(payload)
+            glide.versions[table] = glide.versions.get(table, 0) + 1
+            self._send(200, {}, glide.etag(table))
@@ -0,0 +1,126 @@
+import os
+import zlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+# Compressed bodies kept per worker, keyed by ETag, so repeated downloads of
+# an unchanged conversion are not compressed again
+COMPRESS_CACHE_MAX_BYTES = int(os.environ.get('COMPRESS_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+def negotiate_encoding(accept_encodings):
+    """
+    Pick the content encoding to use for a response
+
+    Args:
+        accept_encodings: Accept-Encoding header of the request, as parsed
+            by werkzeug (request.accept_encodings)
+
+    Returns:
+        str: 'br' or 'gzip', or None to send the body as is
+    """
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(offered)
+
+
+def _compressor(encoding):
+    """
+    Create an incremental compressor for an encoding
+
+    Returns:
+        tuple: (compress, flush) functions of the compressor
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    # wbits=31 writes a gzip header and trailer
+    compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+class _CompressedBodyCache:
+    """
+    Size-bounded LRU cache of compressed response bodies
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._bodies = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._bodies.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._bodies[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
+
+
+_compressed_bodies = _CompressedBodyCache(COMPRESS_CACHE_MAX_BYTES)
+
+
+def compress_body(body, encoding, cache_key=None):
+    """
+    Compress a complete response body
+
+    Args:
+        body (bytes): Body to compress
+        encoding (str): 'br' or 'gzip'
+        cache_key (str): Key identifying the body and encoding (the response
+            ETag), to reuse an earlier compression, or None
+
+    Returns:
+        bytes: Compressed body
+    """
+    if cache_key is not None:
+        compressed = _compressed_bodies.get(cache_key)
+        if compressed is not None:
+            return compressed
+
+    compress, flush = _compressor(encoding)
+    compressed = compress(body) + flush()
+    if cache_key is not None:
+        _compressed_bodies.put(cache_key, compressed)
+    return compressed
+
+
+def compress_stream(chunks, encoding):
+    """
+    Compress a streamed response body chunk by chunk
+
+    Args:
+        chunks (iterable): Body chunks (bytes)
+        encoding (str): 'br' or 'gzip'
+
+    Yields:
+        bytes: Compressed chunks
+    """
+    compress, flush = _compressor(encoding)
+    for chunk in chunks:
+        compressed = compress(chunk)
+        if compressed:
+            yield compressed
+    yield flush()
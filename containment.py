@@ -0,0 +1,231 @@
+import logging
+from datetime import datetime, timedelta
+import pytz
+
+# Reference points used to turn datetimes into integer microsecond keys
+_EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_REMOVED = float('inf')
+
+
+def assign_time_containment(events_by_uid, processed_uids):
+    """
+    Infer parent-child relationships based on time containment
+
+    Every event that is not yet processed claims, as subevents, all other
+    unprocessed events whose time range lies within its own. Events are
+    visited in feed order and an event whose time range matches exactly is
+    only claimed when its summary is not longer than the parent's summary.
+
+    Candidates are sorted by their normalized (start, -end) times, so each
+    parent finds its children through an index over event end times instead
+    of scanning every other event.
+
+    Args:
+        events_by_uid (dict): EventRecords keyed by UID, in feed order. Events
+            taking part have both a start_time and an end_time.
+        processed_uids (set): UIDs already attached to a parent. Updated in
+            place with every event claimed here.
+    """
+    # Events can only be compared with events of the same kind of start and
+    # end values (timezone-aware or floating), so each kind is indexed apart
+    groups = {}
+    order = []
+    for uid, event in events_by_uid.items():
+        if uid in processed_uids:
+            continue
+        if event.start_time is None or event.end_time is None:
+            continue
+
+        start_aware, start = event.start_time
+        end_aware, end = event.end_time
+        kind = (start_aware, end_aware)
+        members = groups.setdefault(kind, [])
+        order.append((kind, len(members)))
+        members.append((uid, event, start, end))
+
+    if len(groups) > 1:
+        logging.warning(
+            "Feed mixes floating and timezone-aware times; "
+            "events of different kinds are never nested")
+
+    indexes = {kind: _ContainmentIndex(members)
+               for kind, members in groups.items()}
+
+    # Visit parents in feed order; members of a kind are stored in feed
+    # order too, so sorting member indexes restores the feed order of children
+    for kind, member in order:
+        index = indexes[kind]
+        if index.claimed[member]:
+            continue
+
+        children = index.claim_children(member)
+        parent = index.members[member][1]
+        for child in sorted(children):
+            child_uid, child_event, _, _ = index.members[child]
+            parent.add_subevent(child_event)
+            processed_uids.add(child_uid)
+
+
+def normalize_time(value):
+    """
+    Normalize a date or datetime value to an integer sort key
+
+    Args:
+        value: date or datetime from a DTSTART/DTEND property
+
+    Returns:
+        tuple: (is_timezone_aware, microseconds since the epoch)
+    """
+    if not isinstance(value, datetime):
+        # Dates are treated as midnight UTC
+        value = datetime.combine(value, datetime.min.time())
+        value = value.replace(tzinfo=pytz.UTC)
+
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        return True, (value - _EPOCH_AWARE) // _MICROSECOND
+    return False, (value.replace(tzinfo=None) - _EPOCH_NAIVE) // _MICROSECOND
+
+
+class _ContainmentIndex:
+    """
+    Index over events of one kind answering "which unclaimed events lie
+    within this range" queries, removing the events it returns
+    """
+
+    def __init__(self, members):
+        self.members = members
+        self.claimed = [False] * len(members)
+
+        # Sort by (start, -end) so that everything contained in a range sits
+        # after that range's run of identical ranges
+        ranked = sorted(range(len(members)),
+                        key=lambda m: (members[m][2], -members[m][3]))
+        self.rank = [0] * len(members)
+        for position, member in enumerate(ranked):
+            self.rank[member] = position
+        self.ranked = ranked
+
+        # Identical ranges form runs; remember where each run ends and keep
+        # its members ordered by summary length for the tie-break
+        self.run_end = [0] * len(members)
+        self.runs = {}
+        start = 0
+        while start < len(ranked):
+            first = members[ranked[start]]
+            end = start + 1
+            while (end < len(ranked) and members[ranked[end]][2] == first[2]
+                   and members[ranked[end]][3] == first[3]):
+                end += 1
+            run = _IdenticalRangeRun(
+                sorted(ranked[start:end],
+                       key=lambda m: (len(members[m][1].summary), m)))
+            for position in range(start, end):
+                self.run_end[ranked[position]] = end
+                self.runs[ranked[position]] = run
+            start = end
+
+        # Segment tree holding the minimum end time of every subtree
+        size = 1
+        while size < len(ranked):
+            size *= 2
+        self.size = size
+        self.tree = [_REMOVED] * (2 * size)
+        for position, member in enumerate(ranked):
+            self.tree[size + position] = members[member][3]
+        for node in range(size - 1, 0, -1):
+            self.tree[node] = min(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def claim_children(self, parent):
+        """
+        Claim every unclaimed event contained in the parent's range
+
+        Args:
+            parent (int): Member index of the parent event
+
+        Returns:
+            list: Member indexes of the claimed events
+        """
+        members = self.members
+        limit = members[parent][3]
+        children = []
+
+        # Strictly smaller ranges: later start, or same start and earlier end
+        first = self.run_end[parent]
+        stack = [(1, 0, self.size)]
+        while stack:
+            node, low, high = stack.pop()
+            if high <= first or self.tree[node] > limit:
+                continue
+            if node >= self.size:
+                children.append(self.ranked[node - self.size])
+                continue
+            middle = (low + high) // 2
+            stack.append((2 * node + 1, middle, high))
+            stack.append((2 * node, low, middle))
+
+        # Identical ranges are claimed unless their summary is longer
+        summary_length = len(members[parent][1].summary)
+        children.extend(self.runs[parent].claim(
+            parent, summary_length, members, self.claimed))
+
+        for child in children:
+            self._remove(child)
+        return children
+
+    def _remove(self, member):
+        """Mark a member claimed and drop it from the segment tree"""
+        self.claimed[member] = True
+        node = self.size + self.rank[member]
+        self.tree[node] = _REMOVED
+        node //= 2
+        while node:
+            lowest = min(self.tree[2 * node], self.tree[2 * node + 1])
+            if self.tree[node] == lowest:
+                break
+            self.tree[node] = lowest
+            node //= 2
+
+
+class _IdenticalRangeRun:
+    """
+    Members sharing one time range, ordered by summary length
+
+    Parents from the same run are visited with growing summary lengths, so a
+    cursor over the ordered members finds every claimable event once.
+    """
+
+    def __init__(self, ordered_members):
+        self.ordered = ordered_members
+        self.cursor = 0
+        # Parents passed by the cursor stay claimable by later parents
+        self.passed = []
+
+    def claim(self, parent, summary_length, members, claimed):
+        """
+        Collect unclaimed members whose summary is not longer than the parent's
+
+        Args:
+            parent (int): Member index of the parent event
+            summary_length (int): Length of the parent's summary
+            members (list): Members of the containment index
+            claimed (list): Claimed flags of the containment index
+
+        Returns:
+            list: Member indexes to claim
+        """
+        result = [m for m in self.passed if not claimed[m]]
+        self.passed = [parent]
+
+        while self.cursor < len(self.ordered):
+            member = self.ordered[self.cursor]
+            if len(members[member][1].summary) > summary_length:
+                break
+            self.cursor += 1
+            if member == parent:
+                continue
+            if not claimed[member]:
+                result.append(member)
+
+        return result
@@ -4,4 +4,4 @@
 # It ensures the correct module is used
 
 echo "Starting iCal to JSON API service..."
-gunicorn --bind 0.0.0.0:5000 --workers=4 application:app
\ No newline at end of file
+gunicorn --bind 0.0.0.0:5000 --workers=4 --threads=4 application:app
\ No newline at end of file
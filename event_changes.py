@@ -0,0 +1,312 @@
+import os
+import time
+import base64
+import hashlib
+import binascii
+from sqlalchemy.exc import IntegrityError
+from models import db, ChangeFeed, EventFingerprint
+from serializers import dumps
+
+# Seconds removed events are remembered; older cursors have to start over.
+# Change logs of feeds not polled for as long are dropped.
+CHANGES_RETENTION = int(os.environ.get('CHANGES_RETENTION', 30 * 24 * 3600))
+# Most feeds whose changes are tracked
+CHANGES_MAX_FEEDS = int(os.environ.get('CHANGES_MAX_FEEDS', 1000))
+
+
+class CursorError(ValueError):
+    """Raised for a cursor that is malformed or belongs to another feed"""
+
+
+class CursorExpired(Exception):
+    """Raised for a cursor older than the removals still remembered"""
+
+
+class TooManyFeeds(Exception):
+    """Raised when a new feed would exceed CHANGES_MAX_FEEDS change logs"""
+
+
+def encode_cursor(change_feed_id, seq):
+    """
+    Build the opaque cursor for a position in a feed's change log
+
+    Args:
+        change_feed_id (int): ID of the feed's change log
+        seq (int): Sequence number in the change log
+
+    Returns:
+        str: Cursor token
+    """
+    token = base64.urlsafe_b64encode(f'{change_feed_id}:{seq}'.encode('ascii'))
+    return token.decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Read a cursor built by encode_cursor
+
+    Args:
+        cursor (str): Cursor token
+
+    Returns:
+        tuple: (change log ID, sequence number)
+
+    Raises:
+        CursorError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        change_feed_id, seq = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+        return int(change_feed_id), int(seq)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CursorError(f'Invalid cursor: {cursor}')
+
+
+def event_fingerprints(events):
+    """
+    Fingerprint the events of a conversion by UID
+
+    Events sharing a UID are fingerprinted together. The fingerprint covers
+    the whole event dict, subevents included, serialized with sorted keys.
+
+    Args:
+        events (list): Top-level events of a parsed calendar
+
+    Returns:
+        dict: Hex digest for each UID
+    """
+    events_by_uid = {}
+    for event in events:
+        events_by_uid.setdefault(event.get('uid') or '', []).append(event)
+    return {
+        uid: hashlib.sha256(dumps(uid_events)).hexdigest()
+        for uid, uid_events in events_by_uid.items()
+    }
+
+
+def feed_changes(url, events, content_hash, since=None):
+    """
+    Record the events of a conversion and list what changed since a cursor
+
+    Conversions of the same feed are recorded one at a time; the change log
+    only advances when an event was added, modified or removed.
+
+    Args:
+        url (str): URL of the iCal feed
+        events (list): Top-level events of the conversion
+        content_hash (str): Hash of the serialized conversion, to skip
+            fingerprinting a feed that did not change
+        since (str): Cursor returned by an earlier call, or None to list
+            every event as added
+
+    Returns:
+        dict: 'cursor' for the next call and the 'added' and 'modified'
+            events and 'removed' UIDs since the given cursor
+
+    Raises:
+        CursorError: If the cursor is malformed or belongs to another feed
+        CursorExpired: If removals since the cursor were already forgotten,
+            or the feed's change log was dropped
+        TooManyFeeds: If the feed is not tracked yet and CHANGES_MAX_FEEDS
+            feeds are
+    """
+    change_feed_id = _change_feed_id(url)
+    since_seq = None
+    if since:
+        cursor_feed_id, since_seq = decode_cursor(since)
+        if cursor_feed_id != change_feed_id:
+            if db.session.get(ChangeFeed, cursor_feed_id) is None:
+                # The change log the cursor points into was dropped
+                raise CursorExpired(f'Cursor expired: {since}')
+            raise CursorError(f'Cursor does not belong to this feed: {since}')
+
+    now = time.time()
+    try:
+        # Lock the change log so the diff and its sequence number agree
+        db.session.execute(
+            db.update(ChangeFeed).where(ChangeFeed.id == change_feed_id)
+            .values(updated_at=now))
+        seq, stored_hash, pruned_seq = db.session.execute(
+            db.select(ChangeFeed.seq, ChangeFeed.content_hash, ChangeFeed.pruned_seq)
+            .where(ChangeFeed.id == change_feed_id)).one()
+        if since_seq is not None and since_seq > seq:
+            raise CursorError(f'Cursor is ahead of the feed: {since}')
+
+        if stored_hash != content_hash:
+            fingerprints = event_fingerprints(events)
+            seq = _record_fingerprints(change_feed_id, seq, fingerprints, now)
+            pruned_seq = _prune_removals(change_feed_id, pruned_seq, now)
+            db.session.execute(
+                db.update(ChangeFeed).where(ChangeFeed.id == change_feed_id)
+                .values(seq=seq, content_hash=content_hash, pruned_seq=pruned_seq))
+
+        if since_seq is not None and since_seq < pruned_seq:
+            raise CursorExpired(f'Cursor expired: {since}')
+
+        if since_seq is None:
+            added_uids, modified_uids, removed = None, set(), []
+        else:
+            added_uids, modified_uids, removed = _changed_uids(change_feed_id,
+                                                              since_seq)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    added = []
+    modified = []
+    for event in events:
+        uid = event.get('uid') or ''
+        if added_uids is None or uid in added_uids:
+            added.append(event)
+        elif uid in modified_uids:
+            modified.append(event)
+
+    return {
+        'cursor': encode_cursor(change_feed_id, seq),
+        'added': added,
+        'modified': modified,
+        'removed': removed
+    }
+
+
+def _change_feed_id(url):
+    """
+    Get the ID of a feed's change log, creating the log on first use
+
+    Raises:
+        TooManyFeeds: If the log would exceed CHANGES_MAX_FEEDS logs
+    """
+    change_feed_id = db.session.execute(
+        db.select(ChangeFeed.id).where(ChangeFeed.url == url)).scalar()
+    if change_feed_id is not None:
+        return change_feed_id
+
+    try:
+        _drop_abandoned_feeds(time.time())
+        feed_count = db.session.execute(
+            db.select(db.func.count()).select_from(ChangeFeed)).scalar()
+        if feed_count >= CHANGES_MAX_FEEDS:
+            raise TooManyFeeds(f'Changes of at most {CHANGES_MAX_FEEDS} feeds are tracked')
+
+        change_feed = ChangeFeed(url=url)
+        db.session.add(change_feed)
+        db.session.commit()
+        return change_feed.id
+    except IntegrityError:
+        # Another request created it first
+        db.session.rollback()
+        return db.session.execute(
+            db.select(ChangeFeed.id).where(ChangeFeed.url == url)).scalar_one()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _drop_abandoned_feeds(now):
+    """Delete the change logs of feeds not polled for CHANGES_RETENTION seconds"""
+    abandoned = ChangeFeed.updated_at < now - CHANGES_RETENTION
+    db.session.execute(db.delete(EventFingerprint).where(
+        EventFingerprint.change_feed_id.in_(db.select(ChangeFeed.id).where(abandoned))))
+    db.session.execute(db.delete(ChangeFeed).where(abandoned))
+
+
+def _record_fingerprints(change_feed_id, seq, fingerprints, now):
+    """
+    Store the fingerprints of a conversion
+
+    Returns:
+        int: The next sequence number if an event changed, otherwise seq
+    """
+    stored = {
+        uid: (fingerprint, created_seq, changed_seq)
+        for uid, fingerprint, created_seq, changed_seq in db.session.execute(
+            db.select(EventFingerprint.uid, EventFingerprint.fingerprint,
+                      EventFingerprint.created_seq, EventFingerprint.changed_seq)
+            .where(EventFingerprint.change_feed_id == change_feed_id))
+    }
+
+    next_seq = seq + 1
+    inserts = []
+    updates = []
+    for uid, fingerprint in fingerprints.items():
+        if uid not in stored:
+            inserts.append({'change_feed_id': change_feed_id, 'uid': uid,
+                            'fingerprint': fingerprint, 'created_seq': next_seq,
+                            'changed_seq': next_seq, 'changed_at': now})
+        elif stored[uid][0] is None:
+            # Removed earlier and back now; the previous presence is kept, so
+            # clients that held the event during it see it as modified
+            updates.append({'change_feed_id': change_feed_id, 'uid': uid,
+                            'fingerprint': fingerprint, 'created_seq': next_seq,
+                            'changed_seq': next_seq,
+                            'prior_created_seq': stored[uid][1],
+                            'removed_seq': stored[uid][2], 'changed_at': now})
+        elif stored[uid][0] != fingerprint:
+            updates.append({'change_feed_id': change_feed_id, 'uid': uid,
+                            'fingerprint': fingerprint, 'changed_seq': next_seq,
+                            'changed_at': now})
+    for uid, (fingerprint, _, _) in stored.items():
+        if fingerprint is not None and uid not in fingerprints:
+            updates.append({'change_feed_id': change_feed_id, 'uid': uid,
+                            'fingerprint': None, 'changed_seq': next_seq,
+                            'changed_at': now})
+
+    if not inserts and not updates:
+        return seq
+    if inserts:
+        db.session.execute(db.insert(EventFingerprint), inserts)
+    if updates:
+        db.session.execute(db.update(EventFingerprint), updates)
+    return next_seq
+
+
+def _prune_removals(change_feed_id, pruned_seq, now):
+    """
+    Forget removals older than the retention period
+
+    Returns:
+        int: Highest sequence number whose removals are forgotten
+    """
+    expired = (EventFingerprint.change_feed_id == change_feed_id,
+               EventFingerprint.fingerprint.is_(None),
+               EventFingerprint.changed_at < now - CHANGES_RETENTION)
+    expired_seq = db.session.execute(
+        db.select(db.func.max(EventFingerprint.changed_seq)).where(*expired)).scalar()
+    if expired_seq is None:
+        return pruned_seq
+
+    db.session.execute(db.delete(EventFingerprint).where(*expired))
+    return max(pruned_seq, expired_seq)
+
+
+def _changed_uids(change_feed_id, since_seq):
+    """
+    List the UIDs that changed after a sequence number
+
+    Returns:
+        tuple: (added UIDs, modified UIDs, removed UIDs list)
+    """
+    added = set()
+    modified = set()
+    removed = []
+    rows = db.session.execute(
+        db.select(EventFingerprint.uid, EventFingerprint.fingerprint,
+                  EventFingerprint.created_seq, EventFingerprint.prior_created_seq,
+                  EventFingerprint.removed_seq)
+        .where(EventFingerprint.change_feed_id == change_feed_id,
+               EventFingerprint.changed_seq > since_seq))
+    for uid, fingerprint, created_seq, prior_created_seq, removed_seq in rows:
+        # Whether the client already held the event at its cursor: in the
+        # event's current presence, or in the presence before its removal
+        held = created_seq <= since_seq or (
+            removed_seq is not None and prior_created_seq <= since_seq < removed_seq)
+        if fingerprint is None:
+            # Events added and removed again since the cursor were never seen
+            if held:
+                removed.append(uid)
+        elif held:
+            modified.add(uid)
+        else:
+            added.add(uid)
+    return added, modified, removed
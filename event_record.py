@@ -0,0 +1,108 @@
+class EventRecord:
+    """
+    Event extracted from a VEVENT while a feed is parsed
+
+    Records hold the event properties in slots instead of a dict per event,
+    and carry their start and end as normalized times, so organizing events
+    compares integers. Records are turned into the public event dicts by
+    to_dict once the events are organized.
+
+    Attributes:
+        start_time (tuple): (is_timezone_aware, microseconds since the
+            epoch) of the start, or None
+        end_time (tuple): Same for the end, or None
+        subevents (list): Child records, or None until the first is added
+    """
+    __slots__ = ('uid', 'summary', 'description', 'location', 'status',
+                 'organizer', 'created', 'last_modified', 'related_to',
+                 'relationship_type', 'parent_uid', 'start', 'end',
+                 'start_time', 'end_time', 'recurrence', 'alarms',
+                 'series_uid', 'recurrence_id', 'subevents')
+
+    def __init__(self, uid, summary, description, location, status, organizer,
+                 created, last_modified, related_to='', relationship_type=''):
+        self.uid = uid
+        self.summary = summary
+        self.description = description
+        self.location = location
+        self.status = status
+        self.organizer = organizer
+        self.created = created
+        self.last_modified = last_modified
+        self.related_to = related_to
+        self.relationship_type = relationship_type
+        self.parent_uid = None
+        self.start = None
+        self.end = None
+        self.start_time = None
+        self.end_time = None
+        self.recurrence = None
+        self.alarms = None
+        self.series_uid = None
+        self.recurrence_id = None
+        self.subevents = None
+
+    def copy(self):
+        """
+        Copy the record without its subevents
+
+        Returns:
+            EventRecord: New record sharing the property values
+        """
+        record = EventRecord.__new__(EventRecord)
+        for name in self.__slots__:
+            setattr(record, name, getattr(self, name))
+        record.subevents = None
+        return record
+
+    def add_subevent(self, record):
+        """Attach a child record"""
+        if self.subevents is None:
+            self.subevents = []
+        self.subevents.append(record)
+
+    def to_dict(self, include_subevents=True):
+        """
+        Build the event dict returned by the API
+
+        Empty relationship properties are left out, as are properties the
+        VEVENT does not have.
+
+        Args:
+            include_subevents (bool): Whether child events are included;
+                subevents are listed without their own children
+
+        Returns:
+            dict: Event dictionary
+        """
+        event = {
+            'uid': self.uid,
+            'summary': self.summary,
+            'description': self.description,
+            'location': self.location,
+            'status': self.status,
+            'organizer': self.organizer,
+            'created': self.created,
+            'last_modified': self.last_modified,
+        }
+        if self.related_to:
+            event['related_to'] = self.related_to
+        if self.relationship_type:
+            event['relationship_type'] = self.relationship_type
+        if include_subevents and self.subevents:
+            event['subevents'] = [subevent.to_dict(include_subevents=False)
+                                  for subevent in self.subevents]
+        if self.parent_uid is not None:
+            event['parent_uid'] = self.parent_uid
+        if self.start is not None:
+            event['start'] = self.start
+        if self.end is not None:
+            event['end'] = self.end
+        if self.recurrence is not None:
+            event['recurrence'] = self.recurrence
+        if self.alarms:
+            event['alarms'] = self.alarms
+        if self.series_uid is not None:
+            event['series_uid'] = self.series_uid
+            event['recurrence_id'] = self.recurrence_id
+        return event
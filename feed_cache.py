@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import metrics
+
+
+class FeedCacheEntry:
+    """
+    Cached upstream response for a single feed URL
+    """
+
+    # Parsed results kept per entry, one per set of parse options
+    MAX_RESULTS = 8
+
+    def __init__(self, url, content, etag=None, last_modified=None):
+        self.url = url
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        # (data, serialized) pairs keyed by parse options, least recently used first
+        self.results = OrderedDict()
+        self.validated_at = time.monotonic()
+
+    def can_answer(self, variant):
+        """
+        Check whether a result for the given parse options can be produced
+        without downloading the feed again
+
+        Args:
+            variant (str): Key of the parse options
+
+        Returns:
+            bool: True if the result or the body to parse it from is cached
+        """
+        return variant in self.results or self.content is not None
+
+    @property
+    def size(self):
+        """Number of body bytes held by this entry"""
+        return len(self.content) if self.content else 0
+
+    def age(self):
+        """Seconds since the entry was last confirmed by the upstream server"""
+        return time.monotonic() - self.validated_at
+
+    def conditional_headers(self):
+        """
+        Build the headers for a conditional GET against the upstream server
+
+        Returns:
+            dict: If-None-Match / If-Modified-Since headers
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class FeedCache:
+    """
+    Size-bounded LRU cache of upstream iCal responses keyed by URL
+
+    Entries keep the upstream ETag/Last-Modified validators, the raw body and
+    the parsed and serialized result, so a 304 from the upstream server can be
+    answered without downloading or parsing the feed again.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, max_staleness=0):
+        """
+        Args:
+            max_entries (int): Maximum number of cached feeds
+            max_bytes (int): Maximum total size of cached bodies in bytes
+            max_staleness (int): Seconds an entry may be served without
+                revalidating it against the upstream server
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_staleness = max_staleness
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'revalidations': 0,
+            'not_modified': 0,
+            'evictions': 0,
+        }
+
+    def lookup(self, url):
+        """
+        Find the cached entry for a URL
+
+        Args:
+            url (str): URL of the iCal feed
+
+        Returns:
+            tuple: (entry or None, whether the entry may be served as is)
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                self._stats['misses'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='feed', result='miss')
+                return None, False
+
+            self._entries.move_to_end(url)
+            if self.max_staleness > 0 and entry.age() < self.max_staleness:
+                self._stats['hits'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='feed', result='hit')
+                return entry, True
+
+            self._stats['revalidations'] += 1
+            metrics.CACHE_REQUESTS.inc(cache='feed', result='revalidation')
+            return entry, False
+
+    def mark_not_modified(self, entry):
+        """
+        Record that the upstream server confirmed an entry is still current
+
+        Args:
+            entry (FeedCacheEntry): Entry that was revalidated
+        """
+        with self._lock:
+            entry.validated_at = time.monotonic()
+            self._stats['not_modified'] += 1
+            self._stats['hits'] += 1
+            metrics.CACHE_REQUESTS.inc(cache='feed', result='not_modified')
+
+    def store(self, url, headers, content, variant, data, serialized=None):
+        """
+        Store an upstream response and its parsed result
+
+        Responses without validators are only kept when entries may be
+        served without revalidation, and "no-store" responses are never kept.
+
+        Args:
+            url (str): URL of the iCal feed
+            headers (dict): Headers of the successful upstream response
+            content (bytes): Response body, or None if it was not kept
+            variant (str): Key of the parse options the result was built with
+            data (dict): Parsed result for the response body
+            serialized (bytes): Pre-encoded JSON body for the parsed result
+        """
+        etag = headers.get('ETag')
+        last_modified = headers.get('Last-Modified')
+        cache_control = headers.get('Cache-Control', '').lower()
+
+        if 'no-store' in cache_control:
+            self.discard(url)
+            return
+        if not etag and not last_modified and self.max_staleness <= 0:
+            self.discard(url)
+            return
+
+        entry = FeedCacheEntry(url, content, etag, last_modified)
+        entry.results[variant] = (data, serialized)
+        if entry.size > self.max_bytes:
+            logging.debug(f"Feed too large to cache: {url}")
+            self.discard(url)
+            return
+
+        with self._lock:
+            previous = self._entries.pop(url, None)
+            if previous is not None:
+                self._size -= previous.size
+
+            self._entries[url] = entry
+            self._size += entry.size
+
+            while (len(self._entries) > self.max_entries
+                   or self._size > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self._stats['evictions'] += 1
+
+    def add_result(self, entry, variant, data, serialized=None):
+        """
+        Keep another parsed result for a cached response
+
+        Args:
+            entry (FeedCacheEntry): Entry the result was parsed from
+            variant (str): Key of the parse options the result was built with
+            data (dict): Parsed result
+            serialized (bytes): Pre-encoded JSON body for the parsed result
+        """
+        with self._lock:
+            entry.results[variant] = (data, serialized)
+            entry.results.move_to_end(variant)
+            while len(entry.results) > entry.MAX_RESULTS:
+                entry.results.popitem(last=False)
+
+    def get_result(self, entry, variant):
+        """
+        Get a parsed result kept for a cached response
+
+        Args:
+            entry (FeedCacheEntry): Cached response
+            variant (str): Key of the parse options
+
+        Returns:
+            tuple: (data, serialized), or None if no such result is kept
+        """
+        with self._lock:
+            result = entry.results.get(variant)
+            if result is not None:
+                entry.results.move_to_end(variant)
+            return result
+
+    def discard(self, url):
+        """
+        Drop the cached entry for a URL if there is one
+
+        Args:
+            url (str): URL of the iCal feed
+        """
+        with self._lock:
+            entry = self._entries.pop(url, None)
+            if entry is not None:
+                self._size -= entry.size
+
+    def stats(self):
+        """
+        Get cache counters and current occupancy
+
+        Returns:
+            dict: Hit/miss/revalidation counters and cache size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._size
+            stats['max_entries'] = self.max_entries
+            stats['max_bytes'] = self.max_bytes
+            stats['max_staleness'] = self.max_staleness
+            return stats
+
+
+# Cache shared by all requests handled by this worker
+feed_cache = FeedCache(
+    max_entries=int(os.environ.get('FEED_CACHE_MAX_ENTRIES', 256)),
+    max_bytes=int(os.environ.get('FEED_CACHE_MAX_BYTES', 64 * 1024 * 1024)),
+    max_staleness=int(os.environ.get('FEED_CACHE_MAX_STALENESS', 0)),
+)
@@ -0,0 +1,534 @@
+import os
+import time
+import fcntl
+import random
+import hashlib
+import logging
+import tempfile
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ical_parser import fetch_and_parse_ical
+from models import db, Feed, FeedSnapshot
+from serializers import encode_result, loads
+import metrics
+
+# Shortest refresh interval a feed can be registered with, in seconds
+FEED_MIN_REFRESH_INTERVAL = int(os.environ.get('FEED_MIN_REFRESH_INTERVAL', 60))
+# Most feeds that can be registered
+FEED_REGISTRY_MAX_FEEDS = int(os.environ.get('FEED_REGISTRY_MAX_FEEDS', 1000))
+# Feed refreshes and sync jobs run at the same time; 0 disables the scheduler
+FEED_REFRESH_CONCURRENCY = int(os.environ.get('FEED_REFRESH_CONCURRENCY', 4))
+# Fraction of the refresh interval by which each refresh is moved at random,
+# so feeds registered together do not keep hitting upstream servers together
+FEED_REFRESH_JITTER = float(os.environ.get('FEED_REFRESH_JITTER', 0.1))
+# Seconds between checks for due feeds
+FEED_SCHEDULER_TICK = float(os.environ.get('FEED_SCHEDULER_TICK', 5))
+# Delay before the first retry of a failed refresh, doubled on each failure
+# up to the refresh interval
+FEED_RETRY_DELAY = int(os.environ.get('FEED_RETRY_DELAY', 30))
+# Seconds a snapshot may be older than its feed's refresh interval and still
+# be served by /api/convert
+FEED_SNAPSHOT_MAX_LAG = int(os.environ.get('FEED_SNAPSHOT_MAX_LAG', 60))
+# Snapshot lookups of feed URLs kept by each worker, bounded by number of
+# URLs and bytes of snapshot bodies
+FEED_SNAPSHOT_CACHE_MAX_URLS = int(os.environ.get('FEED_SNAPSHOT_CACHE_MAX_URLS', 1024))
+FEED_SNAPSHOT_CACHE_MAX_BYTES = int(os.environ.get('FEED_SNAPSHOT_CACHE_MAX_BYTES',
+                                                   64 * 1024 * 1024))
+# Operator secret authorizing the /api/feeds routes; empty disables them
+FEED_REGISTRY_SECRET = os.environ.get('FEED_REGISTRY_SECRET', '')
+# Lock file electing the one worker on this host that runs the scheduler
+FEED_SCHEDULER_LOCK_PATH = os.environ.get(
+    'FEED_SCHEDULER_LOCK_PATH',
+    os.path.join(tempfile.gettempdir(), 'ical_feed_scheduler.lock'))
+
+
+def next_refresh_time(now, interval, consecutive_failures=0):
+    """
+    Pick when a feed is refreshed next
+
+    Args:
+        now (float): Unix timestamp of the refresh that just ran
+        interval (int): Refresh interval of the feed in seconds
+        consecutive_failures (int): Failed refreshes in a row, retried sooner
+
+    Returns:
+        float: Unix timestamp of the next refresh
+    """
+    delay = interval
+    if consecutive_failures:
+        delay = min(interval, FEED_RETRY_DELAY * 2 ** (consecutive_failures - 1))
+    return now + delay * (1 + random.uniform(-FEED_REFRESH_JITTER, FEED_REFRESH_JITTER))
+
+
+class FeedScheduler:
+    """
+    Background runner of the registered feed refreshes and sync jobs
+
+    Each worker runs a scheduler thread, but only the one holding the lock
+    file runs tasks; the others keep trying to take over the lock in case
+    that worker exits. Every kind of task is a database model with a column
+    holding when each row is due, and a function running one due row.
+    """
+
+    def __init__(self, max_concurrency=4, tick=5, lock_path=None):
+        """
+        Args:
+            max_concurrency (int): Tasks run at the same time
+            tick (float): Seconds between checks for due feeds
+            lock_path (str): Lock file electing the worker running tasks
+        """
+        self.max_concurrency = max_concurrency
+        self.tick = tick
+        self.lock_path = lock_path
+        self._app = None
+        self._thread = None
+        self._executor = None
+        self._lock_file = None
+        self._tasks = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._outcomes = {}
+
+    @property
+    def enabled(self):
+        return self.max_concurrency > 0
+
+    @property
+    def leader(self):
+        """Whether this worker is the one running tasks"""
+        return self._lock_file is not None
+
+    def register(self, kind, model, due_column, run):
+        """
+        Add a kind of task to schedule
+
+        Args:
+            kind (str): Name of the task kind
+            model: Model whose rows are the tasks
+            due_column: Column of the model holding when a row is due
+            run (callable): Called with a due row and the Unix timestamp it
+                was due at, within an app context; returns an outcome name
+                that is counted in the stats
+        """
+        self._tasks[kind] = (model, due_column, run)
+        self._outcomes[kind] = {}
+
+    def start(self, app):
+        """
+        Start the scheduler thread of this worker
+
+        Processes started by multiprocessing, such as parse pool processes,
+        never run a scheduler.
+
+        Args:
+            app (Flask): App whose database holds the registered feeds
+        """
+        if not self.enabled or multiprocessing.parent_process() is not None:
+            return
+
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                                thread_name_prefix='feed-task')
+            self._thread = threading.Thread(target=self._run, name='feed-scheduler',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop scheduling refreshes and give up the lock"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._release_leadership()
+
+    def _run(self):
+        while True:
+            try:
+                if self._acquire_leadership():
+                    self._dispatch_due_tasks()
+            except Exception as e:
+                logging.error(f"Feed scheduler error: {str(e)}")
+            if self._stop.wait(self.tick):
+                return
+
+    def _acquire_leadership(self):
+        """
+        Take the scheduler lock if no other worker holds it
+
+        Returns:
+            bool: True if this worker runs tasks
+        """
+        if self._lock_file is not None:
+            return True
+
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        logging.info(f"Worker {os.getpid()} is running scheduled feed tasks")
+        self._lock_file = lock_file
+        return True
+
+    def _release_leadership(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _dispatch_due_tasks(self):
+        """Start the earliest due tasks, up to the concurrency limit"""
+        with self._lock:
+            capacity = self.max_concurrency - len(self._running)
+            running = set(self._running)
+        if capacity <= 0:
+            return
+
+        now = time.time()
+        due = []
+        with self._app.app_context():
+            for kind, (model, due_column, _) in self._tasks.items():
+                query = db.select(model.id, due_column).where(due_column <= now)
+                running_ids = [task_id for task_kind, task_id in running
+                               if task_kind == kind]
+                if running_ids:
+                    query = query.where(model.id.not_in(running_ids))
+                rows = db.session.execute(
+                    query.order_by(due_column).limit(capacity)).all()
+                due.extend((due_at, kind, task_id) for task_id, due_at in rows)
+
+        for due_at, kind, task_id in sorted(due)[:capacity]:
+            with self._lock:
+                self._running.add((kind, task_id))
+            self._executor.submit(self._run_task, kind, task_id, due_at)
+
+    def _run_task(self, kind, task_id, due_at):
+        """Run one due task and count its outcome"""
+        model, _, run = self._tasks[kind]
+        outcome = None
+        try:
+            with self._app.app_context():
+                task = db.session.get(model, task_id)
+                if task is not None:
+                    outcome = run(task, due_at)
+        except Exception as e:
+            logging.error(f"Error running {kind} task {task_id}: {str(e)}")
+            outcome = 'error'
+        finally:
+            with self._lock:
+                self._running.discard((kind, task_id))
+                if outcome is not None:
+                    outcomes = self._outcomes[kind]
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    def stats(self):
+        """
+        Get scheduler counters of this worker
+
+        Returns:
+            dict: Leadership, running tasks and outcome counters per task kind
+        """
+        with self._lock:
+            stats = {kind: dict(outcomes) for kind, outcomes in self._outcomes.items()}
+            stats['enabled'] = self.enabled
+            stats['leader'] = self.leader
+            stats['running'] = len(self._running)
+            stats['max_concurrency'] = self.max_concurrency
+            return stats
+
+
+def refresh_feed(feed, due_at=None):
+    """
+    Fetch and parse a registered feed and store the result as its snapshot
+
+    Must be called within an app context.
+
+    Args:
+        feed (Feed): Registered feed
+        due_at (float): Unix timestamp the refresh was scheduled for
+
+    Returns:
+        str: 'refreshed', or 'failed' if the feed could not be converted
+    """
+    started = time.time()
+    result = fetch_and_parse_ical(feed.url, feed.timeout)
+    finished = time.time()
+
+    feed.last_attempt_at = started
+    feed.last_duration = finished - started
+    if due_at is not None:
+        feed.last_refresh_lag = max(0.0, started - due_at)
+    feed.refresh_count += 1
+
+    if result['success']:
+        body = result.get('json')
+        if body is None:
+            body = encode_result(result['data'])
+        _store_snapshot(feed, body, result.get('etag'), finished)
+        feed.last_success_at = finished
+        feed.last_status_code = 200
+        feed.last_error = None
+        feed.consecutive_failures = 0
+    else:
+        logging.warning(f"Refresh of feed {feed.url} failed: {result['message']}")
+        feed.last_status_code = result.get('status_code', 500)
+        feed.last_error = result['message']
+        feed.failure_count += 1
+        feed.consecutive_failures += 1
+
+    feed.next_refresh_at = next_refresh_time(finished, feed.refresh_interval,
+                                             feed.consecutive_failures)
+    db.session.commit()
+    snapshot_lookups.discard(feed.url)
+    return 'refreshed' if result['success'] else 'failed'
+
+
+def _store_snapshot(feed, body, etag, fetched_at):
+    """Replace a feed's snapshot, rewriting the body only when it changed"""
+    content_hash = hashlib.sha256(body).hexdigest()
+    if etag is None:
+        etag = content_hash[:32]
+
+    snapshot = feed.snapshot
+    if snapshot is None:
+        feed.snapshot = FeedSnapshot(body=body, size=len(body), etag=etag,
+                                     content_hash=content_hash,
+                                     fetched_at=fetched_at, changed_at=fetched_at)
+        return
+
+    if snapshot.content_hash != content_hash:
+        snapshot.body = body
+        snapshot.size = len(body)
+        snapshot.content_hash = content_hash
+        snapshot.changed_at = fetched_at
+    snapshot.etag = etag
+    snapshot.fetched_at = fetched_at
+
+
+class SnapshotLookup:
+    """
+    Snapshot of a feed URL as found in the registry, or its absence
+    """
+
+    def __init__(self, expires_at, body=None, etag=None, fetched_at=None,
+                 max_age=None):
+        """
+        Args:
+            expires_at (float): Unix timestamp until which the lookup holds
+            body (bytes): Serialized JSON body, or None if the URL has no
+                snapshot that can be served
+            etag (str): ETag of the body
+            fetched_at (float): When the snapshot was last confirmed current
+            max_age (float): Seconds after fetched_at the body may be served
+        """
+        self.expires_at = expires_at
+        self.body = body
+        self.etag = etag
+        self.fetched_at = fetched_at
+        self.max_age = max_age
+
+    @property
+    def size(self):
+        """Number of body bytes held by this lookup"""
+        return len(self.body) if self.body is not None else 0
+
+
+class SnapshotLookupCache:
+    """
+    LRU cache of registry lookups keyed by feed URL
+
+    Saves /api/convert a database query per request. A snapshot is kept
+    until its feed's next refresh is due, and a URL without one is looked
+    up again after FEED_MIN_REFRESH_INTERVAL; registering, unregistering or
+    refreshing a feed drops its lookup in the worker doing it.
+    """
+
+    def __init__(self, max_urls=1024, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_urls (int): Maximum number of cached URLs; 0 disables the
+                cache
+            max_bytes (int): Maximum total size of cached bodies in bytes
+        """
+        self.max_urls = max_urls
+        self.max_bytes = max_bytes
+        self._lookups = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    def get(self, url):
+        """
+        Find the current lookup of a URL
+
+        Args:
+            url (str): URL of the iCal feed
+
+        Returns:
+            SnapshotLookup: Lookup, or None if the registry has to be queried
+        """
+        if self.max_urls <= 0:
+            return None
+
+        with self._lock:
+            lookup = self._lookups.get(url)
+            if lookup is None:
+                self._stats['misses'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='feed_snapshot', result='miss')
+                return None
+            if time.time() >= lookup.expires_at:
+                self._remove(url)
+                self._stats['expired'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='feed_snapshot', result='expired')
+                return None
+
+            self._lookups.move_to_end(url)
+            self._stats['hits'] += 1
+            metrics.CACHE_REQUESTS.inc(cache='feed_snapshot', result='hit')
+            return lookup
+
+    def store(self, url, lookup):
+        """
+        Keep the lookup of a URL
+
+        Args:
+            url (str): URL of the iCal feed
+            lookup (SnapshotLookup): Outcome of querying the registry
+        """
+        if self.max_urls <= 0 or lookup.size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(url)
+            self._lookups[url] = lookup
+            self._size += lookup.size
+
+            while len(self._lookups) > self.max_urls or self._size > self.max_bytes:
+                _, evicted = self._lookups.popitem(last=False)
+                self._size -= evicted.size
+                self._stats['evictions'] += 1
+
+    def discard(self, url):
+        """
+        Drop the lookup of a URL after its registration or snapshot changed
+
+        Args:
+            url (str): URL of the iCal feed
+        """
+        with self._lock:
+            if self._remove(url):
+                self._stats['invalidations'] += 1
+
+    def _remove(self, url):
+        lookup = self._lookups.pop(url, None)
+        if lookup is None:
+            return False
+        self._size -= lookup.size
+        return True
+
+    def stats(self):
+        """
+        Get cache counters and current occupancy
+
+        Returns:
+            dict: Hit/miss counters and cache size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['urls'] = len(self._lookups)
+            stats['bytes'] = self._size
+            stats['max_urls'] = self.max_urls
+            stats['max_bytes'] = self.max_bytes
+            return stats
+
+
+def fresh_snapshot(url, decode=True):
+    """
+    Get the snapshot of a registered feed if it is recent enough to serve
+
+    Must be called within an app context.
+
+    Args:
+        url (str): URL of the iCal feed
+        decode (bool): Include the decoded 'data'; without it the result
+            only carries the serialized 'json' body
+
+    Returns:
+        dict: Successful result like fetch_and_parse_ical's, with the
+            snapshot 'age' in seconds, or None if the URL is not registered
+            or its snapshot is missing or stale
+    """
+    lookup = snapshot_lookups.get(url)
+    if lookup is None:
+        lookup = _lookup_snapshot(url)
+        snapshot_lookups.store(url, lookup)
+    if lookup.body is None:
+        return None
+
+    age = max(0.0, time.time() - lookup.fetched_at)
+    if age > lookup.max_age:
+        return None
+
+    result = {
+        'success': True,
+        'json': lookup.body,
+        'etag': lookup.etag,
+        'age': age
+    }
+    if decode:
+        result['data'] = loads(lookup.body)
+    return result
+
+
+def _lookup_snapshot(url):
+    """Query the registry for the snapshot of a feed URL that can be served"""
+    now = time.time()
+    row = db.session.execute(
+        db.select(FeedSnapshot, Feed.refresh_interval, Feed.next_refresh_at)
+        .join(Feed, FeedSnapshot.feed_id == Feed.id)
+        .where(Feed.url == url)
+        .options(db.undefer(FeedSnapshot.body))).first()
+    if row is None:
+        return SnapshotLookup(now + FEED_MIN_REFRESH_INTERVAL)
+
+    snapshot, refresh_interval, next_refresh_at = row
+    max_age = refresh_interval + FEED_SNAPSHOT_MAX_LAG
+    served_until = snapshot.fetched_at + max_age
+    if now >= served_until:
+        # The refresh is overdue; check again once the scheduler caught up
+        return SnapshotLookup(now + FEED_SCHEDULER_TICK)
+
+    # The snapshot holds until the next refresh may replace it
+    expires_at = min(max(next_refresh_at, now + FEED_SCHEDULER_TICK), served_until)
+    return SnapshotLookup(expires_at, snapshot.body, snapshot.etag,
+                          snapshot.fetched_at, max_age)
+
+
+# Registry lookups shared by all requests served by this worker
+snapshot_lookups = SnapshotLookupCache(
+    max_urls=FEED_SNAPSHOT_CACHE_MAX_URLS,
+    max_bytes=FEED_SNAPSHOT_CACHE_MAX_BYTES,
+)
+
+
+# Scheduler of this worker, started by the app
+feed_scheduler = FeedScheduler(
+    max_concurrency=FEED_REFRESH_CONCURRENCY,
+    tick=FEED_SCHEDULER_TICK,
+    lock_path=FEED_SCHEDULER_LOCK_PATH,
+)
+feed_scheduler.register('feed', Feed, Feed.next_refresh_at, refresh_feed)
@@ -0,0 +1,175 @@
+import os
+import re
+import logging
+import metrics
+
+# Base URL of the Glide tables API, overridable to point at a stand-in
+GLIDE_API_URL = os.environ.get('GLIDE_API_URL', "https://api.glideapps.com/tables").rstrip('/')
+
+# Pattern to extract type from description [Type]
+TYPE_PATTERN = re.compile(r'\[(.*?)\]')
+
+
+def glide_table_url(table_id):
+    """
+    Build the Glide API URL of a table
+    
+    Args:
+        table_id (str): Glide table ID
+        
+    Returns:
+        str: Glide API table URL
+    """
+    return f"{GLIDE_API_URL}/{table_id}"
+
+
+def extract_type_from_description(description):
+    """
+    Extract type from description field using [Type] pattern
+    
+    Args:
+        description (str): Event description
+        
+    Returns:
+        str: Extracted type or empty string if not found
+    """
+    if not description:
+        return ""
+
+    match = TYPE_PATTERN.search(description)
+    if match:
+        return match.group(1).strip()
+    return ""
+
+
+@metrics.stage('build_rows')
+def build_glide_rows(events_data):
+    """
+    Build the Glide rows for organized events
+    
+    Args:
+        events_data (list): Top-level events of a parsed calendar
+        
+    Returns:
+        tuple: (trip rows, event rows); top-level events become trips and
+            their subevents become events of the trip
+    """
+    # Process top-level events (trips)
+    trips_to_update = []
+    events_to_update = []
+
+    # Organize events by trip and subevents
+    logging.debug(f"Processing {len(events_data)} events from iCal")
+
+    for event in events_data:
+        # Skip events without UIDs
+        if not event.get('uid'):
+            continue
+
+        # Process main trip event
+        event_uid = event.get('uid')
+        event_name = event.get('summary', '')
+        event_location = event.get('location', '')
+
+        # Get start and end times
+        start_date = None
+        end_date = None
+
+        if 'start' in event and 'datetime' in event['start']:
+            start_date = event['start']['datetime']
+
+        if 'end' in event and 'datetime' in event['end']:
+            end_date = event['end']['datetime']
+
+        # Create trip row
+        trip_row = {
+            "uid": event_uid,
+            "name": event_name,
+            "ZS0Be": event_location
+        }
+
+        if start_date:
+            trip_row["startDate"] = start_date
+        if end_date:
+            trip_row["endDate"] = end_date
+
+        trips_to_update.append(trip_row)
+
+        # Process subevents
+        if 'subevents' in event and event['subevents']:
+            for subevent in event['subevents']:
+                if not subevent.get('uid'):
+                    continue
+
+                subevent_uid = subevent.get('uid')
+                subevent_summary = subevent.get('summary', '')
+                subevent_description = subevent.get('description', '')
+                subevent_location = subevent.get('location', '')
+
+                # Extract event type from description [Type]
+                event_type = extract_type_from_description(
+                    subevent_description)
+
+                # Get start and end times
+                subevent_start = None
+                subevent_end = None
+
+                if 'start' in subevent and 'datetime' in subevent['start']:
+                    subevent_start = subevent['start']['datetime']
+
+                if 'end' in subevent and 'datetime' in subevent['end']:
+                    subevent_end = subevent['end']['datetime']
+
+                # Create event row
+                event_row = {
+                    "uid": subevent_uid,
+                    "tripUID": event_uid,
+                    "summary": subevent_summary
+                }
+
+                if event_type:
+                    event_row["type"] = event_type
+                if subevent_location:
+                    event_row["location"] = subevent_location
+                if subevent_start:
+                    event_row["startDate"] = subevent_start
+                if subevent_end:
+                    event_row["endDate"] = subevent_end
+
+                events_to_update.append(event_row)
+
+    return trips_to_update, events_to_update
+
+
+def sync_summary(results, trips_api_url, events_api_url):
+    """
+    Summarize the outcome of a sync
+    
+    Args:
+        results (dict): sync_tables result for the trips and events tables
+        trips_api_url (str): Glide API URL of the trips table
+        events_api_url (str): Glide API URL of the events table
+        
+    Returns:
+        dict: Overall 'success' and a summary per table
+    """
+    trips_success, trips_message, trips_count, trips_changes = results[
+        trips_api_url]
+    events_success, events_message, events_count, events_changes = results[
+        events_api_url]
+
+    return {
+        "success": trips_success and events_success,
+        "trips": {
+            "success": trips_success,
+            "message": trips_message,
+            "synced_count": trips_count,
+            **trips_changes
+        },
+        "events": {
+            "success": events_success,
+            "message": events_message,
+            "synced_count": events_count,
+            **events_changes
+        }
+    }
@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+
+
+class TableSnapshot:
+    """
+    Rows of a Glide table as of a known table version
+    """
+
+    def __init__(self, rows, etag):
+        self.rows = rows
+        self.etag = etag
+        self.taken_at = time.monotonic()
+
+    def age(self):
+        """Seconds since the rows were read from or written to Glide"""
+        return time.monotonic() - self.taken_at
+
+
+class TableSnapshotCache:
+    """
+    LRU cache of Glide table snapshots, bounded by number of tables and rows
+
+    A sync starting from a snapshot writes against the snapshot's ETag
+    without reading the table first. If the table changed meanwhile, Glide
+    answers 412 and the sync reads the table again. Snapshots are keyed by
+    table URL and Authorization header, so a token only ever uses snapshots
+    of reads and writes made with it.
+    """
+
+    def __init__(self, max_tables=32, max_rows=200000, max_age=300):
+        """
+        Args:
+            max_tables (int): Maximum number of cached tables; 0 disables
+                the cache
+            max_rows (int): Maximum total number of cached rows
+            max_age (int): Seconds after which a snapshot is read again,
+                which bounds how long edits made in Glide go unnoticed by
+                syncs that have nothing to write
+        """
+        self.max_tables = max_tables
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self._snapshots = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'invalidations': 0,
+            'evictions': 0,
+        }
+
+    def get(self, api_url, headers):
+        """
+        Find a recent snapshot of a table
+
+        Args:
+            api_url (str): Glide API table URL
+            headers (dict): Headers of the sync's API requests
+
+        Returns:
+            TableSnapshot: Snapshot, or None if there is none recent enough
+        """
+        if self.max_tables <= 0:
+            return None
+
+        key = _snapshot_key(api_url, headers)
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                self._stats['misses'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='glide_snapshot', result='miss')
+                return None
+            if snapshot.age() >= self.max_age:
+                self._remove(key)
+                self._stats['expired'] += 1
+                metrics.CACHE_REQUESTS.inc(cache='glide_snapshot', result='expired')
+                return None
+
+            self._snapshots.move_to_end(key)
+            self._stats['hits'] += 1
+            metrics.CACHE_REQUESTS.inc(cache='glide_snapshot', result='hit')
+            return snapshot
+
+    def store(self, api_url, headers, rows, etag):
+        """
+        Keep the rows of a table after reading or writing them
+
+        Without an ETag, writes from the snapshot could not be checked
+        against concurrent edits, so the table is not kept.
+
+        Args:
+            api_url (str): Glide API table URL
+            headers (dict): Headers of the sync's API requests
+            rows (list): Every row of the table; not modified afterwards
+            etag (str): Table version of the rows, or None
+        """
+        if self.max_tables <= 0:
+            return
+        if not etag or len(rows) > self.max_rows:
+            self.discard(api_url, headers)
+            return
+
+        key = _snapshot_key(api_url, headers)
+        with self._lock:
+            self._remove(key)
+            self._snapshots[key] = TableSnapshot(rows, etag)
+            self._rows += len(rows)
+
+            while len(self._snapshots) > self.max_tables or self._rows > self.max_rows:
+                _, evicted = self._snapshots.popitem(last=False)
+                self._rows -= len(evicted.rows)
+                self._stats['evictions'] += 1
+
+    def discard(self, api_url, headers):
+        """
+        Drop the snapshot of a table, e.g. after Glide rejected a write
+
+        Args:
+            api_url (str): Glide API table URL
+            headers (dict): Headers of the sync's API requests
+        """
+        key = _snapshot_key(api_url, headers)
+        with self._lock:
+            if self._remove(key):
+                self._stats['invalidations'] += 1
+
+    def _remove(self, key):
+        snapshot = self._snapshots.pop(key, None)
+        if snapshot is None:
+            return False
+        self._rows -= len(snapshot.rows)
+        return True
+
+    def stats(self):
+        """
+        Get cache counters and current occupancy
+
+        Returns:
+            dict: Hit/miss counters and cache size
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['tables'] = len(self._snapshots)
+            stats['rows'] = self._rows
+            stats['max_tables'] = self.max_tables
+            stats['max_rows'] = self.max_rows
+            stats['max_age'] = self.max_age
+            return stats
+
+
+def _snapshot_key(api_url, headers):
+    """Key a table URL by a hash of the token it is accessed with"""
+    token = headers.get('Authorization', '').encode('utf-8')
+    return api_url, hashlib.sha256(token).hexdigest()
+
+
+# Snapshots shared by all syncs run by this worker
+table_snapshots = TableSnapshotCache(
+    max_tables=int(os.environ.get('GLIDE_SNAPSHOT_MAX_TABLES', 32)),
+    max_rows=int(os.environ.get('GLIDE_SNAPSHOT_MAX_ROWS', 200000)),
+    max_age=int(os.environ.get('GLIDE_SNAPSHOT_MAX_AGE', 300)),
+)
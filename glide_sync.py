@@ -0,0 +1,811 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import contextvars
+import requests
+from concurrent.futures import ThreadPoolExecutor, wait
+from http_session import get_session, get_write_session
+from glide_snapshots import table_snapshots
+from serializers import dumps
+import metrics
+import profiling
+
+# Above this many row-level writes a single full-table PUT is cheaper
+GLIDE_MAX_ROW_WRITES = int(os.environ.get('GLIDE_MAX_ROW_WRITES', 100))
+
+# Seconds all tables of one sync may take together
+GLIDE_SYNC_DEADLINE = int(os.environ.get('GLIDE_SYNC_DEADLINE', 60))
+
+# Rows requested per page when reading a table; 0 leaves it to Glide
+GLIDE_PAGE_SIZE = int(os.environ.get('GLIDE_PAGE_SIZE', 0))
+
+# Most rows, and encoded bytes of rows, sent in one write request; larger
+# writes are split into batches. A single row larger than the byte limit is
+# sent on its own.
+GLIDE_WRITE_BATCH_ROWS = int(os.environ.get('GLIDE_WRITE_BATCH_ROWS', 500))
+GLIDE_WRITE_BATCH_BYTES = int(os.environ.get('GLIDE_WRITE_BATCH_BYTES', 4 * 1024 * 1024))
+
+# Attempts of each write request on connection errors and 429/5xx answers
+GLIDE_WRITE_ATTEMPTS = int(os.environ.get('GLIDE_WRITE_ATTEMPTS', 3))
+
+# Tables with more rows are not held in memory by a sync: they are compared
+# page by page, and read a second time for a full-table write
+GLIDE_SYNC_MAX_ROWS_IN_MEMORY = int(os.environ.get('GLIDE_SYNC_MAX_ROWS_IN_MEMORY', 100000))
+
+# Table syncs running at once, shared by all requests of this worker and by
+# both entry points; further table syncs wait for a thread
+GLIDE_SYNC_THREADS = int(os.environ.get('GLIDE_SYNC_THREADS', 8))
+
+_table_sync_executor = ThreadPoolExecutor(
+    max_workers=GLIDE_SYNC_THREADS,
+    thread_name_prefix='glide-sync')
+
+# Status codes meaning the row-level endpoints cannot be used for this table
+ROW_ENDPOINT_UNSUPPORTED = (404, 405, 501)
+
+# Status codes after which a write request is sent again
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _PreconditionFailed(Exception):
+    """Raised when Glide rejects a write because the table changed"""
+
+
+class _RowEndpointUnsupported(Exception):
+    """Raised when Glide rejects a row-level write for this table"""
+
+
+def diff_rows(current_rows, rows_to_update):
+    """
+    Compare the rows to sync with the rows currently in a Glide table
+
+    Args:
+        current_rows (list): Rows returned by the Glide API
+        rows_to_update (list): Rows to update or add, matched by 'uid'
+
+    Returns:
+        dict: 'added' rows, 'updated' changes as (row, changed fields) pairs,
+            'unchanged' count, the merged 'final_rows' for a full write and
+            their 'row_count'
+    """
+    # Create a copy of all existing rows to preserve them
+    final_rows_by_uid = {
+        row.get('uid'): row.copy()
+        for row in current_rows if 'uid' in row
+    }
+
+    desired_by_uid = _desired_rows(rows_to_update)
+
+    added = []
+    updated = []
+    unchanged = 0
+    for uid, row in desired_by_uid.items():
+        current = final_rows_by_uid.get(uid)
+        if current is None:
+            # This is a new row
+            added.append(row)
+            final_rows_by_uid[uid] = row
+            continue
+
+        changes = {
+            key: value
+            for key, value in row.items() if current.get(key) != value
+        }
+        if changes:
+            updated.append((current.copy(), changes))
+            # Update existing row while preserving fields not in the update
+            current.update(row)
+        else:
+            unchanged += 1
+
+    return {
+        'added': added,
+        'updated': updated,
+        'unchanged': unchanged,
+        'final_rows': list(final_rows_by_uid.values()),
+        'row_count': len(final_rows_by_uid)
+    }
+
+
+def _desired_rows(rows_to_update):
+    """Merge the rows to sync by uid; later rows for the same uid win"""
+    desired_by_uid = {}
+    for row in rows_to_update:
+        uid = row.get('uid')
+        if uid in desired_by_uid:
+            desired_by_uid[uid].update(row)
+        else:
+            desired_by_uid[uid] = dict(row)
+    return desired_by_uid
+
+
+class _PagedDiff:
+    """
+    diff_rows over a table read page by page
+
+    Rows are kept while the table has at most GLIDE_SYNC_MAX_ROWS_IN_MEMORY
+    of them, and then diffed with diff_rows. Beyond that, each page is
+    compared as it arrives and only the changes are kept; the result has no
+    'final_rows', and a full write gets them from merge over the table read
+    again.
+    """
+
+    def __init__(self, rows_to_update):
+        self.rows_to_update = rows_to_update
+        self.rows = []
+        self._desired_by_uid = None
+        self._seen = set()
+        self._updated = []
+        self._unchanged = 0
+        self._row_count = 0
+
+    def add_page(self, page_rows):
+        """Compare the next page of the table"""
+        if self.rows is not None:
+            self.rows.extend(page_rows)
+            if len(self.rows) <= GLIDE_SYNC_MAX_ROWS_IN_MEMORY:
+                return
+            # Too many rows to keep: compare them and keep only the changes
+            page_rows, self.rows = self.rows, None
+            self._desired_by_uid = _desired_rows(self.rows_to_update)
+            logging.debug("Glide table exceeds GLIDE_SYNC_MAX_ROWS_IN_MEMORY, "
+                          "comparing it page by page")
+
+        for row in page_rows:
+            if 'uid' not in row:
+                continue
+            self._row_count += 1
+            desired = self._desired_by_uid.get(row['uid'])
+            if desired is None:
+                continue
+            self._seen.add(row['uid'])
+            changes = {
+                key: value
+                for key, value in desired.items() if row.get(key) != value
+            }
+            if changes:
+                self._updated.append((row, changes))
+            else:
+                self._unchanged += 1
+
+    def result(self):
+        """
+        Returns:
+            dict: Same as diff_rows, with 'final_rows' None if the table was
+                too large to keep
+        """
+        if self.rows is not None:
+            return diff_rows(self.rows, self.rows_to_update)
+
+        added = [
+            row for uid, row in self._desired_by_uid.items()
+            if uid not in self._seen
+        ]
+        return {
+            'added': added,
+            'updated': self._updated,
+            'unchanged': self._unchanged,
+            'final_rows': None,
+            'row_count': self._row_count + len(added)
+        }
+
+    def merge(self, page_rows):
+        """Yield the rows of a page read again, as they are after the sync"""
+        for row in page_rows:
+            if 'uid' not in row:
+                continue
+            desired = self._desired_by_uid.get(row['uid'])
+            yield row if desired is None else {**row, **desired}
+
+
+class _BatchEncoder:
+    """
+    Encode rows one by one into JSON arrays within the write batch limits
+    """
+
+    def __init__(self):
+        self.rows = []
+        self._encoded = []
+        self._size = 0
+
+    def add(self, row):
+        """
+        Add a row to the current batch
+
+        Returns:
+            tuple: The previous batch as (rows, JSON array), if the row did
+                not fit in it, otherwise None
+        """
+        encoded = dumps(row)
+        batch = None
+        if self.rows and (len(self.rows) >= GLIDE_WRITE_BATCH_ROWS or
+                          self._size + len(encoded) + 1 > GLIDE_WRITE_BATCH_BYTES):
+            batch = self.flush()
+        self.rows.append(row)
+        self._encoded.append(encoded)
+        self._size += len(encoded) + 1
+        return batch
+
+    def flush(self):
+        """
+        Take the current batch
+
+        Returns:
+            tuple: (rows, JSON array), or None if the batch is empty
+        """
+        if not self.rows:
+            return None
+        batch = self.rows, b'[' + b','.join(self._encoded) + b']'
+        self.rows = []
+        self._encoded = []
+        self._size = 0
+        return batch
+
+
+def _batches(rows):
+    """Encode rows into write batches, yielding (rows, JSON array) tuples"""
+    encoder = _BatchEncoder()
+    for row in rows:
+        batch = encoder.add(row)
+        if batch is not None:
+            yield batch
+    batch = encoder.flush()
+    if batch is not None:
+        yield batch
+
+
+def _empty_counts():
+    """Counts of a table sync that has not compared or written anything"""
+    return {
+        'added': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'progress': {'batches_written': 0, 'rows_written': 0}
+    }
+
+
+def sync_tables(headers, rows_by_table, deadline=GLIDE_SYNC_DEADLINE):
+    """
+    Sync several independent Glide tables concurrently
+
+    Args:
+        headers (dict): Headers for API requests
+        rows_by_table (dict): Rows to update or add, keyed by Glide API table URL
+        deadline (float): Seconds all table syncs may take together
+
+    Returns:
+        dict: sync_table_with_etag_handling result for each table URL. Tables
+            whose sync failed or did not finish in time get a failed result.
+    """
+    futures = _submit_table_syncs(headers, rows_by_table, deadline)
+    wait(futures.values(), timeout=deadline)
+    return _table_sync_results(futures, deadline)
+
+
+async def async_sync_tables(headers, rows_by_table, deadline=GLIDE_SYNC_DEADLINE):
+    """
+    Sync several independent Glide tables without blocking the event loop
+
+    The tables are synced by sync_table_with_etag_handling on the same
+    threads as sync_tables, and the event loop only waits for them, so both
+    entry points share the diff, the batched writes and the retries. The
+    Glide requests are therefore not multiplexed on the event loop: at most
+    GLIDE_SYNC_THREADS tables are synced at once per worker, and the syncs
+    of further tables, from this or other requests, wait for a thread.
+
+    Args:
+        headers (dict): Headers for API requests
+        rows_by_table (dict): Rows to update or add, keyed by Glide API table URL
+        deadline (float): Seconds all table syncs may take together
+
+    Returns:
+        dict: Same as sync_tables
+    """
+    futures = _submit_table_syncs(headers, rows_by_table, deadline)
+    if futures:
+        await asyncio.wait([asyncio.wrap_future(future) for future in futures.values()],
+                           timeout=deadline)
+    return _table_sync_results(futures, deadline)
+
+
+def _submit_table_syncs(headers, rows_by_table, deadline):
+    """
+    Start syncing each table on the table sync threads
+
+    Returns:
+        dict: Future of each table's sync, keyed by table URL
+    """
+    expires_at = time.monotonic() + deadline
+    # Each table sync runs in the caller's context, for its Server-Timing and
+    # profile
+    return {
+        api_url: _table_sync_executor.submit(contextvars.copy_context().run,
+                                             profiling.call,
+                                             sync_table_with_etag_handling,
+                                             api_url, headers, rows,
+                                             expires_at)
+        for api_url, rows in rows_by_table.items()
+    }
+
+
+def _table_sync_results(futures, deadline):
+    """
+    Collect the results of table syncs once the deadline has passed or all
+    of them finished, cancelling those that did not start
+
+    Returns:
+        dict: Result of each table's sync, keyed by table URL
+    """
+    results = {}
+    for api_url, future in futures.items():
+        counts = _empty_counts()
+        if not future.done():
+            future.cancel()
+            logging.error(f"Sync of Glide table {api_url} exceeded the deadline")
+            results[api_url] = (
+                False, f"Sync did not finish within {deadline} seconds", 0,
+                counts)
+            continue
+        try:
+            results[api_url] = future.result()
+        except Exception as e:
+            logging.error(f"Sync error for Glide table {api_url}: {str(e)}")
+            results[api_url] = (False, f"Error during sync process: {str(e)}",
+                                0, counts)
+    return results
+
+
+def sync_table_with_etag_handling(api_url, headers, rows_to_update, expires_at=None):
+    """
+    Sync data with Glide API table with ETag-based concurrency control
+
+    Only rows that are new or whose fields differ from the table are written,
+    through Glide's row-level add/update endpoints. The whole table is written
+    instead when many rows changed, when a changed row has no $rowID, or when
+    the row-level endpoints are not available.
+
+    The table is compared with its snapshot from the previous sync when
+    there is one, and the writes are made against the snapshot's ETag; only
+    if Glide answers 412 is the table read again. The snapshot is updated
+    with the rows written.
+
+    Writes are sent in batches of at most GLIDE_WRITE_BATCH_ROWS rows and
+    GLIDE_WRITE_BATCH_BYTES bytes, each retried on its own after connection
+    errors and 429/5xx answers. Tables with more than
+    GLIDE_SYNC_MAX_ROWS_IN_MEMORY rows are never held in memory as a whole.
+
+    Args:
+        api_url (str): Glide API table URL
+        headers (dict): Headers for API requests
+        rows_to_update (list): Rows to update or add
+        expires_at (float): time.monotonic() value after which no further
+            request is started, or None for no limit
+
+    Returns:
+        tuple: (success, message, row_count, counts) where counts holds the
+            number of 'added', 'updated' and 'unchanged' rows, and the
+            'progress' of the writes as the batches and rows Glide accepted
+    """
+    max_retries = 3
+    retries = 0
+    counts = _empty_counts()
+    progress = counts['progress']
+    snapshot = table_snapshots.get(api_url, headers)
+
+    while retries < max_retries:
+        if expires_at is not None and time.monotonic() >= expires_at:
+            return False, "Sync deadline exceeded", 0, counts
+
+        try:
+            if snapshot is not None:
+                etag = snapshot.etag
+                table = None
+                diff = diff_rows(snapshot.rows, rows_to_update)
+            else:
+                # Get current data with ETag
+                table = _PagedDiff(rows_to_update)
+                with metrics.stage('glide_get'):
+                    etag = _read_table(api_url, headers, table, expires_at)
+                if not etag:
+                    logging.warning("No ETag received from Glide API")
+                diff = table.result()
+
+                logging.debug(
+                    f"Received {diff['row_count'] - len(diff['added'])} rows "
+                    f"from Glide API table {api_url}"
+                )
+
+            final_rows = diff['final_rows']
+            row_count = diff['row_count']
+            counts = {
+                'added': len(diff['added']),
+                'updated': len(diff['updated']),
+                'unchanged': diff['unchanged'],
+                'progress': progress
+            }
+
+            if not diff['added'] and not diff['updated']:
+                if snapshot is None and final_rows is not None:
+                    table_snapshots.store(api_url, headers, final_rows, etag)
+                return True, f"No changes to sync for {row_count} rows", row_count, counts
+
+            row_writes = len(diff['updated']) + -(-len(diff['added']) // max(
+                1, GLIDE_WRITE_BATCH_ROWS))
+            row_ids_known = all(
+                row.get('$rowID') for row, _ in diff['updated'])
+            if final_rows is None:
+                final_rows = _merged_table_rows(api_url, headers, table, diff['added'],
+                                                expires_at)
+
+            with metrics.stage('glide_write'):
+                try:
+                    if row_writes <= GLIDE_MAX_ROW_WRITES and row_ids_known:
+                        etag = _write_row_changes(api_url, headers, etag, diff,
+                                                  expires_at, progress)
+                    else:
+                        etag = _write_full_table(api_url, headers, etag, final_rows,
+                                                 expires_at, progress)
+                except _RowEndpointUnsupported as e:
+                    logging.warning(
+                        f"Row-level write rejected ({str(e)}), writing the full table")
+                    etag = _write_full_table(api_url, headers, etag, final_rows,
+                                             expires_at, progress)
+            if diff['final_rows'] is not None:
+                table_snapshots.store(api_url, headers, diff['final_rows'], etag)
+            else:
+                table_snapshots.discard(api_url, headers)
+
+            return True, (
+                f"Successfully synced {row_count} rows "
+                f"({counts['added']} added, {counts['updated']} updated, "
+                f"{counts['unchanged']} unchanged)"), row_count, counts
+
+        except _PreconditionFailed:
+            # If we get a 412 (Precondition Failed), retry the operation
+            logging.warning(
+                "Optimistic concurrency conflict detected, retrying...")
+            # The table changed since it was read; read it again
+            table_snapshots.discard(api_url, headers)
+            snapshot = None
+            metrics.GLIDE_RETRIES.inc()
+            retries += 1
+            continue
+        except requests.RequestException as e:
+            # Only retry on optimistic concurrency conflicts
+            response = getattr(e, 'response', None)
+            status_code = None
+            if response is not None:
+                status_code = getattr(response, 'status_code', None)
+
+            # Writes may have been made before the error
+            table_snapshots.discard(api_url, headers)
+            snapshot = None
+            if retries >= max_retries - 1 or status_code != 412:
+                logging.error(f"API request error: {str(e)}")
+                return False, f"Error communicating with Glide API: {str(e)}", 0, counts
+
+            metrics.GLIDE_RETRIES.inc()
+            retries += 1
+
+    return False, "Maximum retries exceeded for optimistic concurrency control", 0, counts
+
+
+def _pages(api_url, headers, expires_at=None):
+    """
+    Read the rows of a Glide table page by page, following continuations
+
+    Args:
+        api_url (str): Glide API table URL
+        headers (dict): Headers for API requests
+        expires_at (float): time.monotonic() deadline for the requests, or None
+
+    Yields:
+        tuple: (rows of the page, table version or None if Glide did not
+            report one)
+    """
+    params = _page_params()
+    while True:
+        response = get_session().get(f"{api_url}/rows", headers=headers,
+                                     params=params, timeout=_remaining(expires_at))
+        response.raise_for_status()
+        page = response.json()
+        yield page.get('data', []), _next_etag(response)
+
+        continuation = page.get('continuation')
+        if not continuation:
+            return
+        params['continuation'] = continuation
+
+
+def _read_table(api_url, headers, table, expires_at=None):
+    """
+    Read every row of a Glide table into a _PagedDiff
+
+    Writes are made against the version of the first page: if the table
+    changed while later pages were read, the writes fail with 412 and the
+    table is read again.
+
+    Args:
+        api_url (str): Glide API table URL
+        headers (dict): Headers for API requests
+        table (_PagedDiff): Comparison the pages are added to
+        expires_at (float): time.monotonic() deadline for the requests, or None
+
+    Returns:
+        str: Table version, or None if Glide did not report one
+    """
+    etag = None
+    first_page = True
+    for page_rows, page_etag in _pages(api_url, headers, expires_at):
+        if first_page:
+            etag = page_etag
+            first_page = False
+        table.add_page(page_rows)
+    return etag
+
+
+def _merged_table_rows(api_url, headers, table, added, expires_at=None):
+    """
+    Read a table too large to keep in memory again, yielding every row as it
+    is after the sync, followed by the added rows
+
+    A row edited in Glide since the first read is written as read now; as
+    the write is made against the ETag of the first read, Glide rejects it
+    with 412 in that case.
+    """
+    for page_rows, _ in _pages(api_url, headers, expires_at):
+        yield from table.merge(page_rows)
+    yield from added
+
+
+def _page_params():
+    """Query parameters of the first page of a table read"""
+    return {'limit': GLIDE_PAGE_SIZE} if GLIDE_PAGE_SIZE > 0 else {}
+
+
+def _write_full_table(api_url, headers, etag, final_rows, expires_at=None,
+                      progress=None):
+    """
+    Overwrite the whole Glide table with the merged rows
+
+    Rows are encoded batch by batch as they are consumed. A table that fits
+    in one batch is written with a single PUT. Larger tables are uploaded
+    batch by batch to a Glide stash, and the table is then overwritten with
+    the stash's rows, so no request body holds more than one batch and a
+    failed batch is sent again on its own.
+
+    Args:
+        api_url (str): Glide API table URL
+        headers (dict): Headers for API requests
+        etag (str): Table version the rows were merged against, or None
+        final_rows (iterable): Every row the table should contain
+        expires_at (float): time.monotonic() deadline for the requests, or None
+        progress (dict): Batches and rows written, updated as they are
+
+    Returns:
+        str: Table version after the write, or None if Glide did not report it
+    """
+    stash_id = uuid.uuid4().hex
+    stash_url = _stash_url(api_url, stash_id)
+    serial = 0
+    row_count = 0
+    pending = None
+    for batch in _batches(final_rows):
+        # Hold one batch back, to write a table of a single batch directly
+        if pending is not None:
+            _upload_stash_batch(stash_url, serial, headers, pending, expires_at,
+                                progress)
+            serial += 1
+        pending = batch
+        row_count += len(batch[0])
+
+    if serial == 0:
+        rows, body = pending if pending is not None else ([], b'[]')
+        response = _send('PUT', api_url, _if_match(headers, etag),
+                         b'{"rows":' + body + b'}', expires_at)
+        _check_write(response)
+        _record_batch(progress, len(rows))
+    else:
+        _upload_stash_batch(stash_url, serial, headers, pending, expires_at,
+                            progress)
+        response = _send('PUT', api_url, _if_match(headers, etag),
+                         dumps({'rows': {'$stashID': stash_id}}), expires_at)
+        _check_write(response)
+    metrics.GLIDE_ROWS_WRITTEN.inc(row_count, write='full')
+    return _next_etag(response)
+
+
+def _stash_url(api_url, stash_id):
+    """URL of a Glide stash, next to the tables of a table URL"""
+    return f"{api_url.rstrip('/').rsplit('/', 2)[0]}/stashes/{stash_id}"
+
+
+def _upload_stash_batch(stash_url, serial, headers, batch, expires_at=None,
+                        progress=None):
+    """Upload one batch of rows to a stash, under its serial number"""
+    rows, body = batch
+    response = _send('PUT', f"{stash_url}/{serial}", headers, body, expires_at)
+    _check_write(response)
+    _record_batch(progress, len(rows))
+
+
+def _write_row_changes(api_url, headers, etag, diff, expires_at=None, progress=None):
+    """
+    Send only the new and changed rows to the Glide table
+
+    Every write changes the table version, so each write is made against the
+    ETag returned by the previous one when Glide provides it. Added rows are
+    sent in batches and get the $rowID Glide assigned them.
+
+    Args:
+        api_url (str): Glide API table URL
+        headers (dict): Headers for API requests
+        etag (str): Table version the diff was computed against, or None
+        diff (dict): Result of diff_rows
+        expires_at (float): time.monotonic() deadline for the requests, or None
+        progress (dict): Batches and rows written, updated as they are
+
+    Returns:
+        str: Table version after the writes, or None if Glide did not report it
+
+    Raises:
+        _RowEndpointUnsupported: If Glide rejects the first row-level write
+    """
+    first_write = True
+
+    for rows, body in _batches(diff['added']):
+        # An add sent again without If-Match could add its rows twice
+        response = _send('POST', f"{api_url}/rows", _if_match(headers, etag),
+                         body, expires_at, retry=bool(etag))
+        _check_write(response, unsupported_ok=first_write)
+        metrics.GLIDE_ROWS_WRITTEN.inc(len(rows), write='row')
+        _record_batch(progress, len(rows))
+        _set_row_ids(rows, response)
+        etag = _next_etag(response)
+        first_write = False
+
+    for row, changes in diff['updated']:
+        response = _send('PATCH', f"{api_url}/rows/{row['$rowID']}",
+                         _if_match(headers, etag), dumps(changes), expires_at)
+        _check_write(response, unsupported_ok=first_write)
+        metrics.GLIDE_ROWS_WRITTEN.inc(write='row')
+        _record_batch(progress, 1)
+        etag = _next_etag(response)
+        first_write = False
+    return etag
+
+
+def _send(method, url, headers, body, expires_at=None, retry=True):
+    """
+    Send a write request with a JSON body, sending it again after connection
+    errors and 429/5xx answers, up to GLIDE_WRITE_ATTEMPTS times in all
+
+    Args:
+        method (str): HTTP method
+        url (str): Request URL
+        headers (dict): Headers for the request
+        body (bytes): Encoded JSON body
+        expires_at (float): time.monotonic() deadline for the request, or None
+        retry (bool): Whether the request may be sent more than once
+
+    Returns:
+        requests.Response: Response to the last attempt
+
+    Raises:
+        requests.RequestException: If the last attempt failed, or the
+            deadline passed
+    """
+    headers = dict(headers, **{'Content-Type': 'application/json'})
+    attempt = 1
+    while True:
+        try:
+            response = get_write_session().request(method, url, headers=headers,
+                                                   data=body,
+                                                   timeout=_remaining(expires_at))
+            if (not retry or attempt >= GLIDE_WRITE_ATTEMPTS or
+                    response.status_code not in RETRY_STATUSES):
+                return response
+        except requests.Timeout:
+            raise
+        except requests.ConnectionError as e:
+            if not retry or attempt >= GLIDE_WRITE_ATTEMPTS:
+                raise
+            response = None
+            logging.warning(f"Glide write failed ({str(e)}), sending it again")
+
+        metrics.GLIDE_WRITE_RETRIES.inc()
+        time.sleep(_retry_delay(attempt, response, expires_at))
+        attempt += 1
+
+
+def _retry_delay(attempt, response, expires_at):
+    """
+    Seconds to wait before sending a write again: the Retry-After of the
+    response if it has one, otherwise an exponential backoff
+
+    Raises:
+        requests.Timeout: If the deadline passed
+    """
+    delay = 0.5 * 2 ** (attempt - 1)
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            pass
+    remaining = _remaining(expires_at)
+    return delay if remaining is None else min(delay, remaining)
+
+
+def _record_batch(progress, rows):
+    """Count a write Glide accepted in the progress of a sync"""
+    if progress is not None:
+        progress['batches_written'] += 1
+        progress['rows_written'] += rows
+
+
+def _remaining(expires_at):
+    """Seconds left before a deadline, for use as a request timeout"""
+    if expires_at is None:
+        return None
+    remaining = expires_at - time.monotonic()
+    if remaining <= 0:
+        raise requests.Timeout("Sync deadline exceeded")
+    return remaining
+
+
+def _if_match(headers, etag):
+    """Copy the request headers, adding If-Match when a table version is known"""
+    write_headers = headers.copy()
+    if etag:
+        write_headers['If-Match'] = etag
+    return write_headers
+
+
+def _next_etag(response):
+    """Get the table version after a write, if Glide reported it"""
+    etag = response.headers.get('ETag')
+    return etag.lstrip('W/') if etag else None
+
+
+def _set_row_ids(rows, response):
+    """Give added rows the $rowID Glide assigned them, if it returned them"""
+    try:
+        body = response.json()
+    except ValueError:
+        return
+    data = body.get('data', body) if isinstance(body, dict) else None
+    row_ids = data.get('rowIDs') if isinstance(data, dict) else None
+    if isinstance(row_ids, list) and len(row_ids) == len(rows):
+        for row, row_id in zip(rows, row_ids):
+            row['$rowID'] = row_id
+
+
+def _check_write(response, unsupported_ok=False):
+    """
+    Check the outcome of a write to the Glide API
+
+    Args:
+        response (requests.Response): Response to the write
+        unsupported_ok (bool): Whether a "not supported" status may fall back
+            to a full-table write
+
+    Raises:
+        _PreconditionFailed: On 412, so the sync is retried from a fresh read
+        _RowEndpointUnsupported: On a "not supported" status, if allowed
+        requests.HTTPError: On any other unsuccessful status
+    """
+    if response.status_code == 412:
+        raise _PreconditionFailed()
+    if unsupported_ok and response.status_code in ROW_ENDPOINT_UNSUPPORTED:
+        raise _RowEndpointUnsupported(f"HTTP Status: {response.status_code}")
+    if response.status_code not in (200, 201, 204):
+        try:
+            response_body = response.json()
+        except ValueError:
+            response_body = response.text
+        message = f"Unexpected response from Glide API: {response_body}"
+        logging.error(message)
+        raise requests.HTTPError(message, response=response)
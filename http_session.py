@@ -0,0 +1,163 @@
+import os
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Number of hosts to keep connection pools for
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', 20))
+# Keep-alive connections kept open per host
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', 10))
+# Retries for connection errors, and 502/503/504 answers to GET and HEAD requests
+HTTP_RETRY_TOTAL = int(os.environ.get('HTTP_RETRY_TOTAL', 2))
+HTTP_RETRY_BACKOFF = float(os.environ.get('HTTP_RETRY_BACKOFF', 0.3))
+# Upstream connections open at once per event loop in async mode
+ASYNC_HTTP_MAX_CONNECTIONS = int(os.environ.get('ASYNC_HTTP_MAX_CONNECTIONS', 200))
+
+_lock = threading.Lock()
+# Sessions of this worker by name, with the process they were created in
+_sessions = {}
+_async_clients = {}
+
+
+def _build_session(retries=True):
+    """
+    Create a session with keep-alive pools and the configured retry policy
+
+    Args:
+        retries (bool): Whether the session retries failed requests itself
+
+    Returns:
+        requests.Session: New session
+    """
+    retry = 0
+    if retries:
+        retry = Retry(
+            total=HTTP_RETRY_TOTAL,
+            connect=HTTP_RETRY_TOTAL,
+            read=0,
+            status=HTTP_RETRY_TOTAL,
+            backoff_factor=HTTP_RETRY_BACKOFF,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                          pool_maxsize=HTTP_POOL_MAXSIZE,
+                          max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _get_session(name, retries):
+    """Get a session of this worker, creating it on first use in the process"""
+    pid = os.getpid()
+    entry = _sessions.get(name)
+    if entry is not None and entry[1] == pid:
+        return entry[0]
+
+    with _lock:
+        entry = _sessions.get(name)
+        if entry is None or entry[1] != pid:
+            entry = (_build_session(retries), pid)
+            _sessions[name] = entry
+        return entry[0]
+
+
+def get_session():
+    """
+    Get the HTTP session shared by this worker
+
+    The session is created on first use in each process, so gunicorn workers
+    never share sockets inherited from the master process.
+
+    Returns:
+        requests.Session: Session used for upstream feeds and Glide reads
+    """
+    return _get_session('default', retries=True)
+
+
+def get_write_session():
+    """
+    Get the HTTP session of this worker for Glide writes
+
+    Unlike get_session, the session never retries on its own: glide_sync
+    retries each write itself, so a write reaches Glide at most
+    GLIDE_WRITE_ATTEMPTS times.
+
+    Returns:
+        requests.Session: Session without transport retries
+    """
+    return _get_session('write', retries=False)
+
+
+def get_async_client():
+    """
+    Get the async HTTP client of the running event loop
+
+    The client keeps connections alive per host like the sync session and
+    retries failed connection attempts; it follows redirects as requests does.
+
+    Returns:
+        httpx.AsyncClient: Client used for upstream feeds
+
+    Raises:
+        RuntimeError: If httpx is not installed
+    """
+    if httpx is None:
+        raise RuntimeError('Async mode requires the httpx package')
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        transport = httpx.AsyncHTTPTransport(retries=HTTP_RETRY_TOTAL)
+        limits = httpx.Limits(max_connections=ASYNC_HTTP_MAX_CONNECTIONS,
+                              max_keepalive_connections=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE)
+        client = httpx.AsyncClient(transport=transport, limits=limits,
+                                   follow_redirects=True)
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """Close the async HTTP client of the running event loop, if any"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def pool_stats():
+    """
+    Get connection reuse counters for every host this worker talks to
+
+    Returns:
+        dict: Per-host requests sent, connections opened and requests that
+            reused a kept-alive connection
+    """
+    stats = {}
+    pid = os.getpid()
+    for session, session_pid in list(_sessions.values()):
+        if session_pid != pid:
+            continue
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                host = f"{pool.scheme}://{pool.host}:{pool.port}"
+                host_stats = stats.setdefault(host, {'requests': 0, 'connections': 0})
+                host_stats['requests'] += pool.num_requests
+                host_stats['connections'] += pool.num_connections
+    for host_stats in stats.values():
+        host_stats['reused'] = max(host_stats['requests'] - host_stats['connections'], 0)
+    return stats
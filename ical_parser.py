@@ -1,9 +1,37 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
 import requests
 import urllib.parse
 import logging
-from datetime import datetime
-from icalendar import Calendar, Event
+from datetime import datetime, date, timedelta
+from icalendar import Calendar, Component, Event, vDDDTypes
 import pytz
+from containment import assign_time_containment, normalize_time
+from event_record import EventRecord
+from feed_cache import feed_cache
+import metrics
+from http_session import get_session, get_async_client, httpx
+from ical_stream import CalendarStreamReader
+import parse_pool
+import profiling
+from parse_cache import parse_cache
+from recurrence import series_definition, cached_occurrences
+from serializers import encode_result, loads, json_backend
+from singleflight import SingleFlight, AsyncSingleFlight, SingleFlightTimeout
+
+# Bump whenever the parsed output changes so cached results are not reused
+CONVERTER_VERSION = '1'
+
+# 'tree' parses the whole feed with Calendar.from_ical, 'stream' parses the
+# response line by line without holding the full body or calendar in memory
+ICAL_PARSE_MODE = os.environ.get('ICAL_PARSE_MODE', 'tree')
+
+# Concurrent fetches of the same feed URL share a single download and parse
+inflight_fetches = SingleFlight()
+async_inflight_fetches = AsyncSingleFlight()
 
 def validate_url(url):
     """
@@ -41,22 +69,253 @@ def validate_url(url):
             'message': f'URL validation error: {str(e)}'
         }
 
-def fetch_and_parse_ical(url, timeout=10):
+def parse_window(start=None, end=None):
+    """
+    Parse the bounds of a time window given as ISO 8601 dates or datetimes
+    
+    Dates are taken as midnight UTC and datetimes without an offset as UTC.
+    
+    Args:
+        start (str): Start of the window, or None for no lower bound
+        end (str): End of the window, or None for no upper bound
+        
+    Returns:
+        dict: 'valid' flag with the parsed 'window' as a (start, end) tuple,
+            or None when no bound was given, or an error 'message'
+    """
+    bounds = []
+    for name, value in (('start', start), ('end', end)):
+        if value is None or value == '':
+            bounds.append(None)
+            continue
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            try:
+                parsed = datetime.combine(date.fromisoformat(str(value)),
+                                          datetime.min.time())
+            except ValueError:
+                return {
+                    'valid': False,
+                    'message': f'Invalid {name}: must be an ISO 8601 date or datetime'
+                }
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=pytz.UTC)
+        bounds.append(parsed)
+    
+    if bounds[0] is not None and bounds[1] is not None and bounds[0] >= bounds[1]:
+        return {
+            'valid': False,
+            'message': 'Invalid window: start must be before end'
+        }
+    
+    if bounds[0] is None and bounds[1] is None:
+        return {'valid': True, 'window': None}
+    return {'valid': True, 'window': tuple(bounds)}
+
+def fetch_and_parse_ical(url, timeout=10, window=None, expand=False):
     """
     Fetch iCal data from URL and parse it to JSON
     
+    Concurrent calls for the same URL are coalesced: one call fetches and
+    parses the feed while the others wait for its result, each for at most
+    its own timeout.
+    
+    Args:
+        url (str): URL of the iCal feed
+        timeout (int): Request timeout in seconds
+        window (tuple): Optional (start, end) datetimes from parse_window;
+            only events overlapping the window are converted
+        expand (bool): Whether recurring events are replaced by their
+            occurrences within the window, which must then be bounded
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+    """
+    # A profiled call fetches and parses on its own, in its own thread
+    if profiling.active():
+        return _fetch_and_parse(url, timeout, window, expand)
+    
+    key = (url, _variant_key(window, expand))
+    fetch = lambda: (_fetch_and_parse(url, timeout, window, expand), timeout)
+    try:
+        (result, leader_timeout), shared = inflight_fetches.do(
+            key, fetch, timeout=timeout)
+        
+        # A shared call that timed out on a shorter timeout than ours does not
+        # answer this call; fetch again, still coalescing with other callers
+        if shared and result.get('status_code') == 408 and leader_timeout < timeout:
+            (result, _), _ = inflight_fetches.do(
+                key, fetch, timeout=timeout - leader_timeout)
+        return result
+    except SingleFlightTimeout:
+        logging.error(f"Timed out waiting for in-flight fetch of URL: {url}")
+        return {
+            'success': False,
+            'message': f'Request timed out after {timeout} seconds',
+            'status_code': 408
+        }
+
+def _fetch_and_parse(url, timeout, window=None, expand=False):
+    """
+    Fetch iCal data from URL and parse it, going through the feed and parse caches
+    
+    Args:
+        url (str): URL of the iCal feed
+        timeout (int): Request timeout in seconds
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+    """
+    variant = _variant_key(window, expand)
+    # Parsing has to finish within the timeout too
+    deadline = time.monotonic() + timeout
+    try:
+        # Serve from the feed cache when the entry is recent enough; profiled
+        # calls always fetch and parse the feed
+        cached, fresh = (None, False) if profiling.active() else feed_cache.lookup(url)
+        if fresh and cached.can_answer(variant):
+            return _result_from_cache(cached, variant, window, expand, deadline)
+        
+        # Fetch iCal data, revalidating the cached copy if it can answer this call
+        streaming = ICAL_PARSE_MODE == 'stream'
+        headers = {}
+        if cached and cached.can_answer(variant):
+            headers = cached.conditional_headers()
+        with metrics.stage('fetch'):
+            response = get_session().get(url, timeout=timeout, headers=headers,
+                                         stream=streaming)
+        
+        with response:
+            # Reuse the cached result if the feed has not changed
+            if response.status_code == 304 and headers:
+                feed_cache.mark_not_modified(cached)
+                return _result_from_cache(cached, variant, window, expand, deadline)
+            
+            # Check response status
+            if response.status_code != 200:
+                return {
+                    'success': False,
+                    'message': f'Failed to fetch iCal feed. HTTP Status: {response.status_code}',
+                    'status_code': response.status_code
+                }
+            
+            if streaming:
+                # Parse iCal data while it is downloaded; the body is not kept
+                content = None
+                result = parse_ical_lines(response.iter_lines(), window, expand)
+                if result['success']:
+                    with metrics.stage('serialize'):
+                        result['json'] = encode_result(result['data'])
+            else:
+                # Parse iCal data, reusing a result parsed by any worker for the same body
+                content = response.content
+                result = _parse_with_cache(content, window, expand, deadline)
+            # Bytes read from the connection, before any content decoding
+            metrics.FETCH_BYTES.inc(response.raw.tell())
+        
+        if result['success']:
+            feed_cache.store(url, response.headers, content, variant,
+                             result['data'], result['json'])
+        return _with_etag(result, variant, response.headers.get('ETag'))
+    except (requests.Timeout, parse_pool.PoolTimeout):
+        logging.error(f"Request timeout for URL: {url}")
+        return {
+            'success': False,
+            'message': f'Request timed out after {timeout} seconds',
+            'status_code': 408
+        }
+    except requests.RequestException as e:
+        logging.error(f"Request error for URL {url}: {str(e)}")
+        return {
+            'success': False,
+            'message': f'Error fetching iCal feed: {str(e)}',
+            'status_code': 500
+        }
+
+async def async_fetch_and_parse_ical(url, timeout=10, window=None, expand=False):
+    """
+    Fetch iCal data from URL and parse it to JSON without blocking the event loop
+    
+    The asyncio counterpart of fetch_and_parse_ical: the feed is downloaded
+    with the async HTTP client and parsed in the default executor, so many
+    fetches can be in flight per worker. The feed body is always downloaded
+    whole, whatever ICAL_PARSE_MODE is set to.
+    
+    Args:
+        url (str): URL of the iCal feed
+        timeout (int): Request timeout in seconds
+        window (tuple): Optional (start, end) datetimes from parse_window
+        expand (bool): Whether to expand recurring events within the window
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+    """
+    if profiling.active():
+        return await _async_fetch_and_parse(url, timeout, window, expand)
+    
+    key = (url, _variant_key(window, expand))
+    
+    async def fetch():
+        return await _async_fetch_and_parse(url, timeout, window, expand), timeout
+    
+    try:
+        (result, leader_timeout), shared = await async_inflight_fetches.do(
+            key, fetch, timeout=timeout)
+        
+        # As in fetch_and_parse_ical, a shorter timeout does not answer ours
+        if shared and result.get('status_code') == 408 and leader_timeout < timeout:
+            (result, _), _ = await async_inflight_fetches.do(
+                key, fetch, timeout=timeout - leader_timeout)
+        return result
+    except SingleFlightTimeout:
+        logging.error(f"Timed out waiting for in-flight fetch of URL: {url}")
+        return {
+            'success': False,
+            'message': f'Request timed out after {timeout} seconds',
+            'status_code': 408
+        }
+
+async def _async_fetch_and_parse(url, timeout, window=None, expand=False):
+    """
+    Fetch iCal data with the async client and parse it, going through the caches
+    
     Args:
         url (str): URL of the iCal feed
         timeout (int): Request timeout in seconds
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
         
     Returns:
         dict: Dictionary containing parsed data or error information
     """
+    variant = _variant_key(window, expand)
+    # Parsing has to finish within the timeout too
+    deadline = time.monotonic() + timeout
     try:
-        # Fetch iCal data
-        response = requests.get(url, timeout=timeout)
+        # Serve from the feed cache when the entry is recent enough; profiled
+        # calls always fetch and parse the feed
+        cached, fresh = (None, False) if profiling.active() else feed_cache.lookup(url)
+        if fresh and cached.can_answer(variant):
+            return await asyncio.to_thread(
+                _result_from_cache, cached, variant, window, expand, deadline)
+        
+        headers = {}
+        if cached and cached.can_answer(variant):
+            headers = cached.conditional_headers()
+        with metrics.stage('fetch'):
+            response = await get_async_client().get(url, timeout=timeout,
+                                                    headers=headers)
+        metrics.FETCH_BYTES.inc(response.num_bytes_downloaded)
+        
+        # Reuse the cached result if the feed has not changed
+        if response.status_code == 304 and headers:
+            feed_cache.mark_not_modified(cached)
+            return await asyncio.to_thread(
+                _result_from_cache, cached, variant, window, expand, deadline)
         
-        # Check response status
         if response.status_code != 200:
             return {
                 'success': False,
@@ -64,216 +323,24 @@ def fetch_and_parse_ical(url, timeout=10):
                 'status_code': response.status_code
             }
         
-        # Parse iCal data
-        try:
-            calendar = Calendar.from_ical(response.content)
-            
-            # Extract calendar information
-            calendar_info = {
-                'name': str(calendar.get('X-WR-CALNAME', 'Calendar')),
-                'description': str(calendar.get('X-WR-CALDESC', '')),
-                'timezone': str(calendar.get('X-WR-TIMEZONE', 'UTC')),
-            }
-            
-            # First pass: collect all events with their properties
-            events_by_uid = {}
-            
-            for component in calendar.walk():
-                if component.name == "VEVENT":
-                    event = {
-                        'uid': str(component.get('UID', '')),
-                        'summary': str(component.get('SUMMARY', '')),
-                        'description': str(component.get('DESCRIPTION', '')),
-                        'location': str(component.get('LOCATION', '')),
-                        'status': str(component.get('STATUS', '')),
-                        'organizer': _parse_organizer(component.get('ORGANIZER', '')),
-                        'created': _format_datetime(component.get('CREATED', None)),
-                        'last_modified': _format_datetime(component.get('LAST-MODIFIED', None)),
-                        'related_to': str(component.get('RELATED-TO', '')),
-                        'relationship_type': str(component.get('RELTYPE', '')),
-                        'subevents': []  # Will store child events
-                    }
-                    
-                    # Extract RELATED-TO parameter if it exists (this may indicate a parent-child relationship)
-                    related_to = component.get('RELATED-TO', None)
-                    if related_to:
-                        event['related_to'] = str(related_to)
-                        # Get relationship type if available
-                        if hasattr(related_to, 'params') and 'RELTYPE' in related_to.params:
-                            event['relationship_type'] = str(related_to.params['RELTYPE'])
-                    
-                    # Handle any custom 'parent_uid' property that might be in the feed
-                    parent_uid = component.get('X-PARENT-UID', component.get('PARENT-UID', None))
-                    if parent_uid:
-                        event['parent_uid'] = str(parent_uid)
-                    
-                    # Handle start time
-                    dtstart = component.get('DTSTART', None)
-                    if dtstart:
-                        event['start'] = _parse_datetime(dtstart)
-                        event['start_dt'] = dtstart.dt  # Store actual datetime for comparison
-                    
-                    # Handle end time
-                    dtend = component.get('DTEND', None)
-                    if dtend:
-                        event['end'] = _parse_datetime(dtend)
-                        event['end_dt'] = dtend.dt  # Store actual datetime for comparison
-                    
-                    # Handle recurrence rule
-                    rrule = component.get('RRULE', None)
-                    if rrule:
-                        event['recurrence'] = _parse_recurrence(rrule)
-                    
-                    # Add any alarms/reminders
-                    alarms = []
-                    for subcomponent in component.walk('VALARM'):
-                        alarm = {
-                            'action': str(subcomponent.get('ACTION', '')),
-                            'description': str(subcomponent.get('DESCRIPTION', '')),
-                            'trigger': str(subcomponent.get('TRIGGER', '')),
-                        }
-                        alarms.append(alarm)
-                    
-                    if alarms:
-                        event['alarms'] = alarms
-                    
-                    # Store event by UID for later reference
-                    events_by_uid[event['uid']] = event
-            
-            # Second pass: identify parent-child relationships and organize events
-            organized_events = []
-            processed_uids = set()  # Track which events have been processed
-            
-            # First check for explicit parent-child relationships via RELATED-TO or similar properties
-            for uid, event in events_by_uid.items():
-                # Skip if already processed as a child
-                if uid in processed_uids:
-                    continue
-                
-                # If this event is related to another event, it might be a child
-                if 'related_to' in event and event['related_to'] and event['related_to'] in events_by_uid:
-                    parent_event = events_by_uid[event['related_to']]
-                    parent_event['subevents'].append(event)
-                    processed_uids.add(uid)
-                    continue
-                
-                # If this event has an explicit parent_uid property
-                if 'parent_uid' in event and event['parent_uid'] and event['parent_uid'] in events_by_uid:
-                    parent_event = events_by_uid[event['parent_uid']]
-                    parent_event['subevents'].append(event)
-                    processed_uids.add(uid)
-                    continue
-            
-            # Then try to infer parent-child relationships based on time containment
-            for uid, event in events_by_uid.items():
-                # Skip if already processed as a child
-                if uid in processed_uids:
-                    continue
-                
-                # Check if this event's time range contains other events
-                if 'start_dt' in event and 'end_dt' in event:
-                    for other_uid, other_event in events_by_uid.items():
-                        if uid == other_uid or other_uid in processed_uids:
-                            continue
-                        
-                        # Skip if either event is missing datetime info
-                        if 'start_dt' not in other_event or 'end_dt' not in other_event:
-                            continue
-                            
-                        # Handle type compatibility - convert dates to datetimes if needed
-                        try:
-                            # For comparison, convert date to datetime if needed
-                            event_start = event['start_dt']
-                            event_end = event['end_dt']
-                            other_start = other_event['start_dt']
-                            other_end = other_event['end_dt']
-                            
-                            # Convert date objects to datetime objects at midnight
-                            if not isinstance(event_start, datetime):
-                                event_start = datetime.combine(event_start, datetime.min.time())
-                                event_start = event_start.replace(tzinfo=pytz.UTC)
-                            if not isinstance(event_end, datetime):
-                                event_end = datetime.combine(event_end, datetime.min.time())
-                                event_end = event_end.replace(tzinfo=pytz.UTC)
-                            if not isinstance(other_start, datetime):
-                                other_start = datetime.combine(other_start, datetime.min.time())
-                                other_start = other_start.replace(tzinfo=pytz.UTC)
-                            if not isinstance(other_end, datetime):
-                                other_end = datetime.combine(other_end, datetime.min.time())
-                                other_end = other_end.replace(tzinfo=pytz.UTC)
-                            
-                            # Check if other event is within this event's time range
-                            if (event_start <= other_start and event_end >= other_end):
-                                
-                                # If the time ranges match exactly, compare summary/title length
-                                # Longer titles often indicate more specific subevents
-                                if (event_start == other_start and event_end == other_end):
-                                    if len(other_event['summary']) > len(event['summary']):
-                                        # Skip containment for equal time ranges with longer summary
-                                        continue
-                                
-                                # Add this event as a subevent
-                                event['subevents'].append(other_event)
-                                processed_uids.add(other_uid)
-                        except Exception as e:
-                            # Log but continue if there's an error comparing dates
-                            logging.warning(f"Error comparing event dates: {str(e)}")
-            
-            # Prepare the final event list, keeping only top-level events
-            for uid, event in events_by_uid.items():
-                if uid not in processed_uids:
-                    # Clean up temporary attributes before adding to the final list
-                    event.pop('start_dt', None)
-                    event.pop('end_dt', None)
-                    
-                    # Remove empty properties for cleaner output
-                    if not event['related_to']:
-                        event.pop('related_to', None)
-                    if not event['relationship_type']:
-                        event.pop('relationship_type', None)
-                    if not event['subevents']:
-                        event.pop('subevents', None)
-                    
-                    # Clean up subevents too
-                    if 'subevents' in event:
-                        for subevent in event['subevents']:
-                            subevent.pop('start_dt', None)
-                            subevent.pop('end_dt', None)
-                            if not subevent.get('related_to', ''):
-                                subevent.pop('related_to', None)
-                            if not subevent.get('relationship_type', ''):
-                                subevent.pop('relationship_type', None)
-                            subevent.pop('subevents', None)  # Don't need nested subevents
-                    
-                    organized_events.append(event)
-            
-            # Prepare final result
-            result = {
-                'calendar': calendar_info,
-                'events': organized_events,
-                'event_count': len(organized_events),
-                'total_events': len(events_by_uid)  # Total including subevents
-            }
-            
-            return {
-                'success': True,
-                'data': result
-            }
-        except Exception as e:
-            logging.error(f"iCal parsing error: {str(e)}")
-            return {
-                'success': False,
-                'message': f'Failed to parse iCal data: {str(e)}',
-                'status_code': 400
-            }
-    except requests.Timeout:
+        # Parse off the event loop, reusing a result parsed by any worker;
+        # to_thread keeps the request's context, and so its Server-Timing
+        content = response.content
+        result = await asyncio.to_thread(profiling.call, _parse_with_cache,
+                                         content, window, expand, deadline)
+        
+        if result['success']:
+            feed_cache.store(url, response.headers, content, variant,
+                             result['data'], result['json'])
+        return _with_etag(result, variant, response.headers.get('ETag'))
+    except (httpx.TimeoutException, parse_pool.PoolTimeout):
         logging.error(f"Request timeout for URL: {url}")
         return {
             'success': False,
             'message': f'Request timed out after {timeout} seconds',
             'status_code': 408
         }
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         logging.error(f"Request error for URL {url}: {str(e)}")
         return {
             'success': False,
@@ -281,6 +348,558 @@ def fetch_and_parse_ical(url, timeout=10):
             'status_code': 500
         }
 
+def parse_ical_content(content, window=None, expand=False):
+    """
+    Parse raw iCal data and organize its events
+    
+    Args:
+        content (bytes): Raw iCal feed body
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+    """
+    try:
+        with metrics.stage('from_ical'):
+            calendar = Calendar.from_ical(content)
+        with metrics.stage('extract'):
+            events_by_uid = _collect_events(calendar.walk('VEVENT'), window, expand)
+        metrics.EVENTS_PARSED.inc(len(events_by_uid))
+        with metrics.stage('organize'):
+            data = _organize_events(calendar, events_by_uid)
+        return {
+            'success': True,
+            'data': data
+        }
+    except Exception as e:
+        logging.error(f"iCal parsing error: {str(e)}")
+        return {
+            'success': False,
+            'message': f'Failed to parse iCal data: {str(e)}',
+            'status_code': 400
+        }
+
+def parse_ical_lines(lines, window=None, expand=False):
+    """
+    Parse iCal data read line by line and organize its events
+    
+    Unlike parse_ical_content, the full calendar is never held in memory:
+    each VEVENT is parsed on its own as soon as its last line is read.
+    
+    Args:
+        lines (iterable): Raw iCal content lines (bytes), e.g. from
+            response.iter_lines()
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+        
+    Raises:
+        requests.RequestException: If reading the lines from the connection
+            fails, for the caller to report like any other fetch error
+    """
+    try:
+        reader = CalendarStreamReader(lines)
+        # Reading and parsing the VEVENTs happens while they are extracted
+        with metrics.stage('extract'):
+            events_by_uid = _collect_events(reader.events(), window, expand)
+        metrics.EVENTS_PARSED.inc(len(events_by_uid))
+        with metrics.stage('organize'):
+            data = _organize_events(reader.calendar, events_by_uid)
+        return {
+            'success': True,
+            'data': data
+        }
+    except requests.RequestException:
+        # The download broke off mid-body; that is not a parse error
+        raise
+    except Exception as e:
+        logging.error(f"iCal parsing error: {str(e)}")
+        return {
+            'success': False,
+            'message': f'Failed to parse iCal data: {str(e)}',
+            'status_code': 400
+        }
+
+def _collect_events(vevents, window=None, expand=False):
+    """
+    Convert VEVENT components to event records
+    
+    Args:
+        vevents (iterable): VEVENT components in feed order
+        window (tuple): Optional (start, end) datetimes; events outside the
+            window are skipped before they are converted
+        expand (bool): Whether recurring events are replaced by their
+            occurrences within the window
+        
+    Returns:
+        dict: EventRecords keyed by UID, in feed order
+    """
+    if expand:
+        return _expand_events(vevents, window)
+    
+    bounds = _window_bounds(window)
+    events_by_uid = {}
+    for component in vevents:
+        if bounds and not _in_window(component, bounds):
+            continue
+        
+        event = _parse_event(component)
+        
+        # Store event by UID for later reference
+        events_by_uid[event.uid] = event
+    return events_by_uid
+
+def _expand_events(vevents, window):
+    """
+    Convert VEVENT components to event records, one per occurrence
+    
+    Each occurrence of a recurring event within the window becomes an event
+    of its own with the UID '<series uid>_<recurrence id>'. Occurrences
+    modified by a RECURRENCE-ID override are taken from the override instead.
+    Only recurring components are kept until the end of the feed, since their
+    occurrences depend on overrides that may come after them.
+    
+    Args:
+        vevents (iterable): VEVENT components in feed order
+        window (tuple): (start, end) datetimes, both set
+        
+    Returns:
+        dict: EventRecords keyed by UID, occurrences at the position of their
+            series
+    """
+    bounds = _window_bounds(window)
+    entries = []  # Parsed events, or recurring components still to expand
+    overrides = {}  # Recurrence stamps with an override, by series UID
+    
+    for component in vevents:
+        recurrence_id = component.get('RECURRENCE-ID', None)
+        if recurrence_id is not None:
+            uid = str(component.get('UID', ''))
+            stamp = _recurrence_stamp(recurrence_id.dt)
+            overrides.setdefault(uid, set()).add(stamp)
+            if _in_window(component, bounds):
+                event = _parse_event(component)
+                event.uid = f"{uid}_{stamp}"
+                event.series_uid = uid
+                event.recurrence_id = _format_datetime(recurrence_id)
+                entries.append(event)
+        elif component.get('RRULE', None) or component.get('RDATE', None):
+            entries.append(component)
+        elif _in_window(component, bounds):
+            entries.append(_parse_event(component))
+    
+    events_by_uid = {}
+    for entry in entries:
+        if not isinstance(entry, Component):
+            events_by_uid[entry.uid] = entry
+            continue
+        
+        for event in _expand_series(entry, window, overrides):
+            events_by_uid[event.uid] = event
+    return events_by_uid
+
+def _expand_series(component, window, overrides):
+    """
+    Build the events for the occurrences of a recurring VEVENT in a window
+    
+    Args:
+        component: Recurring icalendar VEVENT component
+        window (tuple): (start, end) datetimes, both set
+        overrides (dict): Recurrence stamps with an override, by series UID
+        
+    Returns:
+        list: Occurrence records, or the event itself if it cannot be expanded
+    """
+    uid = str(component.get('UID', ''))
+    series = None
+    if component.get('DTSTART', None):
+        series = series_definition(component)
+    occurrences = None
+    if series is not None:
+        occurrences = cached_occurrences(uid, series['dtstart'], series['rule'],
+                                         series['rdates'], series['exdates'],
+                                         series['duration'], window[0], window[1])
+    
+    if occurrences is None:
+        # Keep the series as a single event, as without expansion
+        if _in_window(component, _window_bounds(window)):
+            return [_parse_event(component)]
+        return []
+    
+    master = _parse_event(component)
+    overridden = overrides.get(uid, ())
+    events = []
+    for occurrence in occurrences:
+        stamp = _recurrence_stamp(occurrence)
+        if stamp in overridden:
+            continue
+        
+        event = master.copy()
+        event.uid = f"{uid}_{stamp}"
+        event.series_uid = uid
+        event.recurrence_id = _format_datetime(vDDDTypes(occurrence))
+        event.start = dict(master.start, datetime=event.recurrence_id)
+        event.start_time = _event_time(occurrence)
+        if master.end is not None:
+            end = occurrence + series['duration']
+            event.end = dict(master.end, datetime=_format_datetime(vDDDTypes(end)))
+            event.end_time = _event_time(end)
+        events.append(event)
+    return events
+
+def _recurrence_stamp(value):
+    """
+    Identify an occurrence of a series by its original start
+    
+    Args:
+        value: date or datetime of the occurrence
+        
+    Returns:
+        str: Compact iCal form, in UTC for timezone-aware datetimes
+    """
+    if not isinstance(value, datetime):
+        return value.strftime('%Y%m%d')
+    if value.tzinfo is None:
+        return value.strftime('%Y%m%dT%H%M%S')
+    return value.astimezone(pytz.UTC).strftime('%Y%m%dT%H%M%SZ')
+
+def _window_bounds(window):
+    """
+    Convert a time window to microsecond bounds comparable with event times
+    
+    Args:
+        window (tuple): (start, end) datetimes, either of which may be None
+        
+    Returns:
+        tuple: (start, end) in microseconds since the epoch, None for an
+            open bound, or None if there is no window
+    """
+    if not window:
+        return None
+    return tuple(normalize_time(bound)[1] if bound is not None else None
+                 for bound in window)
+
+def _in_window(component, bounds):
+    """
+    Check whether a VEVENT overlaps a time window
+    
+    Floating times are compared as UTC. Recurring events are kept when their
+    series starts before the window ends and is not over before it begins.
+    
+    Args:
+        component: icalendar VEVENT component
+        bounds (tuple): Window bounds from _window_bounds
+        
+    Returns:
+        bool: True if the event should be converted
+    """
+    window_start, window_end = bounds
+    
+    dtstart = component.get('DTSTART', None)
+    if not dtstart:
+        return False
+    start = normalize_time(dtstart.dt)[1]
+    
+    if window_end is not None and start >= window_end:
+        return False
+    if window_start is None:
+        return True
+    
+    rrule = component.get('RRULE', None)
+    if rrule or component.get('RDATE', None):
+        until = rrule.get('UNTIL') if rrule else None
+        if not until:
+            return True
+        return normalize_time(until[0])[1] >= window_start
+    
+    dtend = component.get('DTEND', None)
+    duration = component.get('DURATION', None)
+    if dtend:
+        end = normalize_time(dtend.dt)[1]
+    elif duration:
+        end = start + duration.dt // timedelta(microseconds=1)
+    elif not isinstance(dtstart.dt, datetime):
+        # All-day events without an end last one day
+        end = start + timedelta(days=1) // timedelta(microseconds=1)
+    else:
+        end = start
+    
+    if end == start:
+        return start >= window_start
+    return end > window_start
+
+def _parse_event(component):
+    """
+    Extract the properties of a single VEVENT component
+    
+    Properties are read with plain dict lookups: icalendar stores property
+    names upper-cased, and its case-insensitive get would upper-case the
+    name again on every call.
+    
+    Args:
+        component: icalendar VEVENT component
+        
+    Returns:
+        EventRecord: Event record, with normalized start and end times
+    """
+    get = dict.get
+    event = EventRecord(
+        uid=str(get(component, 'UID', '')),
+        summary=str(get(component, 'SUMMARY', '')),
+        description=str(get(component, 'DESCRIPTION', '')),
+        location=str(get(component, 'LOCATION', '')),
+        status=str(get(component, 'STATUS', '')),
+        organizer=_parse_organizer(get(component, 'ORGANIZER', '')),
+        created=_format_datetime(get(component, 'CREATED', None)),
+        last_modified=_format_datetime(get(component, 'LAST-MODIFIED', None)),
+    )
+    
+    # Extract RELATED-TO parameter if it exists (this may indicate a parent-child relationship)
+    related_to = get(component, 'RELATED-TO', None)
+    if related_to:
+        event.related_to = str(related_to)
+        # Get relationship type if available
+        if hasattr(related_to, 'params') and 'RELTYPE' in related_to.params:
+            event.relationship_type = str(related_to.params['RELTYPE'])
+    
+    # Handle any custom 'parent_uid' property that might be in the feed
+    parent_uid = get(component, 'X-PARENT-UID', get(component, 'PARENT-UID', None))
+    if parent_uid:
+        event.parent_uid = str(parent_uid)
+    
+    # Handle start time
+    dtstart = get(component, 'DTSTART', None)
+    if dtstart:
+        event.start = _parse_datetime(dtstart)
+        event.start_time = _event_time(dtstart.dt)
+    
+    # Handle end time
+    dtend = get(component, 'DTEND', None)
+    if dtend:
+        event.end = _parse_datetime(dtend)
+        event.end_time = _event_time(dtend.dt)
+    
+    # Handle recurrence rule
+    rrule = get(component, 'RRULE', None)
+    if rrule:
+        event.recurrence = _parse_recurrence(rrule)
+    
+    # Add any alarms/reminders
+    alarms = []
+    for subcomponent in component.walk('VALARM'):
+        alarm = {
+            'action': str(get(subcomponent, 'ACTION', '')),
+            'description': str(get(subcomponent, 'DESCRIPTION', '')),
+            'trigger': str(get(subcomponent, 'TRIGGER', '')),
+        }
+        alarms.append(alarm)
+    
+    if alarms:
+        event.alarms = alarms
+    
+    return event
+
+def _event_time(value):
+    """
+    Normalize an event's start or end for comparisons
+    
+    Args:
+        value: date or datetime of the DTSTART/DTEND property
+        
+    Returns:
+        tuple: (is_timezone_aware, microseconds since the epoch), or None if
+            the value cannot be compared
+    """
+    try:
+        return normalize_time(value)
+    except (TypeError, ValueError, OverflowError, AttributeError) as e:
+        logging.warning(f"Error comparing event dates: {str(e)}")
+        return None
+
+def _organize_events(calendar, events_by_uid):
+    """
+    Identify parent-child relationships and build the final result
+    
+    Args:
+        calendar: icalendar Calendar holding the calendar-level properties
+        events_by_uid (dict): EventRecords keyed by UID, in feed order
+        
+    Returns:
+        dict: Calendar information and organized top-level events
+    """
+    # Extract calendar information
+    calendar_info = {
+        'name': str(calendar.get('X-WR-CALNAME', 'Calendar')),
+        'description': str(calendar.get('X-WR-CALDESC', '')),
+        'timezone': str(calendar.get('X-WR-TIMEZONE', 'UTC')),
+    }
+    
+    # Second pass: identify parent-child relationships and organize events
+    processed_uids = set()  # Track which events have been processed
+    
+    # First check for explicit parent-child relationships via RELATED-TO or similar properties
+    for uid, event in events_by_uid.items():
+        # Skip if already processed as a child
+        if uid in processed_uids:
+            continue
+        
+        # If this event is related to another event, it might be a child
+        if event.related_to and event.related_to in events_by_uid:
+            events_by_uid[event.related_to].add_subevent(event)
+            processed_uids.add(uid)
+            continue
+        
+        # If this event has an explicit parent_uid property
+        if event.parent_uid and event.parent_uid in events_by_uid:
+            events_by_uid[event.parent_uid].add_subevent(event)
+            processed_uids.add(uid)
+            continue
+    
+    # Then try to infer parent-child relationships based on time containment
+    assign_time_containment(events_by_uid, processed_uids)
+    
+    # Build the public event dicts of the top-level events
+    organized_events = [event.to_dict() for uid, event in events_by_uid.items()
+                        if uid not in processed_uids]
+    
+    # Prepare final result
+    result = {
+        'calendar': calendar_info,
+        'events': organized_events,
+        'event_count': len(organized_events),
+        'total_events': len(events_by_uid)  # Total including subevents
+    }
+    
+    return result
+
+def _variant_key(window, expand=False):
+    """
+    Build the cache key part for the parse options
+    
+    Args:
+        window (tuple): Optional (start, end) datetimes
+        expand (bool): Whether recurring events are expanded
+        
+    Returns:
+        str: Key identifying the converter version, JSON backend and parse
+            options
+    """
+    # Serialized results cached by another worker are only reused when they
+    # were encoded by the same JSON backend
+    if not window:
+        return f'{CONVERTER_VERSION}|{json_backend}'
+    start, end = window
+    parts = [
+        CONVERTER_VERSION,
+        json_backend,
+        start.isoformat() if start else '',
+        end.isoformat() if end else ''
+    ]
+    if expand:
+        parts.append('expand')
+    return '|'.join(parts)
+
+def _result_from_cache(entry, variant, window, expand=False, deadline=None):
+    """
+    Build a result from a feed cache entry, parsing its body if needed
+    
+    Args:
+        entry: FeedCacheEntry that can answer the parse options
+        variant (str): Key of the parse options
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
+        deadline (float): time.monotonic() time by which parsing has to finish
+        
+    Returns:
+        dict: Dictionary containing parsed data or error information
+    
+    Raises:
+        parse_pool.PoolTimeout: If parsing does not finish by the deadline
+    """
+    cached_result = feed_cache.get_result(entry, variant)
+    if cached_result is not None:
+        data, serialized = cached_result
+        return _with_etag({
+            'success': True,
+            'data': data,
+            'json': serialized
+        }, variant, entry.etag)
+    
+    result = _parse_with_cache(entry.content, window, expand, deadline)
+    if result['success']:
+        feed_cache.add_result(entry, variant, result['data'], result['json'])
+    return _with_etag(result, variant, entry.etag)
+
+def _with_etag(result, variant, validator=None):
+    """
+    Add a strong ETag for the serialized output to a successful result
+    
+    A strong upstream ETag identifies the feed body, and the output is fully
+    determined by the body and the variant, which covers the parse options
+    and the JSON backend, so the ETag is derived from those without reading
+    the output. Otherwise the
+    serialized output itself is hashed.
+    
+    Args:
+        result (dict): Parse result
+        variant (str): Key of the parse options
+        validator (str): ETag header of the upstream response, if any
+        
+    Returns:
+        dict: The result, with an 'etag' on success
+    """
+    if not result['success']:
+        return result
+    
+    if validator and not validator.startswith('W/'):
+        seed = f'{variant}|{validator}'.encode('utf-8')
+    else:
+        if result.get('json') is None:
+            result['json'] = encode_result(result['data'])
+        seed = result['json']
+    result['etag'] = hashlib.sha256(seed).hexdigest()[:32]
+    return result
+
+def _parse_with_cache(content, window=None, expand=False, deadline=None):
+    """
+    Parse raw iCal data through the content-hash keyed parse cache
+    
+    Args:
+        content (bytes): Raw iCal feed body
+        window (tuple): Optional (start, end) datetimes to filter events by
+        expand (bool): Whether to expand recurring events within the window
+        deadline (float): time.monotonic() time by which parsing has to finish
+        
+    Returns:
+        dict: Parse result, with the serialized JSON body under 'json' on success
+    
+    Raises:
+        parse_pool.PoolTimeout: If parsing does not finish by the deadline
+    """
+    key = parse_cache.key_for(content, _variant_key(window, expand))
+    body = None if profiling.active() else parse_cache.get(key)
+    if parse_cache.enabled and not profiling.active():
+        metrics.CACHE_REQUESTS.inc(cache='parse', result='miss' if body is None else 'hit')
+    if body is not None:
+        return {
+            'success': True,
+            'data': loads(body),
+            'json': body
+        }
+    
+    # Parse large feeds in a pool process so parsing does not hold this
+    # worker's GIL; small feeds are parsed here
+    result = parse_pool.run(parse_ical_content, content, window, expand,
+                            size=len(content), deadline=deadline)
+    if result['success']:
+        with metrics.stage('serialize'):
+            result['json'] = encode_result(result['data'])
+        parse_cache.put(key, result['json'])
+    return result
+
 def _format_datetime(dt_value):
     """
     Format datetime value to ISO format string
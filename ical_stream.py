@@ -0,0 +1,114 @@
+from icalendar import Calendar, Component
+
+
+class CalendarStreamReader:
+    """
+    Read an iCal feed line by line, one top-level component at a time
+
+    Folded lines are unfolded as they are read. Every component directly
+    inside VCALENDAR is parsed on its own once its END line is reached, so
+    only one component is held in memory at a time. VTIMEZONE components are
+    parsed as they pass, which registers them with icalendar for the TZID
+    references of later events.
+    """
+
+    def __init__(self, lines):
+        """
+        Args:
+            lines (iterable): Raw iCal content lines (bytes or str)
+        """
+        self._lines = lines
+        self._calendar_lines = []
+        self._calendar = None
+
+    @property
+    def calendar(self):
+        """
+        Calendar holding the calendar-level properties
+
+        Only available once events() has been consumed.
+        """
+        if self._calendar is None:
+            raise RuntimeError('Calendar properties are only known after all events are read')
+        return self._calendar
+
+    def events(self):
+        """
+        Generate the feed's VEVENT components in feed order
+
+        Yields:
+            icalendar.Event: One parsed VEVENT at a time
+
+        Raises:
+            ValueError: If the feed has no VCALENDAR or is not terminated
+        """
+        depth = 0
+        found_calendar = False
+        component_name = None
+        component_lines = []
+
+        for line in self._unfolded_lines():
+            upper = line[:10].upper()
+
+            if depth == 0:
+                if line.upper() == 'BEGIN:VCALENDAR':
+                    found_calendar = True
+                    depth = 1
+                continue
+
+            if depth == 1:
+                if upper.startswith('BEGIN:'):
+                    component_name = line[6:].strip().upper()
+                    component_lines = [line]
+                    depth = 2
+                elif upper.startswith('END:'):
+                    depth = 0
+                else:
+                    self._calendar_lines.append(line)
+                continue
+
+            component_lines.append(line)
+            if upper.startswith('BEGIN:'):
+                depth += 1
+            elif upper.startswith('END:'):
+                depth -= 1
+                if depth == 1:
+                    component = Component.from_ical('\r\n'.join(component_lines))
+                    component_lines = []
+                    if component_name == 'VEVENT':
+                        yield component
+
+        if not found_calendar:
+            raise ValueError('No VCALENDAR component found in feed')
+        if depth != 0:
+            raise ValueError('Feed ended before the VCALENDAR component was closed')
+
+        self._calendar = Calendar.from_ical('\r\n'.join(
+            ['BEGIN:VCALENDAR'] + self._calendar_lines + ['END:VCALENDAR']))
+
+    def _unfolded_lines(self):
+        """
+        Generate logical content lines, joining folded continuation lines
+
+        Yields:
+            str: Unfolded content line
+        """
+        current = None
+        for raw in self._lines:
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8', errors='replace')
+            raw = raw.rstrip('\r\n')
+            if not raw:
+                continue
+
+            if raw[0] in ' \t':
+                if current is not None:
+                    current += raw[1:]
+                continue
+
+            if current is not None:
+                yield current
+            current = raw
+
+        if current is not None:
+            yield current
@@ -0,0 +1,80 @@
+import os
+from serializers import dumps
+
+# Bytes of serialized events collected before a chunk is sent
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024))
+
+
+def iter_json(data):
+    """
+    Serialize a parsed result as one JSON document, piece by piece
+
+    The concatenated chunks are identical to encode_result(data), but only
+    one chunk of serialized events is held at a time.
+
+    Args:
+        data (dict): Parsed calendar data
+
+    Yields:
+        bytes: Consecutive chunks of the JSON document
+    """
+    def pieces():
+        yield b'{'
+        for index, key in enumerate(sorted(data)):
+            prefix = b',' if index else b''
+            if key != 'events':
+                yield prefix + dumps(key) + b':' + dumps(data[key])
+                continue
+            yield prefix + b'"events":['
+            for position, event in enumerate(data['events']):
+                yield (b',' if position else b'') + dumps(event)
+            yield b']'
+        yield b'}\n'
+
+    return _chunked(pieces())
+
+
+def iter_ndjson(data):
+    """
+    Serialize a parsed result as newline-delimited JSON
+
+    The first line holds everything but the events ('calendar',
+    'event_count', 'total_events'); each following line holds one top-level
+    event with its subevents.
+
+    Args:
+        data (dict): Parsed calendar data
+
+    Yields:
+        bytes: Chunks of complete lines
+    """
+    def pieces():
+        header = {key: value for key, value in data.items() if key != 'events'}
+        yield dumps(header) + b'\n'
+        for event in data.get('events', []):
+            yield dumps(event) + b'\n'
+
+    return _chunked(pieces())
+
+
+def _chunked(pieces):
+    """
+    Join small serialized pieces into chunks of about STREAM_CHUNK_SIZE
+
+    Args:
+        pieces (iterable): Serialized bytes
+
+    Yields:
+        bytes: Joined chunks
+    """
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= STREAM_CHUNK_SIZE:
+            yield b''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield b''.join(buffer)
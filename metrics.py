@@ -0,0 +1,488 @@
+import os
+import json
+import time
+import fcntl
+import logging
+import atexit
+import tempfile
+import threading
+import contextvars
+import multiprocessing
+from contextlib import contextmanager
+
+# Directory where each process keeps a snapshot of its metrics, so /metrics
+# can add up the metrics of every worker on this host; empty keeps metrics
+# per process
+METRICS_DIR = os.environ.get('METRICS_DIR',
+                             os.path.join(tempfile.gettempdir(), 'ical_metrics'))
+# Seconds between snapshots of a process's metrics
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# 1 adds a Server-Timing header with the duration of each stage to responses
+SERVER_TIMING = int(os.environ.get('SERVER_TIMING', 0))
+
+# Upper bounds of the duration histogram buckets, in seconds
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_metrics = {}
+_local = threading.local()
+_request_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class Counter:
+    """
+    Monotonic count, optionally split by labels
+    """
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _metrics[name] = self
+
+    def inc(self, amount=1, **labels):
+        """
+        Add to the count
+
+        Args:
+            amount (float): Amount to add
+            **labels: Value of each label of the metric
+        """
+        _record(self, _label_values(self, labels), amount)
+
+    def _apply(self, label_values, amount):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    @staticmethod
+    def _merge(total, value):
+        return value if total is None else total + value
+
+
+class Gauge(Counter):
+    """
+    Current value that goes up and down, added up over the live processes
+    """
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        """
+        Subtract from the value
+
+        Args:
+            amount (float): Amount to subtract
+            **labels: Value of each label of the metric
+        """
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """
+    Distribution of observed values over fixed buckets, optionally split by labels
+    """
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        _metrics[name] = self
+
+    def observe(self, value, **labels):
+        """
+        Record an observation
+
+        Args:
+            value (float): Observed value
+            **labels: Value of each label of the metric
+        """
+        _record(self, _label_values(self, labels), value)
+
+    def _apply(self, label_values, value):
+        # [count per bucket (the last one is +Inf), sum, count]
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    @staticmethod
+    def _merge(total, value):
+        if total is None:
+            return [list(value[0]), value[1], value[2]]
+        total[0] = [a + b for a, b in zip(total[0], value[0])]
+        total[1] += value[1]
+        total[2] += value[2]
+        return total
+
+
+STAGE_SECONDS = Histogram(
+    'ical_stage_seconds',
+    'Duration of each stage of converting and syncing feeds',
+    ['stage'])
+REQUEST_SECONDS = Histogram(
+    'ical_request_seconds',
+    'Duration of API requests until the response is ready, by endpoint',
+    ['endpoint'])
+FETCH_BYTES = Counter(
+    'ical_fetch_bytes_total',
+    'Bytes of iCal feeds downloaded from upstream servers')
+EVENTS_PARSED = Counter(
+    'ical_events_parsed_total',
+    'VEVENTs converted to events')
+CACHE_REQUESTS = Counter(
+    'ical_cache_requests_total',
+    'Feed cache, parse cache and Glide table snapshot lookups by outcome',
+    ['cache', 'result'])
+GLIDE_ROWS_WRITTEN = Counter(
+    'glide_rows_written_total',
+    'Rows sent to Glide, by full-table or row-level write',
+    ['write'])
+GLIDE_RETRIES = Counter(
+    'glide_retries_total',
+    'Glide table syncs retried after a 412 Precondition Failed')
+GLIDE_WRITE_RETRIES = Counter(
+    'glide_write_retries_total',
+    'Glide write requests sent again after a connection error or a 429/5xx answer')
+PARSE_JOBS = Counter(
+    'ical_parse_jobs_total',
+    'Feed bodies parsed, by whether they were parsed inline or in the parse pool',
+    ['route'])
+PARSE_POOL_PENDING = Gauge(
+    'ical_parse_pool_pending_jobs',
+    'Parse jobs submitted to the parse pool and not finished yet')
+PARSE_POOL_WAIT_SECONDS = Histogram(
+    'ical_parse_pool_wait_seconds',
+    'Time parse jobs waited for a parse pool process')
+PARSE_POOL_TIMEOUTS = Counter(
+    'ical_parse_pool_timeouts_total',
+    'Parse jobs given up on at the deadline of their request')
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a stage of handling a request
+
+    The duration is added to the stage histogram and, if the current request
+    collects them, to the request's Server-Timing entries. Also usable as a
+    function decorator.
+
+    Args:
+        name (str): Stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=name)
+
+
+def start_request_timing():
+    """
+    Collect the stage durations of the current request for Server-Timing
+
+    Returns:
+        dict: Seconds spent per stage, filled in as stages finish
+    """
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def stop_request_timing():
+    """Stop collecting stage durations in the current context"""
+    _request_timings.set(None)
+
+
+def server_timing_header(timings, total=None):
+    """
+    Format stage durations as a Server-Timing header value
+
+    Args:
+        timings (dict): Seconds spent per stage
+        total (float): Seconds spent on the whole request, if known
+
+    Returns:
+        str: Header value with durations in milliseconds
+    """
+    entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items()]
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+@contextmanager
+def capture():
+    """
+    Keep the metrics recorded by this thread instead of recording them
+
+    Used by processes working on behalf of another, such as parse pool
+    processes, whose metrics are handed back with replay.
+
+    Yields:
+        list: Captured observations, picklable
+    """
+    observations = []
+    previous = getattr(_local, 'captured', None)
+    _local.captured = observations
+    try:
+        yield observations
+    finally:
+        _local.captured = previous
+
+
+def replay(observations):
+    """
+    Record observations captured in another process
+
+    Args:
+        observations (list): Observations from capture
+    """
+    for name, label_values, value in observations:
+        _record(_metrics[name], label_values, value)
+
+
+def _label_values(metric, labels):
+    return tuple(str(labels.get(name, '')) for name in metric.labelnames)
+
+
+def _record(metric, label_values, value):
+    captured = getattr(_local, 'captured', None)
+    if captured is not None:
+        captured.append((metric.name, label_values, value))
+        return
+
+    timings = _request_timings.get() if metric is STAGE_SECONDS else None
+    with _lock:
+        metric._apply(label_values, value)
+        if timings is not None:
+            # Stages running in parallel for one request add up
+            stage_name = label_values[0]
+            timings[stage_name] = timings.get(stage_name, 0.0) + value
+    _flusher.ensure_started()
+
+
+def snapshot():
+    """
+    Get the metrics of this process
+
+    Returns:
+        dict: Series of each metric as [label values, value] pairs
+    """
+    with _lock:
+        return {
+            name: [[list(label_values), Histogram._merge(None, value)
+                    if metric.kind == 'histogram' else value]
+                   for label_values, value in metric.values.items()]
+            for name, metric in _metrics.items()
+        }
+
+
+def collect():
+    """
+    Add up the metrics of every process on this host that recorded any
+
+    Returns:
+        dict: Merged series of each metric, keyed by label values
+    """
+    snapshots = [snapshot()]
+    if METRICS_DIR:
+        _flusher.flush(snapshots[0])
+        try:
+            snapshots = _read_snapshots()
+        except OSError as e:
+            logging.warning(f"Could not read metrics snapshots: {str(e)}")
+
+    merged = {name: {} for name in _metrics}
+    for metrics_snapshot in snapshots:
+        for name, series in metrics_snapshot.items():
+            metric = _metrics.get(name)
+            if metric is None:
+                continue
+            for label_values, value in series:
+                key = tuple(label_values)
+                merged[name][key] = metric._merge(merged[name].get(key), value)
+    return merged
+
+
+def render():
+    """
+    Render the metrics of every process on this host in the Prometheus text format
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for name, series in collect().items():
+        metric = _metrics[name]
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for label_values, value in sorted(series.items()):
+            labels = list(zip(metric.labelnames, label_values))
+            if metric.kind != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {_format_number(value)}')
+                continue
+
+            bucket_counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(metric.buckets + ('+Inf', ), bucket_counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _format_number(bound)
+                lines.append(f'{name}_bucket{_format_labels(labels + [("le", le)])} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {_format_number(total)}')
+            lines.append(f'{name}_count{_format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"'
+                          for (name, _), value in zip(labels, escaped)) + '}'
+
+
+def _format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _read_snapshots():
+    """
+    Read the snapshots of every process, folding those of exited processes
+    into the archive so they keep counting without piling up
+    """
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    lock_path = os.path.join(METRICS_DIR, '.lock')
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        archive_path = os.path.join(METRICS_DIR, 'archive.json')
+        archive = _load_snapshot(archive_path) or {}
+        snapshots = []
+        exited = []
+        for filename in os.listdir(METRICS_DIR):
+            if not filename.startswith('process-') or not filename.endswith('.json'):
+                continue
+            path = os.path.join(METRICS_DIR, filename)
+            process_snapshot = _load_snapshot(path)
+            if process_snapshot is None:
+                continue
+            if _process_alive(filename):
+                snapshots.append(process_snapshot)
+            else:
+                exited.append((path, process_snapshot))
+
+        if exited:
+            for _, process_snapshot in exited:
+                archive = _merge_snapshots(archive, process_snapshot)
+            _write_snapshot(archive_path, archive)
+            for path, _ in exited:
+                os.remove(path)
+    snapshots.append(archive)
+    return snapshots
+
+
+def _merge_snapshots(total, addition):
+    merged = {}
+    for name in set(total) | set(addition):
+        metric = _metrics.get(name)
+        # Gauges of exited processes no longer apply
+        if metric is None or metric.kind == 'gauge':
+            continue
+        series = {tuple(label_values): value for label_values, value in total.get(name, [])}
+        for label_values, value in addition.get(name, []):
+            key = tuple(label_values)
+            series[key] = metric._merge(series.get(key), value)
+        merged[name] = [[list(key), value] for key, value in series.items()]
+    return merged
+
+
+def _process_alive(filename):
+    """Check whether the process a snapshot file is named after still runs"""
+    try:
+        pid = int(filename.split('-')[1])
+        os.kill(pid, 0)
+    except (ValueError, IndexError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _load_snapshot(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path, metrics_snapshot):
+    """Replace a snapshot file atomically"""
+    temporary_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary_path, 'w') as f:
+        json.dump(metrics_snapshot, f)
+    os.replace(temporary_path, path)
+
+
+class _SnapshotFlusher:
+    """
+    Thread writing this process's snapshot to METRICS_DIR at an interval
+
+    Processes started by multiprocessing, such as parse pool processes, hand
+    their metrics back instead and never write snapshots.
+    """
+
+    def __init__(self):
+        self._thread = None
+        self._pid = None
+        self._started_at = None
+
+    def ensure_started(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with _lock:
+            if self._pid == pid:
+                return
+            # The start time tells apart processes that reuse a PID
+            self._started_at = time.time_ns()
+            self._pid = pid
+            if not METRICS_DIR or multiprocessing.parent_process() is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='metrics-flush',
+                                            daemon=True)
+            self._thread.start()
+            # Keep what was recorded since the last snapshot
+            atexit.register(self.flush)
+
+    @property
+    def path(self):
+        return os.path.join(METRICS_DIR, f'process-{os.getpid()}-{self._started_at}.json')
+
+    def flush(self, metrics_snapshot=None):
+        """Write this process's snapshot"""
+        if self._pid != os.getpid():
+            return
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            _write_snapshot(self.path, metrics_snapshot or snapshot())
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot: {str(e)}")
+
+    def _run(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            self.flush()
+
+
+_flusher = _SnapshotFlusher()
@@ -0,0 +1,281 @@
+import sqlite3
+import time
+import hashlib
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import DeclarativeBase
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+db = SQLAlchemy(model_class=Base)
+
+
+@event.listens_for(Engine, 'connect')
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Let the workers of this host share a SQLite registry without blocking readers"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA busy_timeout=5000')
+        cursor.close()
+
+
+def _isoformat(timestamp):
+    """Format a Unix timestamp as an ISO 8601 UTC datetime, or None"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+
+def _redacted_url(url):
+    """
+    Identify a feed URL without its path or query, which may hold secret tokens
+
+    Args:
+        url (str): Feed URL
+
+    Returns:
+        dict: The URL's host and the SHA-256 hex digest of the URL
+    """
+    return {
+        "host": urlsplit(url).hostname,
+        "url_hash": hashlib.sha256(url.encode()).hexdigest()
+    }
+
+
+class Feed(db.Model):
+    """
+    Feed registered for background refreshing, with its refresh metrics
+
+    Times are Unix timestamps.
+    """
+    __tablename__ = 'feeds'
+
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(2048), unique=True, nullable=False)
+    refresh_interval = db.Column(db.Integer, nullable=False)
+    timeout = db.Column(db.Integer, nullable=False, default=10)
+    created_at = db.Column(db.Float, nullable=False, default=time.time)
+
+    # Scheduling
+    next_refresh_at = db.Column(db.Float, nullable=False, index=True)
+    last_attempt_at = db.Column(db.Float)
+    last_success_at = db.Column(db.Float)
+
+    # Metrics
+    refresh_count = db.Column(db.Integer, nullable=False, default=0)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    consecutive_failures = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    last_status_code = db.Column(db.Integer)
+    last_duration = db.Column(db.Float)
+    # Seconds the last refresh started after it was due
+    last_refresh_lag = db.Column(db.Float)
+
+    snapshot = db.relationship('FeedSnapshot', uselist=False,
+                               cascade='all, delete-orphan',
+                               back_populates='feed')
+
+    def to_dict(self):
+        """
+        Describe the feed and its refresh metrics
+
+        The URL is only identified by its host and hash.
+
+        Returns:
+            dict: JSON-serializable feed description
+        """
+        snapshot = self.snapshot
+        return {
+            "id": self.id,
+            **_redacted_url(self.url),
+            "refresh_interval": self.refresh_interval,
+            "timeout": self.timeout,
+            "created_at": _isoformat(self.created_at),
+            "next_refresh_at": _isoformat(self.next_refresh_at),
+            "last_attempt_at": _isoformat(self.last_attempt_at),
+            "last_success_at": _isoformat(self.last_success_at),
+            "metrics": {
+                "refresh_count": self.refresh_count,
+                "failure_count": self.failure_count,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_status_code": self.last_status_code,
+                "last_duration": self.last_duration,
+                "last_refresh_lag": self.last_refresh_lag,
+                "snapshot_age": snapshot.age() if snapshot else None
+            },
+            "snapshot": snapshot.to_dict() if snapshot else None
+        }
+
+
+class FeedSnapshot(db.Model):
+    """
+    Latest successful conversion of a registered feed
+    """
+    __tablename__ = 'feed_snapshots'
+
+    feed_id = db.Column(db.Integer, db.ForeignKey('feeds.id', ondelete='CASCADE'),
+                        primary_key=True)
+    # Serialized JSON body, only loaded when the snapshot is served
+    body = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    size = db.Column(db.Integer, nullable=False)
+    etag = db.Column(db.String(64), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    # When the upstream feed was last confirmed to convert to this body
+    fetched_at = db.Column(db.Float, nullable=False)
+    # When the body last changed
+    changed_at = db.Column(db.Float, nullable=False)
+
+    feed = db.relationship('Feed', back_populates='snapshot')
+
+    def age(self):
+        """Seconds since the snapshot was last confirmed current"""
+        return max(0.0, time.time() - self.fetched_at)
+
+    def to_dict(self):
+        return {
+            "size": self.size,
+            "etag": self.etag,
+            "fetched_at": _isoformat(self.fetched_at),
+            "changed_at": _isoformat(self.changed_at)
+        }
+
+
+class SyncJob(db.Model):
+    """
+    Scheduled sync of a feed into a pair of Glide trips/events tables
+
+    The Glide token is not stored; the job names the environment variable
+    holding it. Times are Unix timestamps.
+    """
+    __tablename__ = 'sync_jobs'
+    __table_args__ = (db.UniqueConstraint('url', 'trips_table_id', 'events_table_id'), )
+
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(2048), nullable=False)
+    token_env = db.Column(db.String(255), nullable=False)
+    trips_table_id = db.Column(db.String(255), nullable=False)
+    events_table_id = db.Column(db.String(255), nullable=False)
+    sync_interval = db.Column(db.Integer, nullable=False)
+    timeout = db.Column(db.Integer, nullable=False, default=10)
+    created_at = db.Column(db.Float, nullable=False, default=time.time)
+
+    # Scheduling
+    next_run_at = db.Column(db.Float, nullable=False, index=True)
+    last_run_at = db.Column(db.Float)
+    last_synced_at = db.Column(db.Float)
+
+    # Change detection: hashes of the converted feed and of the rows built
+    # from it as of the last successful sync
+    last_content_hash = db.Column(db.String(64))
+    last_rows_hash = db.Column(db.String(64))
+
+    # Metrics
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    sync_count = db.Column(db.Integer, nullable=False, default=0)
+    skip_count = db.Column(db.Integer, nullable=False, default=0)
+    failure_count = db.Column(db.Integer, nullable=False, default=0)
+    consecutive_failures = db.Column(db.Integer, nullable=False, default=0)
+    last_outcome = db.Column(db.String(16))
+    last_error = db.Column(db.Text)
+    last_duration = db.Column(db.Float)
+    # Seconds the last run started after it was due
+    last_run_lag = db.Column(db.Float)
+    # Per-table summary of the last Glide sync
+    last_result = db.Column(db.JSON)
+
+    def to_dict(self, summary=False):
+        """
+        Describe the sync job and its metrics
+
+        Args:
+            summary (bool): Identify the URL only by its host and hash, and
+                leave out the last error and sync result
+
+        Returns:
+            dict: JSON-serializable job description
+        """
+        job = {
+            "id": self.id,
+            "url": self.url,
+            "token_env": self.token_env,
+            "trips_table_id": self.trips_table_id,
+            "events_table_id": self.events_table_id,
+            "sync_interval": self.sync_interval,
+            "timeout": self.timeout,
+            "created_at": _isoformat(self.created_at),
+            "next_run_at": _isoformat(self.next_run_at),
+            "last_run_at": _isoformat(self.last_run_at),
+            "last_synced_at": _isoformat(self.last_synced_at),
+            "metrics": {
+                "run_count": self.run_count,
+                "sync_count": self.sync_count,
+                "skip_count": self.skip_count,
+                "failure_count": self.failure_count,
+                "consecutive_failures": self.consecutive_failures,
+                "last_outcome": self.last_outcome,
+                "last_error": self.last_error,
+                "last_duration": self.last_duration,
+                "last_run_lag": self.last_run_lag
+            },
+            "last_result": self.last_result
+        }
+        if summary:
+            del job["url"], job["metrics"]["last_error"], job["last_result"]
+            job.update(_redacted_url(self.url))
+        return job
+
+
+class ChangeFeed(db.Model):
+    """
+    Position of a feed URL in its change log, for /api/convert/changes
+
+    The sequence number increases by one for every conversion in which an
+    event was added, modified or removed. IDs of dropped change logs are not
+    reused, so their cursors cannot point into another feed's log.
+    """
+    __tablename__ = 'change_feeds'
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)
+    url = db.Column(db.String(2048), unique=True, nullable=False)
+    seq = db.Column(db.Integer, nullable=False, default=0)
+    # Hash of the converted feed as of seq, to skip unchanged conversions
+    content_hash = db.Column(db.String(64))
+    # Removals up to this sequence number have been forgotten
+    pruned_seq = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.Float, nullable=False, default=time.time)
+
+
+class EventFingerprint(db.Model):
+    """
+    Latest fingerprint of the events with one UID in a feed
+
+    Removed events keep a row without a fingerprint until it is pruned.
+    created_seq is where the event's current presence in the feed began; an
+    event that came back after a removal also keeps where its previous
+    presence began and ended in prior_created_seq and removed_seq. Earlier
+    presences are not remembered.
+    """
+    __tablename__ = 'event_fingerprints'
+    __table_args__ = (db.Index('event_fingerprints_changed', 'change_feed_id',
+                               'changed_seq'), )
+
+    change_feed_id = db.Column(db.Integer,
+                               db.ForeignKey('change_feeds.id', ondelete='CASCADE'),
+                               primary_key=True)
+    uid = db.Column(db.Text, primary_key=True)
+    fingerprint = db.Column(db.String(64))
+    created_seq = db.Column(db.Integer, nullable=False)
+    changed_seq = db.Column(db.Integer, nullable=False)
+    prior_created_seq = db.Column(db.Integer)
+    removed_seq = db.Column(db.Integer)
+    changed_at = db.Column(db.Float, nullable=False)
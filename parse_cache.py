@@ -0,0 +1,159 @@
+import os
+import time
+import hashlib
+import logging
+import sqlite3
+import tempfile
+import threading
+
+
+class ParseCache:
+    """
+    Cross-process cache of serialized parse results keyed by content hash
+
+    Results live in a SQLite database shared by every worker on the host,
+    so a feed parsed by one worker is served by all others without parsing.
+    Entries are evicted once they are older than the maximum age, and least
+    recently used entries are dropped when the total size grows too large.
+    """
+
+    # Only refresh an entry's access time once per this many seconds
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, max_age=24 * 3600):
+        """
+        Args:
+            path (str): SQLite database file, or empty to disable the cache
+            max_bytes (int): Maximum total size of stored results in bytes
+            max_age (int): Seconds after which a stored result is dropped
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return bool(self.path)
+
+    @staticmethod
+    def key_for(content, variant=''):
+        """
+        Compute the cache key for a raw feed body
+
+        Args:
+            content (bytes): Raw iCal feed body
+            variant (str): Parser version and options the result depends on
+
+        Returns:
+            str: Hex digest identifying the parse result
+        """
+        digest = hashlib.sha256(variant.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Look up a serialized result
+
+        Args:
+            key (str): Cache key from key_for
+
+        Returns:
+            bytes: Serialized result, or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                'SELECT body, created_at, accessed_at FROM parse_results WHERE key = ?',
+                (key, )).fetchone()
+            if row is None:
+                return None
+
+            body, created_at, accessed_at = row
+            now = time.time()
+            if now - created_at > self.max_age:
+                conn.execute('DELETE FROM parse_results WHERE key = ?', (key, ))
+                return None
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                conn.execute(
+                    'UPDATE parse_results SET accessed_at = ? WHERE key = ?',
+                    (now, key))
+            return bytes(body)
+        except sqlite3.Error as e:
+            logging.warning(f"Parse cache lookup failed: {str(e)}")
+            return None
+
+    def put(self, key, body):
+        """
+        Store a serialized result and evict entries beyond the limits
+
+        Args:
+            key (str): Cache key from key_for
+            body (bytes): Serialized result
+        """
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+
+        try:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                'INSERT OR REPLACE INTO parse_results '
+                '(key, body, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, body, len(body), now, now))
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            logging.warning(f"Parse cache store failed: {str(e)}")
+
+    def _evict(self, conn, now):
+        """Drop expired entries, then least recently used ones over the size limit"""
+        conn.execute('DELETE FROM parse_results WHERE created_at < ?',
+                     (now - self.max_age, ))
+
+        total = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM parse_results').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in conn.execute(
+                'SELECT key, size FROM parse_results ORDER BY accessed_at'):
+            victims.append((key, ))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany('DELETE FROM parse_results WHERE key = ?', victims)
+
+    def _connection(self):
+        """Get this thread's connection, reopening it after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS parse_results ('
+                     'key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL, '
+                     'created_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS parse_results_accessed '
+                     'ON parse_results (accessed_at)')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+
+# Cache shared by all workers on this host
+parse_cache = ParseCache(
+    path=os.environ.get(
+        'PARSE_CACHE_PATH',
+        os.path.join(tempfile.gettempdir(), 'ical_parse_cache.sqlite3')),
+    max_bytes=int(os.environ.get('PARSE_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    max_age=int(os.environ.get('PARSE_CACHE_MAX_AGE', 24 * 3600)),
+)
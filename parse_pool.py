@@ -0,0 +1,169 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+import profiling
+
+# Processes parsing feeds for each worker; 0 parses in the calling thread
+PARSE_POOL_WORKERS = int(os.environ.get('PARSE_POOL_WORKERS', 2))
+# Inputs smaller than this many bytes are processed in the calling thread,
+# where they take little longer than handing them to a pool process would
+PARSE_POOL_MIN_BYTES = int(os.environ.get('PARSE_POOL_MIN_BYTES', 16384))
+# Jobs that may wait for a pool process besides the running ones; further
+# callers wait for room until their deadline
+PARSE_POOL_MAX_QUEUE = int(os.environ.get('PARSE_POOL_MAX_QUEUE', 8))
+
+_lock = threading.Lock()
+_pool = None
+_pool_pid = None
+_slots = None
+
+
+class PoolTimeout(Exception):
+    """Raised when a pool job does not finish before its deadline"""
+    pass
+
+
+def _get_pool():
+    """
+    Get the process pool of this worker, creating it on first use
+
+    Pool processes are spawned rather than forked, so they never inherit the
+    threads, sockets or SQLite connections of a running worker.
+
+    Returns:
+        tuple: (ProcessPoolExecutor, semaphore bounding its jobs), or
+            (None, None) if parsing runs in-process
+    """
+    global _pool, _pool_pid, _slots
+
+    if PARSE_POOL_WORKERS <= 0:
+        return None, None
+
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool, _slots
+
+    with _lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = ProcessPoolExecutor(
+                max_workers=PARSE_POOL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'))
+            _slots = threading.BoundedSemaphore(
+                PARSE_POOL_WORKERS + max(0, PARSE_POOL_MAX_QUEUE))
+            _pool_pid = pid
+        return _pool, _slots
+
+
+def _discard_pool(pool):
+    """Drop a broken pool so the next call starts a new one"""
+    global _pool
+
+    with _lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _remaining(deadline):
+    """Seconds left until a time.monotonic() deadline, or None without one"""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def run(fn, *args, size=None, deadline=None):
+    """
+    Run a CPU-bound function in the worker's parse process pool
+
+    The calling thread blocks until the result is ready but releases the
+    GIL, so other requests of the worker keep being served meanwhile. Inputs
+    smaller than PARSE_POOL_MIN_BYTES are processed in the calling thread
+    instead, as is everything if the pool breaks, e.g. because a pool process
+    was killed. Metrics recorded by fn in the pool process are recorded in
+    the calling worker, and if the current request is profiled, fn is
+    profiled in the pool process too.
+
+    At most PARSE_POOL_MAX_QUEUE jobs wait for a pool process; callers wait
+    for room, and for their job, until their deadline. A job given up on is
+    cancelled if it has not started yet, and otherwise still runs to the end.
+
+    Args:
+        fn (callable): Module-level function, picklable along with its
+            arguments and result
+        *args: Arguments for fn
+        size (int): Size of the input in bytes, if known
+        deadline (float): time.monotonic() time by which the result is needed
+
+    Returns:
+        Result of fn(*args)
+
+    Raises:
+        PoolTimeout: If the result is not ready by the deadline
+    """
+    pool, slots = _get_pool()
+    if pool is None or (size is not None and size < PARSE_POOL_MIN_BYTES):
+        metrics.PARSE_JOBS.inc(route='inline')
+        return fn(*args)
+
+    metrics.PARSE_JOBS.inc(route='pool')
+    queued_at = time.time()
+    if not slots.acquire(timeout=_remaining(deadline)):
+        metrics.PARSE_POOL_TIMEOUTS.inc()
+        raise PoolTimeout("Deadline passed waiting for room in the parse pool")
+
+    profile = profiling.active()
+    try:
+        future = pool.submit(_run_captured, fn, args, profile and profile.mode)
+    except (BrokenProcessPool, RuntimeError):
+        # RuntimeError: the pool was shut down after breaking in another thread
+        slots.release()
+        logging.error("Parse process pool broke, parsing in-process")
+        _discard_pool(pool)
+        return fn(*args)
+
+    # The job holds its room until it finishes, even if given up on
+    metrics.PARSE_POOL_PENDING.inc()
+
+    def job_done(_):
+        slots.release()
+        metrics.PARSE_POOL_PENDING.dec()
+    future.add_done_callback(job_done)
+
+    try:
+        result, observations, profile_data, started_at = future.result(
+            timeout=_remaining(deadline))
+    except FutureTimeoutError:
+        future.cancel()
+        metrics.PARSE_POOL_TIMEOUTS.inc()
+        raise PoolTimeout("Deadline passed before the parse pool finished the job")
+    except BrokenProcessPool:
+        logging.error("Parse process pool broke, parsing in-process")
+        _discard_pool(pool)
+        return fn(*args)
+
+    # Wall clock times, comparable across processes
+    metrics.PARSE_POOL_WAIT_SECONDS.observe(max(0.0, started_at - queued_at))
+    metrics.replay(observations)
+    if profile_data is not None:
+        profile.add(profile_data)
+    return result
+
+
+def _run_captured(fn, args, profile_mode=None):
+    """
+    Run fn in a pool process, returning its result, captured metrics, given a
+    profile mode its profile data, and the time it started at
+    """
+    started_at = time.time()
+    profile_data = None
+    with metrics.capture() as observations:
+        if profile_mode:
+            result, profile_data = profiling.profile_call(profile_mode, fn, *args)
+        else:
+            result = fn(*args)
+    return result, observations, profile_data, started_at
@@ -0,0 +1,328 @@
+import os
+import re
+import sys
+import time
+import uuid
+import hmac
+import pstats
+import cProfile
+import logging
+import tempfile
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Secret an operator sends to profile a single request; empty disables profiling
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+# Directory where profiles are stored until downloaded
+PROFILE_DIR = os.environ.get('PROFILE_DIR',
+                             os.path.join(tempfile.gettempdir(), 'ical_profiles'))
+# Most recent profiles kept in PROFILE_DIR
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 50))
+# Seconds between stack samples of the collapsed mode
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+# Deterministic profile in the pstats format, or sampled stacks in the collapsed
+# format read by flamegraph.pl and speedscope
+PROFILE_MODES = {'pstats': '.prof', 'collapsed': '.collapsed'}
+
+# Stacks sampled in a parse pool process are rooted under this frame
+POOL_PROCESS_FRAME = '[parse pool process]'
+
+_PROFILE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+_current = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """
+    Profile of one request, over every thread and pool process working on it
+
+    Threads are attached to the profile while they work on the request. In
+    pstats mode each attached thread runs under its own cProfile profiler;
+    in collapsed mode a sampler thread records the stacks of the attached
+    threads at PROFILE_SAMPLE_INTERVAL.
+    """
+
+    def __init__(self, mode):
+        """
+        Args:
+            mode (str): 'pstats' or 'collapsed'
+        """
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._profilers = []
+        self._stacks = {}
+        self._threads = set()
+        self._sampler = None
+        self._stopped = threading.Event()
+        # Handle of the thread the request started in
+        self.handle = None
+
+    def enable(self):
+        """
+        Start profiling the calling thread
+
+        Returns:
+            Handle to pass to disable
+        """
+        if self.mode == 'pstats':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            return profiler
+
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads.add(ident)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample,
+                                                 name='profile-sampler', daemon=True)
+                self._sampler.start()
+        return ident
+
+    def disable(self, handle):
+        """Stop profiling the thread of an enable call"""
+        if self.mode == 'pstats':
+            handle.disable()
+            with self._lock:
+                self._profilers.append(handle)
+            return
+
+        with self._lock:
+            self._threads.discard(handle)
+
+    @contextmanager
+    def attach(self):
+        """Profile the calling thread for the duration of the block"""
+        handle = self.enable()
+        try:
+            yield
+        finally:
+            self.disable(handle)
+
+    def add(self, data):
+        """
+        Add the profile data of a pool process
+
+        Args:
+            data: Result of data() in the pool process
+        """
+        with self._lock:
+            if self.mode == 'pstats':
+                self._profilers.append(_Stats(data))
+                return
+            for stack, count in data.items():
+                stack = f'{POOL_PROCESS_FRAME};{stack}'
+                self._stacks[stack] = self._stacks.get(stack, 0) + count
+
+    def data(self):
+        """
+        Stop sampling and get the profile data, picklable
+
+        Returns:
+            dict: pstats statistics, or sample counts by collapsed stack
+        """
+        if self.mode == 'pstats':
+            stats = None
+            for collected in self._profilers:
+                if stats is None:
+                    stats = pstats.Stats(collected)
+                else:
+                    stats.add(collected)
+            return stats.stats if stats is not None else {}
+
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        return dict(self._stacks)
+
+    def save(self, label):
+        """
+        Store the profile in PROFILE_DIR, dropping the oldest stored profiles
+
+        Args:
+            label (str): Name included in the profile ID, e.g. the endpoint
+
+        Returns:
+            str: Profile ID to download the profile with
+        """
+        data = self.data()
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, profile_id + PROFILE_MODES[self.mode])
+
+        if self.mode == 'pstats':
+            stats = pstats.Stats(_Stats(data))
+            stats.dump_stats(path)
+        else:
+            with open(path, 'w') as f:
+                for stack, count in sorted(data.items()):
+                    f.write(f'{stack} {count}\n')
+
+        _prune_profiles()
+        return profile_id
+
+    def _sample(self):
+        while not self._stopped.wait(PROFILE_SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in self._threads:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = ';'.join(reversed(_frame_names(frame)))
+                    self._stacks[stack] = self._stacks.get(stack, 0) + 1
+            del frames
+
+
+class _Stats:
+    """pstats statistics in the form pstats.Stats loads from a profiler"""
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def _frame_names(frame):
+    """Names of a frame and its callers, innermost first, as module:function"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get('__name__') or os.path.basename(code.co_filename)
+        names.append(f'{module}:{code.co_qualname}')
+        frame = frame.f_back
+    return names
+
+
+def authorized(secret):
+    """
+    Check a secret sent to profile a request
+
+    Args:
+        secret (str): Secret from the request, or None
+
+    Returns:
+        bool: True if profiling is enabled and the secret matches
+    """
+    if not PROFILE_SECRET or not secret:
+        return False
+    return hmac.compare_digest(secret.encode(), PROFILE_SECRET.encode())
+
+
+def start(mode):
+    """
+    Profile the current request, starting with the calling thread
+
+    Args:
+        mode (str): 'pstats' or 'collapsed'
+
+    Returns:
+        RequestProfile: Profile of the request
+    """
+    profile = RequestProfile(mode)
+    profile.handle = profile.enable()
+    _current.set(profile)
+    return profile
+
+
+def stop(label):
+    """
+    Stop profiling the current request and store its profile
+
+    Args:
+        label (str): Name included in the profile ID
+
+    Returns:
+        str: Profile ID, or None if the request was not profiled or its
+            profile could not be stored
+    """
+    profile = _current.get()
+    if profile is None:
+        return None
+    _current.set(None)
+    profile.disable(profile.handle)
+    try:
+        return profile.save(label)
+    except OSError as e:
+        logging.error(f"Could not store profile: {str(e)}")
+        return None
+
+
+def active():
+    """
+    Get the profile of the current request
+
+    Returns:
+        RequestProfile: Profile, or None if the request is not profiled
+    """
+    return _current.get()
+
+
+def call(fn, *args):
+    """
+    Call a function working on the current request in another thread,
+    profiling the thread if the request is profiled
+
+    Args:
+        fn (callable): Function to call
+        *args: Arguments for fn
+
+    Returns:
+        Result of fn(*args)
+    """
+    profile = _current.get()
+    if profile is None:
+        return fn(*args)
+    with profile.attach():
+        return fn(*args)
+
+
+def profile_call(mode, fn, *args):
+    """
+    Call a function under a profile of its own, e.g. in a pool process
+
+    Args:
+        mode (str): 'pstats' or 'collapsed'
+        fn (callable): Function to call
+        *args: Arguments for fn
+
+    Returns:
+        tuple: (result of fn(*args), profile data for RequestProfile.add)
+    """
+    profile = RequestProfile(mode)
+    with profile.attach():
+        result = fn(*args)
+    return result, profile.data()
+
+
+def profile_path(profile_id):
+    """
+    Find a stored profile
+
+    Args:
+        profile_id (str): Profile ID returned by stop
+
+    Returns:
+        str: Path of the profile file, or None if there is no such profile
+    """
+    if not _PROFILE_ID_PATTERN.match(profile_id):
+        return None
+    for extension in PROFILE_MODES.values():
+        path = os.path.join(PROFILE_DIR, profile_id + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _prune_profiles():
+    """Remove the oldest profiles beyond PROFILE_MAX_FILES"""
+    try:
+        paths = [os.path.join(PROFILE_DIR, filename)
+                 for filename in os.listdir(PROFILE_DIR)
+                 if filename.endswith(tuple(PROFILE_MODES.values()))]
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:max(0, len(paths) - PROFILE_MAX_FILES)]:
+            os.remove(path)
+    except OSError as e:
+        logging.warning(f"Could not prune stored profiles: {str(e)}")
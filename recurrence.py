@@ -0,0 +1,206 @@
+import os
+import re
+import logging
+from datetime import datetime, timedelta
+from functools import lru_cache
+from dateutil.rrule import rrulestr, rruleset
+import pytz
+
+# Most occurrences materialized for one series and window
+MAX_OCCURRENCES = int(os.environ.get('RECURRENCE_MAX_OCCURRENCES', 5000))
+
+
+def series_definition(component):
+    """
+    Extract what defines the occurrences of a recurring VEVENT
+
+    Args:
+        component: icalendar VEVENT component
+
+    Returns:
+        dict: Hashable 'dtstart', 'rule', 'rdates', 'exdates' and 'duration'
+            of the series, or None if the event does not recur
+    """
+    rrule = component.get('RRULE', None)
+    rdates = _date_list(component.get('RDATE', None))
+    if not rrule and not rdates:
+        return None
+
+    dtstart = component['DTSTART'].dt
+    dtend = component.get('DTEND', None)
+    duration = component.get('DURATION', None)
+    if dtend:
+        duration = _as_datetime(dtend.dt, dtstart) - _as_datetime(dtstart, dtstart)
+    elif duration:
+        duration = duration.dt
+    elif not isinstance(dtstart, datetime):
+        duration = timedelta(days=1)
+    else:
+        duration = timedelta(0)
+
+    return {
+        'dtstart': dtstart,
+        'rule': rrule.to_ical().decode('utf-8') if rrule else '',
+        'rdates': rdates,
+        'exdates': _date_list(component.get('EXDATE', None)),
+        'duration': duration,
+    }
+
+
+def iter_occurrences(series, window_start, window_end):
+    """
+    Generate the occurrences of a series that overlap a window
+
+    Occurrences are produced lazily in start order, so rules without an end
+    never generate more than the occurrences up to the end of the window.
+
+    Args:
+        series (dict): Series definition from series_definition
+        window_start (datetime): Start of the window (timezone-aware)
+        window_end (datetime): End of the window (timezone-aware)
+
+    Yields:
+        date or datetime: Start of each occurrence, of the same type as DTSTART
+    """
+    dtstart = series['dtstart']
+    duration = series['duration']
+    start = _as_datetime(dtstart, dtstart)
+
+    rules = rruleset()
+    if series['rule']:
+        rules.rrule(_build_rule(series['rule'], start))
+    else:
+        # RDATE-only series still include DTSTART itself
+        rules.rdate(start)
+    for value in series['rdates']:
+        rules.rdate(_as_datetime(value, dtstart))
+    for value in series['exdates']:
+        rules.exdate(_as_datetime(value, dtstart))
+
+    # Occurrences starting before the window still overlap it while they last
+    lower = _window_bound(window_start, start) - duration
+    upper = _window_bound(window_end, start)
+    lower_bound = _window_bound(window_start, start)
+
+    # pytz zones keep the offset of DTSTART; give each occurrence its own
+    localize = getattr(start.tzinfo, 'localize', None)
+
+    for occurrence in rules.xafter(lower, inc=True):
+        if localize is not None:
+            occurrence = localize(occurrence.replace(tzinfo=None))
+        if occurrence >= upper:
+            break
+        end = occurrence + duration
+        if end > lower_bound or (duration == timedelta(0) and occurrence >= lower_bound):
+            yield occurrence if isinstance(dtstart, datetime) else occurrence.date()
+
+
+@lru_cache(maxsize=int(os.environ.get('RECURRENCE_CACHE_SIZE', 1024)))
+def cached_occurrences(uid, dtstart, rule, rdates, exdates, duration,
+                       window_start, window_end):
+    """
+    Expand a series within a window, caching the result per series and window
+
+    Args:
+        uid (str): UID of the series
+        dtstart, rule, rdates, exdates, duration: Series definition values
+        window_start (datetime): Start of the window (timezone-aware)
+        window_end (datetime): End of the window (timezone-aware)
+
+    Returns:
+        tuple: Occurrence starts within the window, at most MAX_OCCURRENCES
+    """
+    series = {
+        'dtstart': dtstart,
+        'rule': rule,
+        'rdates': rdates,
+        'exdates': exdates,
+        'duration': duration,
+    }
+    occurrences = []
+    try:
+        for occurrence in iter_occurrences(series, window_start, window_end):
+            if len(occurrences) >= MAX_OCCURRENCES:
+                logging.warning(
+                    f"Recurring event {uid} has more than {MAX_OCCURRENCES} "
+                    "occurrences in the window; truncating")
+                break
+            occurrences.append(occurrence)
+    except (ValueError, TypeError) as e:
+        logging.warning(f"Cannot expand recurring event {uid}: {str(e)}")
+        return None
+    return tuple(occurrences)
+
+
+def _build_rule(rule, start):
+    """
+    Build a dateutil rule, reconciling UNTIL with the kind of DTSTART
+
+    Args:
+        rule (str): RRULE value
+        start (datetime): Series start as a datetime
+
+    Returns:
+        dateutil.rrule.rrule: Parsed rule
+    """
+    if start.tzinfo is None:
+        # Floating series compare UNTIL as wall-clock time
+        return rrulestr(rule, dtstart=start, ignoretz=True)
+
+    # UNTIL must be UTC for timezone-aware series; feeds often omit the Z
+    def to_utc(match):
+        value = match.group(1)
+        if 'T' not in value:
+            value += 'T235959'
+        return f'UNTIL={value}Z'
+
+    rule = re.sub(r'UNTIL=(\d{8}(?:T\d{6})?)(?![\dTZ])', to_utc, rule)
+    return rrulestr(rule, dtstart=start)
+
+
+def _date_list(prop):
+    """Flatten RDATE/EXDATE properties into a tuple of date/datetime values"""
+    if not prop:
+        return ()
+    props = prop if isinstance(prop, list) else [prop]
+    values = []
+    for item in props:
+        for value in getattr(item, 'dts', []):
+            dt = value.dt
+            # Periods are given as (start, end or duration)
+            if isinstance(dt, tuple):
+                dt = dt[0]
+            values.append(dt)
+    return tuple(values)
+
+
+def _as_datetime(value, dtstart):
+    """
+    Convert a date or datetime to a datetime comparable with DTSTART
+
+    Args:
+        value: date or datetime
+        dtstart: DTSTART value of the series
+
+    Returns:
+        datetime: Value as a datetime of the same kind (aware or floating)
+    """
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, datetime.min.time())
+        if isinstance(dtstart, datetime) and dtstart.tzinfo is not None:
+            value = value.replace(tzinfo=pytz.UTC)
+        return value
+
+    aware = isinstance(dtstart, datetime) and dtstart.tzinfo is not None
+    if aware and value.tzinfo is None:
+        return value.replace(tzinfo=pytz.UTC)
+    if not aware and value.tzinfo is not None:
+        return value.astimezone(pytz.UTC).replace(tzinfo=None)
+    return value
+
+
+def _window_bound(bound, start):
+    """Convert a timezone-aware window bound to the kind of the series start"""
+    if start.tzinfo is None:
+        return bound.astimezone(pytz.UTC).replace(tzinfo=None)
+    return bound
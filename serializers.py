@@ -0,0 +1,115 @@
+import os
+import json
+import logging
+from datetime import date, datetime
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# 'stdlib' produces the same bytes as jsonify; 'orjson' is faster, but writes
+# non-ASCII characters unescaped
+JSON_SERIALIZER = os.environ.get('JSON_SERIALIZER', 'stdlib')
+
+
+def _native_default(value):
+    """Encode date and datetime values that a backend has no native form for"""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(value):
+    """Serialize with the json module, with the same settings as jsonify"""
+    return json.dumps(value, ensure_ascii=True, sort_keys=True,
+                      separators=(',', ':'), default=_native_default).encode('utf-8')
+
+
+def _orjson_dumps(value):
+    """Serialize with orjson, which encodes dates and datetimes natively"""
+    return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+
+
+JSON_BACKENDS = {'stdlib': (_stdlib_dumps, json.loads)}
+if orjson is not None:
+    JSON_BACKENDS['orjson'] = (_orjson_dumps, orjson.loads)
+
+
+def _select_backend(name):
+    """
+    Pick the JSON backend to use
+
+    Args:
+        name (str): Name of a backend in JSON_BACKENDS
+
+    Returns:
+        tuple: (backend name, (dumps, loads))
+    """
+    if name not in JSON_BACKENDS:
+        logging.warning(f"JSON serializer '{name}' is not available, using stdlib")
+        name = 'stdlib'
+    return name, JSON_BACKENDS[name]
+
+
+json_backend, (dumps, loads) = _select_backend(JSON_SERIALIZER)
+
+
+def encode_result(data):
+    """
+    Serialize a parsed result as a JSON response body
+
+    Args:
+        data (dict): Parsed calendar data
+
+    Returns:
+        bytes: JSON response body, ending with a newline like jsonify's
+    """
+    return dumps(data) + b'\n'
+
+
+def msgpack_available():
+    """Whether the msgpack format can be produced"""
+    return msgpack is not None
+
+
+def encode_msgpack(data):
+    """
+    Serialize a parsed result as MessagePack
+
+    Args:
+        data (dict): Parsed calendar data
+
+    Returns:
+        bytes: MessagePack encoded body
+
+    Raises:
+        RuntimeError: If the msgpack package is not installed
+    """
+    if msgpack is None:
+        raise RuntimeError('The msgpack package is not installed')
+    return msgpack.packb(data, use_bin_type=True, default=_native_default)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider that serializes with the selected backend
+
+    Pretty-printed output (indent) is left to the stdlib encoder.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent') is not None:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
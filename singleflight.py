@@ -0,0 +1,157 @@
+import asyncio
+import threading
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a caller gives up waiting for an in-flight call"""
+
+
+class _Call:
+    """
+    A call in progress and the outcome shared with everyone waiting on it
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls for the same key within this process
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for it and receive the same result instead of
+    running the function themselves.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {
+            'calls': 0,
+            'coalesced': 0,
+            'timeouts': 0,
+        }
+
+    def do(self, key, fn, timeout=None):
+        """
+        Run fn once for all concurrent callers using the same key
+
+        Args:
+            key: Key identifying the work
+            fn (callable): Function to run when no call for the key is in flight
+            timeout (float): Seconds to wait for an in-flight call, or None
+                to wait until it finishes
+
+        Returns:
+            tuple: (result, whether the result came from another caller's call)
+
+        Raises:
+            SingleFlightTimeout: If the in-flight call did not finish in time
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats['calls'] += 1
+            else:
+                self._stats['coalesced'] += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if not call.done.wait(timeout):
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise SingleFlightTimeout(f'Timed out waiting for in-flight call for {key}')
+        if call.error is not None:
+            raise call.error
+        return call.result, True
+
+    def stats(self):
+        """
+        Get deduplication counters
+
+        Returns:
+            dict: Calls run, callers coalesced onto them, waits timed out and
+                calls currently in flight
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+            return stats
+
+
+class AsyncSingleFlight:
+    """
+    Deduplicate concurrent coroutine calls for the same key within an event loop
+
+    The asyncio counterpart of SingleFlight: the first caller for a key runs
+    the coroutine, later callers await the same task.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self._stats = {
+            'calls': 0,
+            'coalesced': 0,
+            'timeouts': 0,
+        }
+
+    async def do(self, key, fn, timeout=None):
+        """
+        Run fn once for all concurrent callers using the same key
+
+        Args:
+            key: Key identifying the work
+            fn (callable): Function returning the coroutine to run when no
+                call for the key is in flight
+            timeout (float): Seconds to wait for an in-flight call, or None
+                to wait until it finishes
+
+        Returns:
+            tuple: (result, whether the result came from another caller's call)
+
+        Raises:
+            SingleFlightTimeout: If the in-flight call did not finish in time
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            self._stats['calls'] += 1
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            # Shielded, so the call survives its caller being cancelled
+            return await asyncio.shield(task), False
+
+        self._stats['coalesced'] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout), True
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise SingleFlightTimeout(f'Timed out waiting for in-flight call for {key}')
+
+    def stats(self):
+        """
+        Get deduplication counters
+
+        Returns:
+            dict: Calls run, callers coalesced onto them, waits timed out and
+                calls currently in flight
+        """
+        stats = dict(self._stats)
+        stats['in_flight'] = len(self._tasks)
+        return stats
@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import requests
+from feed_scheduler import feed_scheduler, fresh_snapshot, next_refresh_time
+from glide_rows import glide_table_url, build_glide_rows, sync_summary
+from glide_sync import sync_tables
+from ical_parser import fetch_and_parse_ical
+from models import db, SyncJob
+from serializers import dumps, encode_result
+
+# Sync jobs can only read Glide tokens from environment variables named
+# with this prefix
+GLIDE_TOKEN_ENV_PREFIX = os.environ.get('GLIDE_TOKEN_ENV_PREFIX', 'GLIDE_TOKEN')
+# Seconds after which a job writes to Glide even though the feed did not
+# change, to repair edits made to the tables in Glide
+GLIDE_SYNC_MAX_SKIP_AGE = int(os.environ.get('GLIDE_SYNC_MAX_SKIP_AGE', 24 * 3600))
+
+# Glide table IDs are used in API URLs
+TABLE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def glide_token(token_env):
+    """
+    Look up the Glide token a sync job refers to
+
+    Args:
+        token_env (str): Name of the environment variable holding the token
+
+    Returns:
+        str: Token, or None if the variable is not an allowed token
+            variable or is not set
+    """
+    if not token_env or not token_env.startswith(GLIDE_TOKEN_ENV_PREFIX):
+        return None
+    return os.environ.get(token_env) or None
+
+
+def rows_hash(trips_to_update, events_to_update):
+    """
+    Hash the rows built for a sync
+
+    Returns:
+        str: Hex digest identifying the trip and event rows
+    """
+    return hashlib.sha256(dumps([trips_to_update, events_to_update])).hexdigest()
+
+
+def run_sync_job(job, due_at=None):
+    """
+    Run a sync job, writing to Glide only if the feed's rows changed
+
+    The feed is taken from its snapshot when the URL is registered and the
+    snapshot is fresh, and fetched otherwise. If the converted feed is the
+    same as at the last successful sync, or it changed but builds the same
+    rows, the Glide tables are neither read nor written.
+
+    Must be called within an app context.
+
+    Args:
+        job (SyncJob): Registered sync job
+        due_at (float): Unix timestamp the run was scheduled for
+
+    Returns:
+        str: 'synced', 'skipped' or 'failed'
+    """
+    started = time.time()
+    job.last_run_at = started
+    if due_at is not None:
+        job.last_run_lag = max(0.0, started - due_at)
+    job.run_count += 1
+
+    try:
+        outcome, error = _sync(job, started)
+    except requests.RequestException as e:
+        outcome, error = 'failed', f"Error communicating with Glide API: {str(e)}"
+    except Exception as e:
+        outcome, error = 'failed', f"Error during sync process: {str(e)}"
+
+    job.last_outcome = outcome
+    job.last_duration = time.time() - started
+    if outcome == 'failed':
+        logging.warning(f"Sync job {job.id} for {job.url} failed: {error}")
+        job.last_error = error
+        job.failure_count += 1
+        job.consecutive_failures += 1
+    else:
+        job.last_error = None
+        job.consecutive_failures = 0
+        if outcome == 'skipped':
+            job.skip_count += 1
+        else:
+            job.sync_count += 1
+
+    job.next_run_at = next_refresh_time(time.time(), job.sync_interval,
+                                        job.consecutive_failures)
+    db.session.commit()
+    return outcome
+
+
+def _sync(job, started):
+    """
+    Convert the job's feed and sync it if its rows changed
+
+    Returns:
+        tuple: (outcome, error message or None)
+    """
+    token = glide_token(job.token_env)
+    if token is None:
+        return 'failed', f"Glide token variable {job.token_env} is not set"
+
+    result = fresh_snapshot(job.url)
+    if result is None:
+        result = fetch_and_parse_ical(job.url, job.timeout)
+    if not result['success']:
+        return 'failed', result['message']
+
+    body = result.get('json')
+    if body is None:
+        body = encode_result(result['data'])
+    content_hash = hashlib.sha256(body).hexdigest()
+
+    # Write anyway once in a while, in case the tables were edited in Glide
+    due_for_full_sync = (job.last_synced_at is None
+                         or started - job.last_synced_at > GLIDE_SYNC_MAX_SKIP_AGE)
+    if not due_for_full_sync and content_hash == job.last_content_hash:
+        return 'skipped', None
+
+    trips_to_update, events_to_update = build_glide_rows(result['data']['events'])
+    new_rows_hash = rows_hash(trips_to_update, events_to_update)
+    if not due_for_full_sync and new_rows_hash == job.last_rows_hash:
+        job.last_content_hash = content_hash
+        return 'skipped', None
+
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    trips_api_url = glide_table_url(job.trips_table_id)
+    events_api_url = glide_table_url(job.events_table_id)
+    results = sync_tables(headers, {
+        trips_api_url: trips_to_update,
+        events_api_url: events_to_update
+    })
+    summary = sync_summary(results, trips_api_url, events_api_url)
+    job.last_result = summary
+    if not summary['success']:
+        failed_table = summary['events'] if summary['trips']['success'] else summary['trips']
+        return 'failed', failed_table['message']
+
+    job.last_content_hash = content_hash
+    job.last_rows_hash = new_rows_hash
+    job.last_synced_at = time.time()
+    return 'synced', None
+
+
+feed_scheduler.register('sync', SyncJob, SyncJob.next_run_at, run_sync_job)
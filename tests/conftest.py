@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Keep the tests' registry apart from any configured one, and the scheduler off
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(),
+                                                         'registry.sqlite3')
+os.environ['FEED_REFRESH_CONCURRENCY'] = '0'
+
+import glide_sync
+from glide_snapshots import TableSnapshotCache
+from mock_glide import MockGlide
+
+
+@pytest.fixture(scope='session')
+def glide_server():
+    mock = MockGlide().start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def glide(glide_server, monkeypatch):
+    """Empty mock Glide API, with the table snapshots of earlier tests dropped"""
+    glide_server.reset()
+    monkeypatch.setattr(glide_server, 'page_size', None)
+    monkeypatch.setattr(glide_sync, 'table_snapshots', TableSnapshotCache())
+    # Send failed writes again right away
+    monkeypatch.setattr(glide_sync, '_retry_delay', lambda *args: 0)
+    return glide_server
+
+
+@pytest.fixture
+def registry():
+    """App context on an empty feed registry database"""
+    from app import app
+    from models import db
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
@@ -0,0 +1,151 @@
+import hashlib
+import pytest
+import event_changes
+from event_changes import (CursorError, CursorExpired, TooManyFeeds, encode_cursor,
+                           feed_changes)
+from models import EventFingerprint
+from serializers import dumps
+
+URL = 'https://example.com/team.ics'
+
+
+def event(uid, summary='Practice'):
+    return {'uid': uid, 'summary': summary}
+
+
+def convert(events, since=None, url=URL):
+    """Record a conversion of the feed, as /api/convert/changes does"""
+    content_hash = hashlib.sha256(dumps(events)).hexdigest()
+    return feed_changes(url, events, content_hash, since)
+
+
+def uids(changes):
+    return ({event['uid'] for event in changes['added']},
+            {event['uid'] for event in changes['modified']},
+            set(changes['removed']))
+
+
+def test_first_call_lists_every_event_as_added(registry):
+    changes = convert([event('a'), event('b')])
+
+    assert uids(changes) == ({'a', 'b'}, set(), set())
+    assert changes['cursor']
+
+
+def test_changes_since_a_cursor(registry):
+    cursor = convert([event('a'), event('b'), event('c')])['cursor']
+
+    changes = convert([event('a'), event('b', 'Game'), event('d')], since=cursor)
+
+    assert uids(changes) == ({'d'}, {'b'}, {'c'})
+    assert changes['modified'] == [event('b', 'Game')]
+
+
+def test_unchanged_feed_keeps_the_cursor(registry):
+    cursor = convert([event('a')])['cursor']
+
+    changes = convert([event('a')], since=cursor)
+
+    assert uids(changes) == (set(), set(), set())
+    assert changes['cursor'] == cursor
+
+
+def test_event_added_and_removed_since_the_cursor_is_not_listed(registry):
+    cursor = convert([event('a')])['cursor']
+    convert([event('a'), event('b')])
+    convert([event('a')])
+
+    changes = convert([event('a')], since=cursor)
+
+    assert uids(changes) == (set(), set(), set())
+
+
+def test_event_back_after_a_removal(registry):
+    held = convert([event('a'), event('b')])['cursor']
+    removed = convert([event('a')])['cursor']
+    back = convert([event('a'), event('b', 'Back')])['cursor']
+
+    # A client holding the event gets it as modified, not as a second copy
+    assert uids(convert([event('a'), event('b', 'Back')], since=held)) == (
+        set(), {'b'}, set())
+    # A client that saw the removal gets it as added
+    assert uids(convert([event('a'), event('b', 'Back')], since=removed)) == (
+        {'b'}, set(), set())
+    assert uids(convert([event('a'), event('b', 'Back')], since=back)) == (
+        set(), set(), set())
+
+
+def test_event_added_removed_and_back_since_the_cursor_is_added(registry):
+    cursor = convert([event('a')])['cursor']
+    convert([event('a'), event('b')])
+    convert([event('a')])
+    convert([event('a'), event('b', 'Back')])
+
+    changes = convert([event('a'), event('b', 'Back')], since=cursor)
+
+    assert uids(changes) == ({'b'}, set(), set())
+
+
+def test_event_removed_again_after_coming_back(registry):
+    held = convert([event('a'), event('b')])['cursor']
+    removed = convert([event('a')])['cursor']
+    back = convert([event('a'), event('b', 'Back')])['cursor']
+    convert([event('a')])
+
+    assert uids(convert([event('a')], since=held)) == (set(), set(), {'b'})
+    assert uids(convert([event('a')], since=removed)) == (set(), set(), set())
+    assert uids(convert([event('a')], since=back)) == (set(), set(), {'b'})
+
+
+def test_malformed_cursor_is_rejected(registry):
+    convert([event('a')])
+
+    with pytest.raises(CursorError):
+        convert([event('a')], since='not a cursor')
+
+
+def test_cursor_of_another_feed_is_rejected(registry):
+    cursor = convert([event('a')], url='https://example.com/other.ics')['cursor']
+
+    with pytest.raises(CursorError):
+        convert([event('a')], since=cursor)
+
+
+def test_cursor_ahead_of_the_feed_is_rejected(registry):
+    changes = convert([event('a')])
+    change_feed_id = event_changes.decode_cursor(changes['cursor'])[0]
+
+    with pytest.raises(CursorError):
+        convert([event('a')], since=encode_cursor(change_feed_id, 99))
+
+
+def test_cursor_older_than_the_remembered_removals_expires(registry, monkeypatch):
+    cursor = convert([event('a'), event('b')])['cursor']
+    # Forget removals as soon as they are recorded
+    monkeypatch.setattr(event_changes, 'CHANGES_RETENTION', -60)
+
+    with pytest.raises(CursorExpired):
+        convert([event('a')], since=cursor)
+
+
+def test_feeds_beyond_the_limit_are_not_tracked(registry, monkeypatch):
+    monkeypatch.setattr(event_changes, 'CHANGES_MAX_FEEDS', 1)
+    convert([event('a')])
+
+    with pytest.raises(TooManyFeeds):
+        convert([event('a')], url='https://example.com/other.ics')
+    # Feeds already tracked can still be polled
+    assert uids(convert([event('a'), event('b')])) == ({'a', 'b'}, set(), set())
+
+
+def test_abandoned_feeds_are_dropped_for_new_ones(registry, monkeypatch):
+    monkeypatch.setattr(event_changes, 'CHANGES_MAX_FEEDS', 1)
+    cursor = convert([event('a')])['cursor']
+    monkeypatch.setattr(event_changes, 'CHANGES_RETENTION', -60)
+
+    convert([event('a')], url='https://example.com/other.ics')
+
+    assert registry.session.execute(
+        registry.select(EventFingerprint.uid)).scalars().all() == ['a']
+    with pytest.raises(CursorExpired):
+        convert([event('a')], since=cursor)
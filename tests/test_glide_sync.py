@@ -0,0 +1,228 @@
+import glide_sync
+from glide_sync import _PagedDiff, diff_rows, sync_table_with_etag_handling, sync_tables
+
+HEADERS = {'Authorization': 'Bearer test-token'}
+
+
+def seed(glide, table, rows):
+    """Fill a mock table with rows, giving each a $rowID"""
+    glide.tables[table] = {
+        f'row-{index}': dict(row, **{'$rowID': f'row-{index}'})
+        for index, row in enumerate(rows)
+    }
+    glide.versions[table] = 1
+
+
+def rows_by_uid(glide, table):
+    return {row['uid']: row for row in glide.tables[table].values()}
+
+
+def requests_of(glide, method):
+    """Requests of a method served by the mock, by status code"""
+    return {
+        int(key.split()[1]): count
+        for key, count in glide.stats().items() if key.split()[0] == method
+    }
+
+
+def test_diff_rows_splits_added_updated_and_unchanged():
+    current = [
+        {'$rowID': 'a', 'uid': '1', 'title': 'Same'},
+        {'$rowID': 'b', 'uid': '2', 'title': 'Old', 'note': 'kept'},
+        {'$rowID': 'c', 'uid': '3', 'title': 'Not in feed'},
+    ]
+    diff = diff_rows(current, [
+        {'uid': '1', 'title': 'Same'},
+        {'uid': '2', 'title': 'New'},
+        {'uid': '4', 'title': 'Added'},
+    ])
+
+    assert diff['added'] == [{'uid': '4', 'title': 'Added'}]
+    assert diff['updated'] == [(current[1], {'title': 'New'})]
+    assert diff['unchanged'] == 1
+    assert diff['row_count'] == 4
+    final = {row['uid']: row for row in diff['final_rows']}
+    assert final['2'] == {'$rowID': 'b', 'uid': '2', 'title': 'New', 'note': 'kept'}
+    assert final['3'] == current[2]
+
+
+def test_diff_rows_merges_rows_sharing_a_uid():
+    diff = diff_rows([], [{'uid': '1', 'title': 'A'}, {'uid': '1', 'place': 'B'}])
+
+    assert diff['added'] == [{'uid': '1', 'title': 'A', 'place': 'B'}]
+
+
+def test_paged_diff_compares_large_tables_page_by_page(monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_SYNC_MAX_ROWS_IN_MEMORY', 2)
+    current = [{'$rowID': str(i), 'uid': str(i), 'title': 'Old'} for i in range(5)]
+    rows_to_update = [{'uid': '1', 'title': 'New'}, {'uid': '3', 'title': 'Old'},
+                      {'uid': '9', 'title': 'Added'}]
+
+    table = _PagedDiff(rows_to_update)
+    for start in range(0, len(current), 2):
+        table.add_page(current[start:start + 2])
+    paged = table.result()
+    expected = diff_rows(current, rows_to_update)
+
+    assert paged['final_rows'] is None
+    for key in ('added', 'updated', 'unchanged', 'row_count'):
+        assert paged[key] == expected[key]
+    merged = list(table.merge(current))
+    assert merged[1] == {'$rowID': '1', 'uid': '1', 'title': 'New'}
+    assert len(merged) == 5
+
+
+def test_sync_writes_only_the_changed_rows(glide):
+    seed(glide, 'events', [{'uid': '1', 'title': 'Same'}, {'uid': '2', 'title': 'Old'}])
+
+    success, message, row_count, counts = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS,
+        [{'uid': '1', 'title': 'Same'}, {'uid': '2', 'title': 'New'},
+         {'uid': '3', 'title': 'Added'}])
+
+    assert success, message
+    assert row_count == 3
+    assert (counts['added'], counts['updated'], counts['unchanged']) == (1, 1, 1)
+    assert counts['progress'] == {'batches_written': 2, 'rows_written': 2}
+    assert requests_of(glide, 'POST') == {200: 1}
+    assert requests_of(glide, 'PATCH') == {200: 1}
+    assert requests_of(glide, 'PUT') == {}
+    rows = rows_by_uid(glide, 'events')
+    assert rows['2']['title'] == 'New'
+    assert rows['3']['title'] == 'Added'
+
+
+def test_sync_without_changes_writes_nothing(glide):
+    seed(glide, 'events', [{'uid': '1', 'title': 'Same'}])
+
+    success, message, row_count, counts = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS, [{'uid': '1', 'title': 'Same'}])
+
+    assert success
+    assert message == 'No changes to sync for 1 rows'
+    assert counts['unchanged'] == 1
+    assert set(glide.stats()) == {'GET 200'}
+
+
+def test_many_changes_write_the_full_table(glide, monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_MAX_ROW_WRITES', 1)
+    seed(glide, 'events', [{'uid': '1', 'title': 'Old'}, {'uid': '2', 'title': 'Old'}])
+
+    success, _, row_count, _ = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS,
+        [{'uid': '1', 'title': 'New'}, {'uid': '2', 'title': 'New'}])
+
+    assert success
+    assert row_count == 2
+    assert requests_of(glide, 'PUT') == {200: 1}
+    assert requests_of(glide, 'PATCH') == {}
+    rows = rows_by_uid(glide, 'events')
+    # Rows keep their $rowID through a full write
+    assert rows['1'] == {'$rowID': 'row-0', 'uid': '1', 'title': 'New'}
+
+
+def test_full_table_write_is_uploaded_to_a_stash_in_batches(glide, monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_MAX_ROW_WRITES', 0)
+    monkeypatch.setattr(glide_sync, 'GLIDE_WRITE_BATCH_ROWS', 2)
+    rows = [{'uid': str(i), 'title': f'Event {i}'} for i in range(5)]
+
+    success, _, row_count, counts = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS, rows)
+
+    assert success
+    assert row_count == 5
+    # Three stash batches, then the table write committing the stash
+    assert requests_of(glide, 'PUT') == {200: 4}
+    assert counts['progress'] == {'batches_written': 3, 'rows_written': 5}
+    assert glide.stashes == {}
+    assert sorted(rows_by_uid(glide, 'events')) == ['0', '1', '2', '3', '4']
+
+
+def test_conflicting_write_reads_the_table_again(glide):
+    seed(glide, 'events', [{'uid': '1', 'title': 'Old'}])
+    glide.fail_next('PATCH', 412)
+
+    success, _, _, counts = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS, [{'uid': '1', 'title': 'New'}])
+
+    assert success
+    assert counts['updated'] == 1
+    assert requests_of(glide, 'GET') == {200: 2}
+    assert requests_of(glide, 'PATCH') == {412: 1, 200: 1}
+    assert rows_by_uid(glide, 'events')['1']['title'] == 'New'
+
+
+def test_unavailable_write_is_sent_again_in_one_layer(glide, monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_MAX_ROW_WRITES', 0)
+    glide.fail_next('PUT', 503, times=glide_sync.GLIDE_WRITE_ATTEMPTS - 1)
+
+    success, message, _, _ = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS, [{'uid': '1', 'title': 'A'}])
+
+    assert success, message
+    assert requests_of(glide, 'PUT') == {503: glide_sync.GLIDE_WRITE_ATTEMPTS - 1, 200: 1}
+
+
+def test_write_fails_after_the_last_attempt(glide, monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_MAX_ROW_WRITES', 0)
+    glide.fail_next('PUT', 503, times=glide_sync.GLIDE_WRITE_ATTEMPTS)
+
+    success, message, _, _ = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS, [{'uid': '1', 'title': 'A'}])
+
+    assert not success
+    assert 'Error communicating with Glide API' in message
+    assert requests_of(glide, 'PUT') == {503: glide_sync.GLIDE_WRITE_ATTEMPTS}
+    assert 'events' not in glide.tables
+
+
+def test_next_sync_starts_from_the_snapshot(glide):
+    api_url = f'{glide.url}/events'
+    seed(glide, 'events', [{'uid': '1', 'title': 'Old'}])
+    assert sync_table_with_etag_handling(api_url, HEADERS,
+                                         [{'uid': '1', 'title': 'New'}])[0]
+
+    success, _, _, counts = sync_table_with_etag_handling(
+        api_url, HEADERS, [{'uid': '1', 'title': 'Newer'}])
+
+    assert success
+    assert counts['updated'] == 1
+    assert requests_of(glide, 'GET') == {200: 1}
+    assert rows_by_uid(glide, 'events')['1']['title'] == 'Newer'
+
+
+def test_large_paged_table_is_read_again_for_a_full_write(glide, monkeypatch):
+    monkeypatch.setattr(glide_sync, 'GLIDE_SYNC_MAX_ROWS_IN_MEMORY', 2)
+    monkeypatch.setattr(glide_sync, 'GLIDE_MAX_ROW_WRITES', 0)
+    glide.page_size = 2
+    seed(glide, 'events', [{'uid': str(i), 'title': 'Old'} for i in range(5)])
+
+    success, _, row_count, counts = sync_table_with_etag_handling(
+        f'{glide.url}/events', HEADERS,
+        [{'uid': '4', 'title': 'New'}, {'uid': '5', 'title': 'Added'}])
+
+    assert success
+    assert row_count == 6
+    assert (counts['added'], counts['updated'], counts['unchanged']) == (1, 1, 0)
+    # Three pages compared, then read again to write the merged rows
+    assert requests_of(glide, 'GET') == {200: 6}
+    rows = rows_by_uid(glide, 'events')
+    assert len(rows) == 6
+    assert rows['0']['title'] == 'Old'
+    assert rows['4']['title'] == 'New'
+
+
+def test_sync_tables_syncs_each_table(glide):
+    seed(glide, 'trips', [{'uid': 't', 'title': 'Trip'}])
+
+    results = sync_tables(HEADERS, {
+        f'{glide.url}/trips': [{'uid': 't', 'title': 'Trip'}],
+        f'{glide.url}/events': [{'uid': 'e', 'title': 'Event'}],
+    }, deadline=10)
+
+    assert results[f'{glide.url}/trips'][:3] == (True, 'No changes to sync for 1 rows', 1)
+    success, _, row_count, counts = results[f'{glide.url}/events']
+    assert success
+    assert row_count == 1
+    assert counts['added'] == 1
+    assert rows_by_uid(glide, 'events')['e']['title'] == 'Event'
@@ -0,0 +1,135 @@
+import pytest
+from feed_generator import generate_feed
+from ical_parser import parse_ical_content, parse_ical_lines, parse_window
+
+
+def calendar(*events):
+    """Build a feed from VEVENT bodies given as lists of content lines"""
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Tests//EN']
+    for event in events:
+        lines += ['BEGIN:VEVENT', *event, 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def window(start=None, end=None):
+    result = parse_window(start, end)
+    assert result['valid'], result
+    return result['window']
+
+
+def parse_both(content, window=None, expand=False):
+    """Parse a feed whole and line by line, checking both give the same data"""
+    whole = parse_ical_content(content, window, expand)
+    streamed = parse_ical_lines(iter(content.splitlines()), window, expand)
+    assert whole['success'], whole
+    assert streamed == whole
+    return whole['data']
+
+
+def event_uids(data):
+    """UIDs of the events and their subevents"""
+    uids = set()
+    for event in data['events']:
+        uids.add(event['uid'])
+        uids.update(subevent['uid'] for subevent in event.get('subevents', []))
+    return uids
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_line_parser_matches_whole_parser_on_generated_feeds(tmp_path, seed):
+    path = tmp_path / 'feed.ics'
+    generate_feed(str(path), trips=20, seed=seed)
+    content = path.read_bytes()
+
+    data = parse_both(content)
+
+    assert data['event_count'] > 0
+    assert data['total_events'] >= data['event_count']
+
+
+def test_line_parser_matches_whole_parser_within_a_window(tmp_path):
+    path = tmp_path / 'feed.ics'
+    generate_feed(str(path), trips=20, recurring_fraction=0.5)
+    content = path.read_bytes()
+    starts = sorted(event['start']['datetime'] for event in parse_both(content)['events'])
+    middle = starts[len(starts) // 2][:10]
+
+    data = parse_both(content, window(starts[0][:10], middle))
+    expanded = parse_both(content, window(starts[0][:10], middle), expand=True)
+
+    assert 0 < data['event_count'] < len(starts)
+    assert expanded['event_count'] > 0
+
+
+def test_folded_lines_are_unfolded():
+    content = calendar([
+        'UID:folded',
+        'DTSTART:20250301T090000Z',
+        'SUMMARY:A summary folded',
+        '  over two lines',
+    ])
+
+    data = parse_both(content)
+
+    assert data['events'][0]['summary'] == 'A summary folded over two lines'
+
+
+def test_event_ending_at_the_window_start_is_left_out():
+    content = calendar(
+        ['UID:before', 'DTSTART:20250301T090000Z', 'DTEND:20250301T100000Z'],
+        ['UID:overlapping', 'DTSTART:20250301T093000Z', 'DTEND:20250301T103000Z'],
+    )
+
+    data = parse_both(content, window('2025-03-01T10:00:00Z'))
+
+    assert event_uids(data) == {'overlapping'}
+
+
+def test_event_starting_at_the_window_end_is_left_out():
+    content = calendar(
+        ['UID:after', 'DTSTART:20250301T100000Z', 'DTEND:20250301T110000Z'],
+        ['UID:inside', 'DTSTART:20250301T080000Z', 'DTEND:20250301T083000Z'],
+    )
+
+    data = parse_both(content, window(end='2025-03-01T10:00:00Z'))
+
+    assert event_uids(data) == {'inside'}
+
+
+def test_instant_event_at_the_window_start_is_kept():
+    content = calendar(['UID:instant', 'DTSTART:20250301T100000Z'])
+
+    data = parse_both(content, window('2025-03-01T10:00:00Z'))
+
+    assert event_uids(data) == {'instant'}
+
+
+def test_all_day_events_last_until_midnight():
+    content = calendar(
+        ['UID:day-before', 'DTSTART;VALUE=DATE:20250228'],
+        ['UID:first-day', 'DTSTART;VALUE=DATE:20250301'],
+        ['UID:two-days', 'DTSTART;VALUE=DATE:20250227', 'DTEND;VALUE=DATE:20250302'],
+    )
+
+    data = parse_both(content, window('2025-03-01'))
+
+    assert event_uids(data) == {'first-day', 'two-days'}
+
+
+def test_floating_times_are_compared_as_utc():
+    content = calendar(
+        ['UID:floating', 'DTSTART:20250301T090000', 'DTEND:20250301T100000'],
+    )
+
+    assert event_uids(parse_both(content, window('2025-03-01T09:30:00Z'))) == {'floating'}
+    assert event_uids(parse_both(content, window('2025-03-01T10:00:00Z'))) == set()
+    # An offset in the window is applied to the bound, not to the event
+    assert event_uids(parse_both(content, window('2025-03-01T10:30:00+01:00'))) == {
+        'floating'}
+
+
+def test_window_bounds_are_validated():
+    assert parse_window('2025-03-02', '2025-03-01')['valid'] is False
+    assert parse_window('tomorrow')['valid'] is False
+    assert parse_window() == {'valid': True, 'window': None}
@@ -0,0 +1,136 @@
+from ical_parser import parse_ical_content, parse_window
+
+
+def calendar(*events):
+    """Build a feed from VEVENT bodies given as lists of content lines"""
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Tests//EN']
+    for event in events:
+        lines += ['BEGIN:VEVENT', *event, 'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return ('\r\n'.join(lines) + '\r\n').encode('utf-8')
+
+
+def occurrences(content, start, end):
+    """Expanded events of a feed within a window, by UID"""
+    window = parse_window(start, end)['window']
+    result = parse_ical_content(content, window, expand=True)
+    assert result['success'], result
+    events = {}
+    for event in result['data']['events']:
+        events[event['uid']] = event
+        events.update((subevent['uid'], subevent) for subevent in event.get('subevents', []))
+    return events
+
+
+def test_exdate_removes_an_occurrence():
+    content = calendar([
+        'UID:practice',
+        'DTSTART:20250303T170000Z',
+        'DTEND:20250303T180000Z',
+        'RRULE:FREQ=DAILY;COUNT=4',
+        'EXDATE:20250304T170000Z',
+    ])
+
+    events = occurrences(content, '2025-03-01', '2025-04-01')
+
+    assert sorted(events) == ['practice_20250303T170000Z', 'practice_20250305T170000Z',
+                              'practice_20250306T170000Z']
+
+
+def test_rdate_adds_an_occurrence():
+    content = calendar([
+        'UID:game',
+        'DTSTART;VALUE=DATE:20250301',
+        'RRULE:FREQ=WEEKLY;COUNT=2',
+        'RDATE;VALUE=DATE:20250320',
+    ])
+
+    events = occurrences(content, '2025-03-01', '2025-04-01')
+
+    assert sorted(events) == ['game_20250301', 'game_20250308', 'game_20250320']
+    assert events['game_20250320']['start']['datetime'][:10] == '2025-03-20'
+
+
+def test_rdate_without_a_rule_keeps_the_first_occurrence():
+    content = calendar([
+        'UID:meet',
+        'DTSTART:20250301T100000',
+        'RDATE:20250310T100000',
+    ])
+
+    assert sorted(occurrences(content, '2025-03-01', '2025-04-01')) == [
+        'meet_20250301T100000', 'meet_20250310T100000']
+
+
+def test_recurrence_id_override_replaces_an_occurrence():
+    content = calendar(
+        ['UID:practice', 'SUMMARY:Practice',
+         'DTSTART:20250303T170000Z', 'DTEND:20250303T180000Z',
+         'RRULE:FREQ=DAILY;COUNT=3'],
+        ['UID:practice', 'SUMMARY:Practice moved', 'RECURRENCE-ID:20250304T170000Z',
+         'DTSTART:20250304T190000Z', 'DTEND:20250304T200000Z'],
+    )
+
+    events = occurrences(content, '2025-03-01', '2025-04-01')
+
+    assert sorted(events) == ['practice_20250303T170000Z', 'practice_20250304T170000Z',
+                              'practice_20250305T170000Z']
+    moved = events['practice_20250304T170000Z']
+    assert moved['summary'] == 'Practice moved'
+    assert moved['start']['datetime'].startswith('2025-03-04T19:00:00')
+    assert moved['series_uid'] == 'practice'
+    assert events['practice_20250305T170000Z']['summary'] == 'Practice'
+
+
+def test_count_with_a_timezone_follows_daylight_saving_time():
+    content = calendar([
+        'UID:training',
+        'DTSTART;TZID=Europe/Berlin:20250328T180000',
+        'DTEND;TZID=Europe/Berlin:20250328T190000',
+        'RRULE:FREQ=DAILY;COUNT=3',
+    ])
+
+    events = occurrences(content, '2025-03-01', '2025-04-01')
+
+    # 18:00 in Berlin is 17:00 UTC before the change on 30 March, 16:00 after
+    assert sorted(events) == ['training_20250328T170000Z', 'training_20250329T170000Z',
+                              'training_20250330T160000Z']
+
+
+def test_until_with_a_timezone_ends_the_series():
+    content = calendar([
+        'UID:training',
+        'DTSTART;TZID=Europe/Berlin:20251024T180000',
+        'RRULE:FREQ=DAILY;UNTIL=20251026T163000Z',
+    ])
+
+    events = occurrences(content, '2025-10-01', '2025-11-01')
+
+    # Summer time ends on 26 October, moving that occurrence to 17:00 UTC,
+    # after UNTIL
+    assert sorted(events) == ['training_20251024T160000Z', 'training_20251025T160000Z']
+
+
+def test_until_given_as_a_date_includes_its_last_day():
+    content = calendar([
+        'UID:training',
+        'DTSTART;TZID=Europe/Berlin:20251024T180000',
+        'RRULE:FREQ=DAILY;UNTIL=20251025',
+    ])
+
+    events = occurrences(content, '2025-10-01', '2025-11-01')
+
+    assert sorted(events) == ['training_20251024T160000Z', 'training_20251025T160000Z']
+
+
+def test_expansion_is_limited_to_the_window():
+    content = calendar([
+        'UID:practice',
+        'DTSTART:20250303T170000Z',
+        'DTEND:20250303T180000Z',
+        'RRULE:FREQ=DAILY',
+    ])
+
+    events = occurrences(content, '2025-03-05', '2025-03-07')
+
+    assert sorted(events) == ['practice_20250305T170000Z', 'practice_20250306T170000Z']